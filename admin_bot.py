@@ -3,13 +3,56 @@ from telegram import Bot, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
 from loguru import logger
 import json
 import os
+import re
 import asyncio
-from config import MAIN_BOT_USERNAME, ADMIN_BOT_USERNAME
+import io
+from datetime import datetime, timedelta
+from config import MAIN_BOT_USERNAME, ADMIN_BOT_USERNAME, POINTS_HISTORY_RETENTION_CHOICES, BANNED_WORDS_MAX_FILE_SIZE
+from config import ANTIFLOOD_LIMIT_CHOICES, ANTIFLOOD_WINDOW_CHOICES, ANTIFLOOD_MUTE_CHOICES
+from config import ANTISPAM_WINDOW, ANTISPAM_MIN_USERS, ANTISPAM_LINK_WINDOW, ANTISPAM_LINK_LIMIT
+from config import AUTO_REPLY_DEFAULT_COOLDOWN, SCHEDULE_MIN_INTERVAL, POINTS_LOTTERY_DEFAULT_MAX_TICKETS
+from config import CHAIN_KEYWORD, CHAIN_POLL_INTERVAL, LOTTERY_POLL_INTERVAL
 import telegram
 # 导入数据库操作模块
-from db_operations import get_group_config_db, update_group_config_db, get_user_points, add_user_points, deduct_user_points
+from db_operations import get_group_config_db, update_group_config_db, get_user_points, group_config_cache
+from db_operations import add_user_points as db_add_user_points
+from db_operations import deduct_user_points as db_deduct_user_points
 from db_operations import get_points_ranking as db_get_points_ranking
 from db_operations import clear_group_points
+from db_operations import get_banned_words, add_banned_words, remove_banned_words
+from db_operations import get_auto_replies, add_auto_reply, delete_auto_replies
+from db_operations import get_scheduled_messages, add_scheduled_message, delete_scheduled_messages
+from db_operations import create_lottery, end_lottery_now, get_lottery_stats, get_group_lotteries
+from db_operations import create_points_lottery, get_group_points_lotteries
+from db_operations import create_chain, get_active_chain, get_chain_entries, close_chain
+from db_operations import get_group_points_totals, get_group_daily_stats, get_group_hourly_stats
+from db_async import run_db
+from autoreply import auto_reply_loader, check_regex
+from banned_words import banned_words_loader
+from chain import chain_manager, format_entry
+from leaderboard import points_leaderboard
+from stats import merged_active_users
+from scheduler import scheduler, CronSchedule, parse_interval
+
+# 违禁词列表一次最多显示的数量，避免超出消息长度限制
+BANNED_WORDS_LIST_LIMIT = 100
+
+# 自动回复规则类型的显示名称
+AUTO_REPLY_TYPE_NAMES = {
+    'exact': '完全匹配',
+    'prefix': '前缀匹配',
+    'contains': '包含关键词',
+    'regex': '正则表达式',
+}
+
+# 自动回复规则列表一次最多显示的数量
+AUTO_REPLY_LIST_LIMIT = 50
+
+# 定时消息列表一次最多显示的数量
+SCHEDULE_LIST_LIMIT = 30
+
+# 抽奖状态的显示名称
+LOTTERY_STATUS_NAMES = {'pending': '未开奖', 'drawn': '已开奖', 'canceled': '已取消'}
 
 # 存储群组配置的文件 (保留兼容性)
 CONFIG_FILE = 'group_configs.json'
@@ -27,9 +70,13 @@ def save_configs(configs):
         json.dump(configs, f, ensure_ascii=False, indent=2)
 
 # 获取群组配置 (使用数据库)
-def get_group_config(group_id):
-    # 从数据库获取群组配置
-    config = get_group_config_db(group_id)
+async def get_group_config(group_id):
+    # 命中进程内缓存时直接在事件循环中读取，未命中时再到线程池中查询数据库
+    config = group_config_cache.get(str(group_id))
+    if config is not None:
+        config = dict(config)
+    else:
+        config = await run_db(get_group_config_db, group_id)
     
     # 如果数据库中没有配置，则使用默认值
     if not config:
@@ -47,15 +94,20 @@ def get_group_config(group_id):
             'invite_points': 1,
             'daily_invite_limit': 0,
             'points_alias': '积分',
-            'ranking_alias': '积分排行'
+            'ranking_alias': '积分排行',
+            'antiflood_enabled': False,
+            'antiflood_limit': 5,
+            'antiflood_window': 10,
+            'antiflood_action': 'mute',
+            'antiflood_mute_seconds': 300
         }
     
     return config
 
 # 更新群组配置 (使用数据库)
-def update_group_config(group_id, key, value):
+async def update_group_config(group_id, key, value):
     # 更新数据库中的群组配置
-    return update_group_config_db(group_id, key, value)
+    return await run_db(update_group_config_db, group_id, key, value)
 
 async def start(update, context):
     user_id = update.effective_user.id
@@ -69,7 +121,7 @@ async def start(update, context):
             logger.info(f"收到群组ID参数: {group_id}")
             
             # 获取群组配置
-            config = get_group_config(group_id)
+            config = await get_group_config(group_id)
             group_name = config.get('group_name', f'群组 {group_id}')
             
             # 在消息中显示群组名称
@@ -127,19 +179,25 @@ async def start(update, context):
             '请将主机器人添加到您的群组，然后通过主机器人进入管理菜单。'
         )
 
+# 回调数据格式为 动作 或 动作_群组ID，动作本身可以包含下划线
+CALLBACK_DATA_PATTERN = re.compile(r'^(.*?)(?:_(-?\d+))?$')
+
 async def button_callback(update, context):
     query = update.callback_query
     await query.answer()
     
-    # 解析回调数据
-    data = query.data.split('_')
-    action = data[0]
+    # 解析回调数据：末尾的数字（群组ID可能为负数）是群组ID，前面的部分是动作
+    match = CALLBACK_DATA_PATTERN.match(query.data)
+    action, group_id = match.group(1), match.group(2)
+    
+    # 积分子页面的“返回积分管理”按钮回到积分菜单
+    if action == 'back_to_points':
+        action = 'points'
     
     # 处理select_group回调
     if action == 'select_group':
-        group_id = data[1] if len(data) > 1 else None
         if group_id:
-            config = get_group_config(group_id)
+            config = await get_group_config(group_id)
             
             # 创建管理菜单，与截图中的布局完全一致，2x8网格布局
             keyboard = [
@@ -180,9 +238,6 @@ async def button_callback(update, context):
             )
         return
     
-    # 获取group_id，如果没有则使用默认值
-    group_id = data[1] if len(data) > 1 else None
-    
     # 处理没有group_id的回调
     if action == 'lottery' and not group_id:
         # 抽奖功能
@@ -202,16 +257,15 @@ async def button_callback(update, context):
     # 处理有group_id的抽奖功能
     elif action == 'lottery' and group_id:
         # 获取群组名称
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
-        # 获取该群组的抽奖次数
-        lottery_count = config.get('lottery_count', 0)
-        
         # 获取已开奖、未开奖和取消的数量
-        opened_count = config.get('opened_lottery', 0)
-        pending_count = config.get('pending_lottery', 0)
-        canceled_count = config.get('canceled_lottery', 0)
+        lottery_stats = await run_db(get_lottery_stats, group_id)
+        opened_count = lottery_stats.get('drawn', 0)
+        pending_count = lottery_stats.get('pending', 0)
+        canceled_count = lottery_stats.get('canceled', 0)
+        lottery_count = opened_count + pending_count + canceled_count
         
         # 构建抽奖信息文本
         lottery_text = f"🎁 [ {group_name} ]抽奖\n\n创建的抽奖次数:{lottery_count}\n\n已开奖:{opened_count}    未开奖:{pending_count}    取消:{canceled_count}"
@@ -314,29 +368,38 @@ async def button_callback(update, context):
             await show_pending_lotteries(update, context, group_id)
         return
     
+    # 处理提前开奖的回调，回调数据为 draw_lottery_<抽奖ID>_<群组ID>
+    elif action.startswith('draw_lottery_') and group_id:
+        lottery_id = int(action[len('draw_lottery_'):])
+        if await run_db(end_lottery_now, group_id, lottery_id):
+            text = f"✅ 已提前开奖，约 {LOTTERY_POLL_INTERVAL} 秒后将在群组中公布结果。"
+        else:
+            text = "该抽奖已开奖或不存在。"
+        keyboard = [[InlineKeyboardButton("⬅️ 返回", callback_data=f'lottery_{group_id}')]]
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
     # 处理抽奖记录的回调
     elif action == 'lottery_records':
         # 获取群组名称
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取抽奖记录
-        lottery_records = config.get('lottery_records', [])
+        lottery_records = await run_db(get_group_lotteries, group_id)
         
         if not lottery_records:
             text = f"[ {group_name} ] 还没有创建过抽奖。"
         else:
-            text = f"[ {group_name} ] 的抽奖记录：\n\n"
+            text = f"[ {group_name} ] 最近的抽奖记录：\n\n"
             for i, record in enumerate(lottery_records, 1):
-                status = "已开奖" if record.get('is_opened', False) else "未开奖"
-                if record.get('is_canceled', False):
-                    status = "已取消"
-                
-                text += f"{i}. {record.get('title', '无标题')} - {status}\n"
-                text += f"   创建时间: {record.get('create_time', '未知')}\n"
-                if status == "已开奖":
-                    text += f"   开奖时间: {record.get('open_time', '未知')}\n"
-                    text += f"   中奖人数: {len(record.get('winners', []))}\n"
+                status = LOTTERY_STATUS_NAMES.get(record['status'], record['status'])
+                text += f"{i}. {record['title']} - {status}\n"
+                text += f"   创建时间: {record['created_at']:%Y-%m-%d %H:%M}\n"
+                text += f"   参与人数: {record['participant_count']}\n"
+                if record['status'] == 'drawn':
+                    text += f"   开奖时间: {record['drawn_at']:%Y-%m-%d %H:%M}\n"
+                    text += f"   中奖人数: {record['winner_count']}\n"
                 text += "\n"
         
         # 创建返回按钮
@@ -385,7 +448,7 @@ async def button_callback(update, context):
     
     elif action == 'points' and group_id:
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取积分系统状态
@@ -459,6 +522,9 @@ async def button_callback(update, context):
                 InlineKeyboardButton("➖ 扣除积分", callback_data=f'points_deduct_{group_id}'),
                 InlineKeyboardButton("🎁 积分抽奖", callback_data=f'points_lottery_{group_id}')
             ],
+            [
+                InlineKeyboardButton("⚙️ 积分设置", callback_data=f'points_settings_{group_id}')
+            ],
             [
                 InlineKeyboardButton("🗑️ 清空数据", callback_data=f'points_clear_{group_id}'),
                 InlineKeyboardButton("⬅️ 返回", callback_data=f'back_{group_id}')
@@ -480,7 +546,7 @@ async def button_callback(update, context):
     # 处理积分状态切换
     elif action == 'points_enable':
         # 启用积分系统
-        update_group_config(group_id, 'points_enabled', True)
+        await update_group_config(group_id, 'points_enabled', True)
         
         # 重新显示积分菜单
         await query.answer("积分系统已启用")
@@ -490,7 +556,7 @@ async def button_callback(update, context):
     
     elif action == 'points_disable':
         # 禁用积分系统
-        update_group_config(group_id, 'points_enabled', False)
+        await update_group_config(group_id, 'points_enabled', False)
         
         # 重新显示积分菜单
         await query.answer("积分系统已关闭")
@@ -501,7 +567,7 @@ async def button_callback(update, context):
     # 处理积分规则设置
     elif action == 'points_checkin_rules':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取签到规则
@@ -528,7 +594,7 @@ async def button_callback(update, context):
     
     elif action == 'points_message_rules':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取发言规则
@@ -570,7 +636,7 @@ async def button_callback(update, context):
     
     elif action == 'points_invite_rules':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取邀请规则
@@ -606,7 +672,7 @@ async def button_callback(update, context):
     
     elif action == 'points_alias':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取积分别名
@@ -635,7 +701,7 @@ async def button_callback(update, context):
     
     elif action == 'points_ranking_alias':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取排行别名
@@ -664,7 +730,7 @@ async def button_callback(update, context):
     
     elif action == 'points_add':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 设置用户状态为等待输入用户ID
@@ -686,7 +752,7 @@ async def button_callback(update, context):
     
     elif action == 'points_deduct':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 设置用户状态为等待输入用户ID
@@ -708,7 +774,7 @@ async def button_callback(update, context):
     
     elif action == 'points_lottery':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 创建按钮
@@ -733,9 +799,292 @@ async def button_callback(update, context):
         )
         return
     
+    elif action == 'create_points_lottery' and group_id:
+        # 等待管理员在私聊中发送积分抽奖的设置
+        context.user_data['creating_points_lottery'] = {'group_id': group_id}
+        keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_points_lottery_{group_id}')]]
+        await query.message.edit_text(
+            "创建积分抽奖\n\n"
+            "请按以下格式发送，每项一行：\n"
+            "标题\n"
+            "每张抽奖券的积分\n"
+            "奖品数量（1-100）\n"
+            "开奖时间（YYYY-MM-DD HH:MM）\n"
+            f"每人最多购买张数（可选，默认 {POINTS_LOTTERY_DEFAULT_MAX_TICKETS}）",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
+    elif action == 'cancel_points_lottery' and group_id:
+        context.user_data.pop('creating_points_lottery', None)
+        keyboard = [[InlineKeyboardButton("⬅️ 返回积分抽奖", callback_data=f'points_lottery_{group_id}')]]
+        await query.message.edit_text("已取消创建积分抽奖。", reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'view_points_lottery' and group_id:
+        config = await get_group_config(group_id)
+        group_name = config.get('group_name', f'群组 {group_id}')
+        lotteries = await run_db(get_group_points_lotteries, group_id)
+        if lotteries:
+            text = f"[ {group_name} ] 最近的积分抽奖：\n\n"
+            for lottery in lotteries:
+                text += (
+                    f"#{lottery['id']} {lottery['title']} - {LOTTERY_STATUS_NAMES.get(lottery['status'], lottery['status'])}\n"
+                    f"   开奖时间: {lottery['end_time']:%Y-%m-%d %H:%M}\n"
+                    f"   参与人数: {lottery['participant_count']}，已售抽奖券: {lottery['tickets_sold']} 张"
+                    f"（{lottery['tickets_sold'] * lottery['ticket_price']} 积分）\n"
+                )
+                if lottery['status'] == 'drawn':
+                    text += f"   中奖人数: {lottery['winner_count']}\n"
+                text += "\n"
+        else:
+            text = f"[ {group_name} ] 还没有创建过积分抽奖。"
+        keyboard = [[InlineKeyboardButton("⬅️ 返回", callback_data=f'points_lottery_{group_id}')]]
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'points_settings' and group_id:
+        await show_points_settings(update, context, group_id)
+        return
+    
+    elif action.startswith('set_history_retention_') and group_id:
+        # 设置积分明细保留天数
+        days = int(action.rsplit('_', 1)[1])
+        if days in POINTS_HISTORY_RETENTION_CHOICES:
+            await update_group_config(group_id, 'history_retention_days', days)
+        await show_points_settings(update, context, group_id)
+        return
+    
+    elif action == 'schedule' and group_id:
+        await show_schedule_menu(update, context, group_id)
+        return
+    
+    elif action in ('add_schedule_interval', 'add_schedule_cron') and group_id:
+        # 等待管理员在私聊中发送发送时间和消息内容
+        schedule_type = action[len('add_schedule_'):]
+        context.user_data['editing_schedule'] = {'group_id': group_id, 'mode': 'add', 'schedule_type': schedule_type}
+        if schedule_type == 'interval':
+            prompt = (
+                "添加按间隔发送的定时消息\n\n"
+                "第一行为发送间隔，如 30m、2h、1d（分钟、小时、天），其余各行为消息内容。"
+            )
+        else:
+            prompt = (
+                "添加按时间表发送的定时消息\n\n"
+                "第一行为 cron 表达式（分 时 日 月 星期），如 0 9 * * 1-5 表示工作日 9:00，其余各行为消息内容。"
+            )
+        keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_schedule_{group_id}')]]
+        await query.message.edit_text(prompt, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'delete_schedule' and group_id:
+        context.user_data['editing_schedule'] = {'group_id': group_id, 'mode': 'delete'}
+        keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_schedule_{group_id}')]]
+        await query.message.edit_text(
+            "请发送要删除的定时消息编号，多个编号用空格或逗号分隔：",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
+    elif action == 'list_schedules' and group_id:
+        schedules = await run_db(get_scheduled_messages, group_id) or []
+        if schedules:
+            lines = []
+            for item in schedules[:SCHEDULE_LIST_LIMIT]:
+                if item['schedule_type'] == 'interval':
+                    rule = f"每 {item['interval_seconds'] // 60} 分钟"
+                else:
+                    rule = f"cron {item['cron']}"
+                status = f"下次 {item['next_run_at']:%m-%d %H:%M}" if item['enabled'] else "已停用"
+                lines.append(f"#{item['id']} {rule}，{status}：{item['text'][:30]}")
+            text = f"定时消息（共 {len(schedules)} 条）：\n\n" + "\n".join(lines)
+            if len(schedules) > SCHEDULE_LIST_LIMIT:
+                text += f"\n\n……仅显示前 {SCHEDULE_LIST_LIMIT} 条"
+        else:
+            text = "暂无定时消息。"
+        keyboard = [[InlineKeyboardButton("⬅️ 返回", callback_data=f'schedule_{group_id}')]]
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'cancel_schedule' and group_id:
+        context.user_data.pop('editing_schedule', None)
+        await show_schedule_menu(update, context, group_id)
+        return
+    
+    elif action == 'autoreply' and group_id:
+        await show_auto_reply_menu(update, context, group_id)
+        return
+    
+    elif action == 'chain' and group_id:
+        await show_chain_menu(update, context, group_id)
+        return
+    
+    elif action == 'stats' and group_id:
+        await show_stats(update, context, group_id)
+        return
+    
+    elif action == 'start_chain' and group_id:
+        # 等待管理员在私聊中发送接龙标题和说明
+        context.user_data['creating_chain'] = {'group_id': group_id}
+        keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_chain_{group_id}')]]
+        await query.message.edit_text(
+            "发起接龙\n\n请发送接龙标题，可从第二行开始填写说明。",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
+    elif action == 'cancel_chain' and group_id:
+        context.user_data.pop('creating_chain', None)
+        await show_chain_menu(update, context, group_id)
+        return
+    
+    elif action == 'end_chain' and group_id:
+        if await run_db(close_chain, group_id):
+            chain_manager.forget(int(group_id))
+            text = f"✅ 接龙已结束，群组中的接龙消息将在约 {CHAIN_POLL_INTERVAL * 2} 秒内更新。"
+        else:
+            text = "当前没有进行中的接龙。"
+        keyboard = [[InlineKeyboardButton("⬅️ 返回接龙设置", callback_data=f'chain_{group_id}')]]
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'export_chain' and group_id:
+        # 完整的接龙记录以文本文件发送，群组消息中只显示最近的记录
+        chain = await run_db(get_active_chain, group_id)
+        entries = await run_db(get_chain_entries, chain['id']) if chain else None
+        if not entries:
+            await query.message.reply_text("暂无接龙记录。")
+            return
+        lines = [chain['title'], '']
+        lines.extend(
+            format_entry(entry['seq'], entry['display_name'] or str(entry['user_id']), entry['content'] or '')
+            for entry in entries
+        )
+        await query.message.reply_document(
+            document=io.BytesIO('\n'.join(lines).encode('utf-8')),
+            filename=f"chain_{chain['id']}.txt",
+            caption=f"接龙「{chain['title']}」共 {len(entries)} 人参与"
+        )
+        return
+    
+    elif action.startswith('add_autoreply_') and group_id:
+        # 等待管理员在私聊中发送关键词和回复内容
+        match_type = action[len('add_autoreply_'):]
+        if match_type not in AUTO_REPLY_TYPE_NAMES:
+            return
+        context.user_data['editing_auto_reply'] = {'group_id': group_id, 'mode': 'add', 'match_type': match_type}
+        keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_autoreply_{group_id}')]]
+        await query.message.edit_text(
+            f"添加{AUTO_REPLY_TYPE_NAMES[match_type]}规则\n\n"
+            f"请发送规则：第一行为{'正则表达式' if match_type == 'regex' else '关键词'}，其余各行为回复内容。\n"
+            f"可在最后单独一行写“冷却: 秒数”设置冷却时间，默认 {AUTO_REPLY_DEFAULT_COOLDOWN} 秒。",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
+    elif action == 'delete_autoreply' and group_id:
+        context.user_data['editing_auto_reply'] = {'group_id': group_id, 'mode': 'delete'}
+        keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_autoreply_{group_id}')]]
+        await query.message.edit_text(
+            "请发送要删除的规则编号，多个编号用空格或逗号分隔：",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
+    elif action == 'list_autoreplies' and group_id:
+        rules = await run_db(get_auto_replies, group_id) or []
+        if rules:
+            lines = [
+                f"#{rule['id']} [{AUTO_REPLY_TYPE_NAMES.get(rule['match_type'], rule['match_type'])}] "
+                f"{rule['pattern']} → {rule['reply'][:30]}（冷却 {rule['cooldown']} 秒）"
+                for rule in rules[:AUTO_REPLY_LIST_LIMIT]
+            ]
+            text = f"自动回复规则（共 {len(rules)} 条）：\n\n" + "\n".join(lines)
+            if len(rules) > AUTO_REPLY_LIST_LIMIT:
+                text += f"\n\n……仅显示前 {AUTO_REPLY_LIST_LIMIT} 条"
+        else:
+            text = "暂无自动回复规则。"
+        keyboard = [[InlineKeyboardButton("⬅️ 返回", callback_data=f'autoreply_{group_id}')]]
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'cancel_autoreply' and group_id:
+        context.user_data.pop('editing_auto_reply', None)
+        await show_auto_reply_menu(update, context, group_id)
+        return
+    
+    elif action == 'antispam' and group_id:
+        await show_antispam_settings(update, context, group_id)
+        return
+    
+    elif action in ('antispam_enable', 'antispam_disable') and group_id:
+        await update_group_config(group_id, 'anti_spam', action == 'antispam_enable')
+        await show_antispam_settings(update, context, group_id)
+        return
+    
+    elif action == 'antiflood' and group_id:
+        await show_antiflood_settings(update, context, group_id)
+        return
+    
+    elif action in ('antiflood_enable', 'antiflood_disable') and group_id:
+        await update_group_config(group_id, 'antiflood_enabled', action == 'antiflood_enable')
+        await show_antiflood_settings(update, context, group_id)
+        return
+    
+    elif action.startswith('set_antiflood_') and group_id:
+        # 回调数据为 set_antiflood_<设置项>_<值>_<群组ID>
+        key, value = action[len('set_antiflood_'):].rsplit('_', 1)
+        choices = {
+            'limit': ANTIFLOOD_LIMIT_CHOICES,
+            'window': ANTIFLOOD_WINDOW_CHOICES,
+            'mute_seconds': ANTIFLOOD_MUTE_CHOICES,
+            'action': ('mute', 'delete'),
+        }.get(key, ())
+        if value.isdigit():
+            value = int(value)
+        if value in choices:
+            await update_group_config(group_id, f'antiflood_{key}', value)
+        await show_antiflood_settings(update, context, group_id)
+        return
+    
+    elif action == 'banned_words' and group_id:
+        await show_banned_words_menu(update, context, group_id)
+        return
+    
+    elif action in ('add_banned_word', 'remove_banned_word', 'import_banned_words') and group_id:
+        # 等待管理员在私聊中发送违禁词或上传文件
+        mode = 'remove' if action == 'remove_banned_word' else 'add'
+        context.user_data['editing_banned_words'] = {'group_id': group_id, 'mode': mode}
+        if action == 'import_banned_words':
+            prompt = "请上传 UTF-8 编码的 .txt 文件，每行一个违禁词："
+        elif mode == 'add':
+            prompt = "请发送要添加的违禁词，多个违禁词用换行或逗号分隔，也可以上传 .txt 文件："
+        else:
+            prompt = "请发送要删除的违禁词，多个违禁词用换行或逗号分隔，也可以上传 .txt 文件："
+        keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_banned_words_{group_id}')]]
+        await query.message.edit_text(prompt, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'list_banned_words' and group_id:
+        words = await run_db(get_banned_words, group_id) or []
+        if words:
+            text = f"违禁词列表（共 {len(words)} 个）：\n\n" + "\n".join(words[:BANNED_WORDS_LIST_LIMIT])
+            if len(words) > BANNED_WORDS_LIST_LIMIT:
+                text += f"\n\n……仅显示前 {BANNED_WORDS_LIST_LIMIT} 个"
+        else:
+            text = "暂无违禁词。"
+        keyboard = [[InlineKeyboardButton("⬅️ 返回", callback_data=f'banned_words_{group_id}')]]
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    elif action == 'cancel_banned_words' and group_id:
+        context.user_data.pop('editing_banned_words', None)
+        await show_banned_words_menu(update, context, group_id)
+        return
+    
     elif action == 'points_clear':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 创建确认按钮
@@ -760,11 +1109,11 @@ async def button_callback(update, context):
     
     elif action == 'confirm_points_clear':
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 清空积分数据
-        update_group_config(group_id, 'user_points', {})
+        await update_group_config(group_id, 'user_points', {})
         
         # 创建返回按钮
         keyboard = [[InlineKeyboardButton("⬅️ 返回", callback_data=f'points_{group_id}')]]
@@ -882,7 +1231,7 @@ async def button_callback(update, context):
     
     elif action == 'welcome':
         # 欢迎消息设置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         current_msg = config.get('welcome_msg', '欢迎新成员加入！')
         
         keyboard = [
@@ -924,7 +1273,7 @@ async def button_callback(update, context):
     elif action.startswith('set_lang_'):
         # 设置语言
         lang = action.split('_')[2]
-        update_group_config(group_id, 'language', lang)
+        await update_group_config(group_id, 'language', lang)
         
         # 返回主菜单
         await query.message.reply_text(f"语言已设置为: {lang}")
@@ -1013,35 +1362,27 @@ async def button_callback(update, context):
             return
         
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
-        # 创建抽奖记录
-        from datetime import datetime
-        
-        lottery_record = {
-            'title': lottery_data['title'],
-            'description': lottery_data.get('description', ''),
-            'prize_count': lottery_data['prize_count'],
-            'end_time': lottery_data['end_time'],
-            'create_time': datetime.now().strftime("%Y-%m-%d %H:%M"),
-            'is_opened': False,
-            'is_canceled': False,
-            'participants': [],
-            'winners': []
-        }
-        
-        # 更新群组配置
-        lottery_records = config.get('lottery_records', [])
-        lottery_records.append(lottery_record)
+        # 保存抽奖，由主机器人发布到群组并在开奖时间自动开奖
+        lottery_id = await run_db(
+            create_lottery,
+            group_id,
+            lottery_data['title'],
+            lottery_data.get('description', ''),
+            lottery_data['prize_count'],
+            datetime.strptime(lottery_data['end_time'], "%Y-%m-%d %H:%M"),
+            query.from_user.id
+        )
         
-        # 更新统计数据
-        lottery_count = config.get('lottery_count', 0) + 1
-        pending_count = config.get('pending_lottery', 0) + 1
+        # 创建返回按钮
+        keyboard = [[InlineKeyboardButton("返回抽奖菜单", callback_data=f'lottery_{group_id}')]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        update_group_config(group_id, 'lottery_records', lottery_records)
-        update_group_config(group_id, 'lottery_count', lottery_count)
-        update_group_config(group_id, 'pending_lottery', pending_count)
+        if lottery_id is None:
+            await query.message.edit_text("❌ 保存抽奖失败，请稍后重试。", reply_markup=reply_markup)
+            return
         
         # 清除用户状态
         context.user_data.pop('creating_lottery', None)
@@ -1050,61 +1391,14 @@ async def button_callback(update, context):
         success_text = (
             f"✅ 抽奖创建成功！\n\n"
             f"群组：{group_name}\n"
-            f"标题：{lottery_record['title']}\n"
-            f"奖品数量：{lottery_record['prize_count']}\n"
-            f"开奖时间：{lottery_record['end_time']}\n\n"
-            f"抽奖已添加到群组，用户可以参与抽奖。"
+            f"标题：{lottery_data['title']}\n"
+            f"奖品数量：{lottery_data['prize_count']}\n"
+            f"开奖时间：{lottery_data['end_time']}\n\n"
+            f"抽奖将在几秒内由 @{MAIN_BOT_USERNAME} 发布到群组，到开奖时间后自动开奖。"
         )
         
-        # 创建返回按钮
-        keyboard = [[InlineKeyboardButton("返回抽奖菜单", callback_data=f'lottery_{group_id}')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await query.message.edit_text(success_text, reply_markup=reply_markup)
-        
-        # 在群组中发送抽奖消息
-        try:
-            # 创建参与抽奖按钮
-            participate_keyboard = [
-                [InlineKeyboardButton("🎲 参与抽奖", callback_data=f'participate_lottery_{len(lottery_records)-1}')]
-            ]
-            participate_markup = InlineKeyboardMarkup(participate_keyboard)
-            
-            # 构建抽奖消息
-            lottery_msg = (
-                f"🎁 新抽奖活动\n\n"
-                f"标题：{lottery_record['title']}\n"
-            )
-            
-            if lottery_record['description']:
-                lottery_msg += f"描述：{lottery_record['description']}\n"
-            
-            lottery_msg += (
-                f"奖品数量：{lottery_record['prize_count']}\n"
-                f"开奖时间：{lottery_record['end_time']}\n\n"
-                f"点击下方按钮参与抽奖！"
-            )
-            
-            # 发送消息到群组
-            from telegram import Bot
-            bot = context.bot
-            await bot.send_message(
-                chat_id=int(group_id),
-                text=lottery_msg,
-                reply_markup=participate_markup
-            )
-            
-            logger.info(f"抽奖消息已发送到群组 {group_id}")
-        except Exception as e:
-            logger.error(f"发送抽奖消息到群组时出错: {e}")
-            import traceback
-            logger.error(f"错误详情: {traceback.format_exc()}")
-            
-            # 通知用户
-            await query.message.reply_text(
-                f"⚠️ 抽奖已创建，但发送到群组时出错。请检查机器人是否在群组中并有发送消息的权限。\n"
-                f"错误信息: {str(e)}"
-            )
+        return
     
     # 处理取消创建抽奖的回调
     elif action == 'cancel_lottery':
@@ -1123,7 +1417,7 @@ async def button_callback(update, context):
     # 处理抽奖设置的回调
     elif action == 'lottery_settings':
         # 获取群组名称
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 创建设置按钮
@@ -1204,11 +1498,26 @@ async def main():
 # 处理私聊消息
 async def handle_private_message(update, context):
     """当用户在私聊中发送非命令消息时，显示管理菜单"""
+    # 只有违禁词导入接受文件，贴纸、图片、语音等其他非文字消息不进入各设置流程
+    message = update.message
+    if message is None or (message.text is None and not (message.document and context.user_data.get('editing_banned_words'))):
+        return
+    
     # 检查是否正在创建抽奖
     if context.user_data.get('creating_lottery'):
         await handle_lottery_creation_input(update, context)
         return
     
+    # 检查是否正在发起接龙
+    if context.user_data.get('creating_chain'):
+        await handle_chain_input(update, context)
+        return
+    
+    # 检查是否正在创建积分抽奖
+    if context.user_data.get('creating_points_lottery'):
+        await handle_points_lottery_input(update, context)
+        return
+    
     # 检查是否正在增加积分
     if context.user_data.get('adding_points'):
         await handle_points_add_input(update, context)
@@ -1218,6 +1527,21 @@ async def handle_private_message(update, context):
     if context.user_data.get('deducting_points'):
         await handle_points_deduct_input(update, context)
         return
+    
+    # 检查是否正在编辑定时消息
+    if context.user_data.get('editing_schedule'):
+        await handle_schedule_input(update, context)
+        return
+    
+    # 检查是否正在编辑自动回复规则
+    if context.user_data.get('editing_auto_reply'):
+        await handle_auto_reply_input(update, context)
+        return
+    
+    # 检查是否正在编辑违禁词
+    if context.user_data.get('editing_banned_words'):
+        await handle_banned_words_input(update, context)
+        return
         
     # 检查是否是第一次对话
     if not context.user_data.get('menu_shown'):
@@ -1271,7 +1595,7 @@ async def handle_points_add_input(update, context):
     step = points_data['step']
     
     # 获取群组名称
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 创建取消按钮
@@ -1339,7 +1663,7 @@ async def handle_points_deduct_input(update, context):
     step = points_data['step']
     
     # 获取群组名称
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 创建取消按钮
@@ -1399,6 +1723,253 @@ async def handle_points_deduct_input(update, context):
                 reply_markup=reply_markup
             )
 
+# 解析管理员发送的违禁词
+def parse_banned_words(text):
+    """按换行和逗号拆分违禁词，去掉空白和重复项"""
+    words = []
+    seen = set()
+    for word in re.split(r'[\r\n,，]+', text):
+        word = word.strip()
+        if word and len(word) <= 255 and word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+# 处理违禁词的添加、删除和文件导入
+async def handle_banned_words_input(update, context):
+    """处理管理员发送的违禁词文本或上传的违禁词文件"""
+    state = context.user_data['editing_banned_words']
+    group_id = state['group_id']
+    keyboard = [[InlineKeyboardButton("⬅️ 返回违禁词设置", callback_data=f'banned_words_{group_id}')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    document = update.message.document
+    if document:
+        if document.file_size and document.file_size > BANNED_WORDS_MAX_FILE_SIZE:
+            await update.message.reply_text(
+                f"文件不能超过 {BANNED_WORDS_MAX_FILE_SIZE // 1024} KB，请重新上传：",
+                reply_markup=reply_markup
+            )
+            return
+        file = await document.get_file()
+        data = await file.download_as_bytearray()
+        text = bytes(data).decode('utf-8-sig', errors='ignore')
+    else:
+        text = update.message.text or ''
+    
+    words = parse_banned_words(text)
+    if not words:
+        await update.message.reply_text("没有识别到违禁词，请重新发送：", reply_markup=reply_markup)
+        return
+    
+    context.user_data.pop('editing_banned_words', None)
+    if state['mode'] == 'remove':
+        count = await run_db(remove_banned_words, group_id, words)
+        done_text = f"✅ 已删除 {count} 个违禁词（提交 {len(words)} 个）。"
+    else:
+        count = await run_db(add_banned_words, group_id, words, update.effective_user.id)
+        done_text = f"✅ 已添加 {count} 个违禁词（提交 {len(words)} 个，已存在的不重复添加）。"
+    
+    if count is None:
+        await update.message.reply_text("❌ 保存违禁词失败，请稍后重试。", reply_markup=reply_markup)
+        return
+    
+    # 立即加载到本进程，其他进程在下次检查版本时加载
+    await run_db(banned_words_loader.refresh)
+    await update.message.reply_text(done_text, reply_markup=reply_markup)
+
+# 处理定时消息的添加和删除
+async def handle_schedule_input(update, context):
+    """处理管理员发送的定时消息或要删除的定时消息编号"""
+    state = context.user_data['editing_schedule']
+    group_id = state['group_id']
+    keyboard = [[InlineKeyboardButton("⬅️ 返回定时消息设置", callback_data=f'schedule_{group_id}')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = (update.message.text or '').strip()
+    
+    if state['mode'] == 'delete':
+        schedule_ids = [int(part) for part in re.split(r'[\s,，#]+', text) if part.isdigit()]
+        if not schedule_ids:
+            await update.message.reply_text("请发送有效的定时消息编号：", reply_markup=reply_markup)
+            return
+        count = await run_db(delete_scheduled_messages, group_id, schedule_ids)
+        if count is None:
+            await update.message.reply_text("❌ 删除定时消息失败，请稍后重试。", reply_markup=reply_markup)
+            return
+        done_text = f"✅ 已删除 {count} 条定时消息。"
+    else:
+        spec, _, message_text = text.partition('\n')
+        message_text = message_text.strip()
+        if not message_text:
+            await update.message.reply_text("请在第二行开始填写消息内容，请重新发送：", reply_markup=reply_markup)
+            return
+        
+        now = datetime.now()
+        if state['schedule_type'] == 'interval':
+            interval_seconds = parse_interval(spec)
+            if not interval_seconds or interval_seconds < SCHEDULE_MIN_INTERVAL:
+                await update.message.reply_text(
+                    f"发送间隔格式不正确或小于 {SCHEDULE_MIN_INTERVAL // 60} 分钟，请重新发送：",
+                    reply_markup=reply_markup
+                )
+                return
+            cron = None
+            next_run_at = now + timedelta(seconds=interval_seconds)
+        else:
+            try:
+                cron = CronSchedule(spec).expression
+                next_run_at = CronSchedule(cron).next_after(now)
+            except ValueError as e:
+                await update.message.reply_text(f"cron 表达式无效：{e}\n请重新发送：", reply_markup=reply_markup)
+                return
+            if next_run_at is None:
+                await update.message.reply_text("该 cron 表达式不会触发，请重新发送：", reply_markup=reply_markup)
+                return
+            interval_seconds = None
+        
+        schedule_id = await run_db(
+            add_scheduled_message, group_id, message_text, state['schedule_type'],
+            interval_seconds, cron, next_run_at, update.effective_user.id
+        )
+        if schedule_id is None:
+            await update.message.reply_text("❌ 保存定时消息失败，请稍后重试。", reply_markup=reply_markup)
+            return
+        done_text = f"✅ 已添加定时消息 #{schedule_id}，首次发送时间：{next_run_at:%Y-%m-%d %H:%M}"
+    
+    context.user_data.pop('editing_schedule', None)
+    scheduler.request_reload()
+    await update.message.reply_text(done_text, reply_markup=reply_markup)
+
+# 处理自动回复规则的添加和删除
+async def handle_auto_reply_input(update, context):
+    """处理管理员发送的自动回复规则或要删除的规则编号"""
+    state = context.user_data['editing_auto_reply']
+    group_id = state['group_id']
+    keyboard = [[InlineKeyboardButton("⬅️ 返回自动回复设置", callback_data=f'autoreply_{group_id}')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = (update.message.text or '').strip()
+    
+    if state['mode'] == 'delete':
+        rule_ids = [int(part) for part in re.split(r'[\s,，#]+', text) if part.isdigit()]
+        if not rule_ids:
+            await update.message.reply_text("请发送有效的规则编号：", reply_markup=reply_markup)
+            return
+        count = await run_db(delete_auto_replies, group_id, rule_ids)
+        if count is None:
+            await update.message.reply_text("❌ 删除规则失败，请稍后重试。", reply_markup=reply_markup)
+            return
+        done_text = f"✅ 已删除 {count} 条自动回复规则。"
+    else:
+        lines = text.split('\n')
+        cooldown = AUTO_REPLY_DEFAULT_COOLDOWN
+        cooldown_match = re.match(r'^冷却[:：]\s*(\d+)\s*(?:秒)?$', lines[-1].strip()) if len(lines) > 2 else None
+        if cooldown_match:
+            cooldown = int(cooldown_match.group(1))
+            lines = lines[:-1]
+        pattern = lines[0].strip()
+        reply = '\n'.join(lines[1:]).strip()
+        if not pattern or not reply or len(pattern) > 255:
+            await update.message.reply_text(
+                "格式不正确：第一行为关键词（不超过 255 个字符），其余各行为回复内容，请重新发送：",
+                reply_markup=reply_markup
+            )
+            return
+        if state['match_type'] == 'regex':
+            error = check_regex(pattern)
+            if error:
+                await update.message.reply_text(f"{error}\n请重新发送：", reply_markup=reply_markup)
+                return
+        if not await run_db(add_auto_reply, group_id, state['match_type'], pattern, reply, cooldown, update.effective_user.id):
+            await update.message.reply_text("❌ 保存规则失败，请稍后重试。", reply_markup=reply_markup)
+            return
+        done_text = f"✅ 已添加{AUTO_REPLY_TYPE_NAMES[state['match_type']]}规则：{pattern}（冷却 {cooldown} 秒）"
+    
+    context.user_data.pop('editing_auto_reply', None)
+    # 立即在本进程重新编译，其他进程在下次检查版本时编译
+    await run_db(auto_reply_loader.refresh)
+    await update.message.reply_text(done_text, reply_markup=reply_markup)
+
+# 处理发起接龙的输入
+async def handle_chain_input(update, context):
+    """处理管理员发送的接龙标题和说明"""
+    group_id = context.user_data['creating_chain']['group_id']
+    keyboard = [[InlineKeyboardButton("⬅️ 返回接龙设置", callback_data=f'chain_{group_id}')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    title, _, description = (update.message.text or '').strip().partition('\n')
+    title = title.strip()
+    if not title or len(title) > 255:
+        await update.message.reply_text("标题不能为空且不超过 255 个字符，请重新发送：", reply_markup=reply_markup)
+        return
+    
+    chain_id = await run_db(create_chain, group_id, title, description.strip(), update.effective_user.id)
+    if chain_id is None:
+        await update.message.reply_text("❌ 发起接龙失败，请稍后重试。", reply_markup=reply_markup)
+        return
+    context.user_data.pop('creating_chain', None)
+    if chain_id == 0:
+        await update.message.reply_text("该群组已有进行中的接龙，请先结束当前接龙。", reply_markup=reply_markup)
+        return
+    
+    chain_manager.forget(int(group_id))
+    await update.message.reply_text(
+        f"✅ 接龙 #{chain_id} 已发起！\n\n"
+        f"接龙将在几秒内由 @{MAIN_BOT_USERNAME} 发布到群组，"
+        f"成员发送“{CHAIN_KEYWORD} 内容”或点击按钮即可参与。",
+        reply_markup=reply_markup
+    )
+
+# 处理创建积分抽奖的输入
+async def handle_points_lottery_input(update, context):
+    """处理管理员发送的积分抽奖设置"""
+    group_id = context.user_data['creating_points_lottery']['group_id']
+    keyboard = [[InlineKeyboardButton("❌ 取消", callback_data=f'cancel_points_lottery_{group_id}')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    lines = [line.strip() for line in (update.message.text or '').strip().split('\n')]
+    
+    error = None
+    try:
+        title = lines[0]
+        ticket_price = int(lines[1])
+        prize_count = int(lines[2])
+        end_time = datetime.strptime(lines[3], "%Y-%m-%d %H:%M")
+        max_tickets = int(lines[4]) if len(lines) > 4 else POINTS_LOTTERY_DEFAULT_MAX_TICKETS
+    except (IndexError, ValueError):
+        error = "请按格式发送 4 或 5 行，积分和数量为整数，时间格式为 YYYY-MM-DD HH:MM"
+    else:
+        if len(lines) > 5 or not title or len(title) > 255:
+            error = "标题不能为空且不超过 255 个字符，最多 5 行"
+        elif ticket_price < 1:
+            error = "每张抽奖券的积分必须大于 0"
+        elif not 1 <= prize_count <= 100:
+            error = "奖品数量必须在1-100之间"
+        elif end_time <= datetime.now():
+            error = "开奖时间必须是未来的时间"
+        elif max_tickets < 1:
+            error = "每人最多购买张数必须大于 0"
+    if error:
+        await update.message.reply_text(f"格式不正确：{error}\n请重新发送：", reply_markup=reply_markup)
+        return
+    
+    lottery_id = await run_db(
+        create_points_lottery, group_id, title, ticket_price, max_tickets, prize_count, end_time, update.effective_user.id
+    )
+    keyboard = [[InlineKeyboardButton("⬅️ 返回积分抽奖", callback_data=f'points_lottery_{group_id}')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    if lottery_id is None:
+        await update.message.reply_text("❌ 保存积分抽奖失败，请稍后重试。", reply_markup=reply_markup)
+        return
+    
+    context.user_data.pop('creating_points_lottery', None)
+    await update.message.reply_text(
+        f"✅ 积分抽奖 #{lottery_id} 创建成功！\n\n"
+        f"标题：{title}\n"
+        f"每张抽奖券：{ticket_price} 积分（每人最多 {max_tickets} 张）\n"
+        f"奖品数量：{prize_count}\n"
+        f"开奖时间：{end_time:%Y-%m-%d %H:%M}\n\n"
+        f"抽奖将在几秒内由 @{MAIN_BOT_USERNAME} 发布到群组，到开奖时间后自动开奖。",
+        reply_markup=reply_markup
+    )
+
 # 处理抽奖创建过程中的用户输入
 async def handle_lottery_creation_input(update, context):
     """处理用户在创建抽奖过程中的输入"""
@@ -1407,7 +1978,7 @@ async def handle_lottery_creation_input(update, context):
     step = lottery_data['step']
     
     # 获取群组名称
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 创建取消按钮
@@ -1516,7 +2087,7 @@ async def handle_create_lottery(update, context, group_id):
     query = update.callback_query
     
     # 获取群组名称
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 设置用户状态为等待输入抽奖标题
@@ -1540,15 +2111,11 @@ async def show_pending_lotteries(update, context, group_id):
     query = update.callback_query
     
     # 获取群组名称
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 获取未开奖的抽奖列表
-    lottery_records = config.get('lottery_records', [])
-    pending_lotteries = [
-        record for record in lottery_records 
-        if not record.get('is_opened', False) and not record.get('is_canceled', False)
-    ]
+    pending_lotteries = await run_db(get_group_lotteries, group_id, 'pending')
     
     if not pending_lotteries:
         text = f"[ {group_name} ] 没有未开奖的抽奖活动。"
@@ -1558,15 +2125,15 @@ async def show_pending_lotteries(update, context, group_id):
         keyboard = []
         
         for i, lottery in enumerate(pending_lotteries):
-            text += f"{i+1}. {lottery.get('title', '无标题')}\n"
-            text += f"   创建时间: {lottery.get('create_time', '未知')}\n"
-            text += f"   参与人数: {len(lottery.get('participants', []))}\n\n"
+            text += f"{i+1}. {lottery['title']}\n"
+            text += f"   开奖时间: {lottery['end_time']:%Y-%m-%d %H:%M}\n"
+            text += f"   参与人数: {lottery['participant_count']}\n\n"
             
-            # 为每个抽奖添加一个按钮
+            # 为每个抽奖添加一个提前开奖按钮
             keyboard.append([
                 InlineKeyboardButton(
-                    f"🎲 开奖 #{i+1} {lottery.get('title', '无标题')[:10]}...", 
-                    callback_data=f'draw_lottery_{group_id}_{i}'
+                    f"🎲 开奖 #{i+1} {lottery['title'][:10]}...", 
+                    callback_data=f"draw_lottery_{lottery['id']}_{group_id}"
                 )
             ])
         
@@ -1604,11 +2171,11 @@ async def handle_points_action(update, context, group_id=None):
         await query.edit_message_text("请选择要管理积分的群组：", reply_markup=reply_markup)
     else:
         # 获取群组配置
-        config = get_group_config(group_id)
+        config = await get_group_config(group_id)
         group_name = config.get('group_name', f'群组 {group_id}')
         
         # 获取积分统计信息
-        points_stats = get_points_stats(group_id)
+        points_stats = await get_points_stats(group_id)
         total_users = points_stats.get('total_users', 0)
         total_points = points_stats.get('total_points', 0)
         
@@ -1646,7 +2213,7 @@ async def show_points_rules(update, context, group_id):
     await query.answer("正在加载积分规则...")
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 获取积分规则
@@ -1674,11 +2241,11 @@ async def show_points_ranking(update, context, group_id):
     await query.answer("正在加载积分排行榜...")
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 获取积分排行榜
-    ranking = get_points_ranking(group_id)
+    ranking = await get_points_ranking(group_id)
     
     # 构建排行榜文本
     ranking_text = f"【{group_name}】积分排行榜\n\n"
@@ -1687,7 +2254,7 @@ async def show_points_ranking(update, context, group_id):
         ranking_text += "暂无积分数据。"
     else:
         for i, user in enumerate(ranking[:10], 1):
-            user_name = user.get('name', f"用户 {user.get('id')}")
+            user_name = user.get('name', f"用户 {user.get('user_id')}")
             points = user.get('points', 0)
             ranking_text += f"{i}. {user_name}: {points} 积分\n"
     
@@ -1704,7 +2271,7 @@ async def show_points_rewards(update, context, group_id):
     await query.answer("正在加载积分奖励...")
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 获取积分奖励
@@ -1729,10 +2296,9 @@ async def show_points_rewards(update, context, group_id):
 async def show_points_settings(update, context, group_id):
     """显示积分设置"""
     query = update.callback_query
-    await query.answer("正在加载积分设置...")
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 获取积分设置
@@ -1744,6 +2310,12 @@ async def show_points_settings(update, context, group_id):
     # 获取设置状态
     daily_message = points_settings.get('daily_message', False)
     auto_rewards = points_settings.get('auto_rewards', False)
+    retention_days = config.get('history_retention_days') or 90
+    
+    settings_text += (
+        f"积分明细保留: {retention_days} 天\n"
+        f"└ 超过保留天数的明细按天汇总，汇总后仍可查询每日积分变动"
+    )
     
     # 创建设置按钮
     keyboard = [
@@ -1763,19 +2335,296 @@ async def show_points_settings(update, context, group_id):
             InlineKeyboardButton("编辑积分规则", callback_data=f'edit_points_rules_{group_id}'),
             InlineKeyboardButton("编辑积分奖励", callback_data=f'edit_points_rewards_{group_id}')
         ],
+        [
+            InlineKeyboardButton(
+                f"{'✓' if days == retention_days else ''}{days}天",
+                callback_data=f'set_history_retention_{days}_{group_id}'
+            )
+            for days in POINTS_HISTORY_RETENTION_CHOICES
+        ],
         [InlineKeyboardButton("返回积分管理", callback_data=f'back_to_points_{group_id}')]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
+    try:
+        await query.edit_message_text(settings_text, reply_markup=reply_markup)
+    except telegram.error.BadRequest as e:
+        # 重复选择当前设置时消息内容不变
+        if "Message is not modified" not in str(e):
+            raise
+
+# 显示定时消息设置
+async def show_schedule_menu(update, context, group_id):
+    """显示定时消息数量和管理按钮"""
+    query = update.callback_query
+    
+    config = await get_group_config(group_id)
+    group_name = config.get('group_name', f'群组 {group_id}')
+    schedules = await run_db(get_scheduled_messages, group_id) or []
+    enabled = sum(1 for item in schedules if item['enabled'])
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("➕ 按间隔发送", callback_data=f'add_schedule_interval_{group_id}'),
+            InlineKeyboardButton("➕ 按时间表发送", callback_data=f'add_schedule_cron_{group_id}')
+        ],
+        [
+            InlineKeyboardButton("查看定时消息", callback_data=f'list_schedules_{group_id}'),
+            InlineKeyboardButton("删除定时消息", callback_data=f'delete_schedule_{group_id}')
+        ],
+        [InlineKeyboardButton("⬅️ 返回", callback_data=f'select_group_{group_id}')]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.message.edit_text(
+        f"【{group_name}】定时消息设置\n\n"
+        f"共 {len(schedules)} 条定时消息，{enabled} 条启用中。",
+        reply_markup=reply_markup
+    )
+
+# 显示自动回复设置
+async def show_auto_reply_menu(update, context, group_id):
+    """显示各类型的自动回复规则数量和管理按钮"""
+    query = update.callback_query
+    
+    config = await get_group_config(group_id)
+    group_name = config.get('group_name', f'群组 {group_id}')
+    rules = await run_db(get_auto_replies, group_id) or []
+    
+    text = f"【{group_name}】自动回复设置\n\n共 {len(rules)} 条规则\n"
+    for match_type, name in AUTO_REPLY_TYPE_NAMES.items():
+        count = sum(1 for rule in rules if rule['match_type'] == match_type)
+        text += f"• {name}: {count} 条\n"
+    text += "└ 优先级：完全匹配 > 前缀匹配 > 包含关键词 > 正则表达式"
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("➕ 完全匹配", callback_data=f'add_autoreply_exact_{group_id}'),
+            InlineKeyboardButton("➕ 前缀匹配", callback_data=f'add_autoreply_prefix_{group_id}')
+        ],
+        [
+            InlineKeyboardButton("➕ 包含关键词", callback_data=f'add_autoreply_contains_{group_id}'),
+            InlineKeyboardButton("➕ 正则表达式", callback_data=f'add_autoreply_regex_{group_id}')
+        ],
+        [
+            InlineKeyboardButton("查看规则", callback_data=f'list_autoreplies_{group_id}'),
+            InlineKeyboardButton("删除规则", callback_data=f'delete_autoreply_{group_id}')
+        ],
+        [InlineKeyboardButton("⬅️ 返回", callback_data=f'select_group_{group_id}')]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.message.edit_text(text, reply_markup=reply_markup)
+
+# 显示群组统计
+async def show_stats(update, context, group_id):
+    """显示今日和近 7 天的群组统计，数据来自定时写入的汇总表"""
+    query = update.callback_query
+    
+    config = await get_group_config(group_id)
+    group_name = config.get('group_name', f'群组 {group_id}')
+    now = datetime.now()
+    today = now.date()
+    days = await run_db(get_group_daily_stats, group_id, today - timedelta(days=6))
+    hours = await run_db(get_group_hourly_stats, group_id, datetime.combine(today, datetime.min.time()))
+    points_stats = await get_points_stats(group_id)
+    
+    today_row = next((row for row in days if row['day'] == today), None)
+    text = f"【{group_name}】群组统计（每分钟更新）\n\n"
+    if today_row:
+        text += (
+            f"今日：消息 {today_row['messages']} 条，活跃用户约 {today_row['active_users']} 人，"
+            f"加入 {today_row['joins']} 人，离开 {today_row['leaves']} 人\n"
+        )
+    else:
+        text += "今日：暂无数据\n"
+    
+    if days:
+        week_users = await run_db(merged_active_users, days)
+        text += (
+            f"近 7 天：消息 {sum(row['messages'] for row in days)} 条，活跃用户约 {week_users} 人，"
+            f"加入 {sum(row['joins'] for row in days)} 人，离开 {sum(row['leaves'] for row in days)} 人\n\n"
+            "每日消息 / 活跃用户：\n"
+        )
+        for row in days:
+            text += f"{row['day']:%m-%d}  {row['messages']} / {row['active_users']}\n"
+    
+    if hours:
+        # 今日各时段的消息数，按最多的时段缩放为条形图
+        peak = max(row['messages'] for row in hours) or 1
+        text += "\n今日各时段消息：\n"
+        for row in hours:
+            bar = '█' * max(1, round(row['messages'] * 10 / peak)) if row['messages'] else ''
+            text += f"{row['hour']:%H}时 {bar} {row['messages']}\n"
+    
+    text += f"\n积分：{points_stats['total_users']} 名用户共 {points_stats['total_points']} 积分"
+    
+    keyboard = [
+        [InlineKeyboardButton("🔄 刷新", callback_data=f'stats_{group_id}')],
+        [InlineKeyboardButton("⬅️ 返回", callback_data=f'select_group_{group_id}')]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    try:
+        await query.message.edit_text(text, reply_markup=reply_markup)
+    except telegram.error.BadRequest as e:
+        # 刷新时数据没有变化
+        if 'not modified' not in str(e):
+            raise
+
+# 显示接龙设置
+async def show_chain_menu(update, context, group_id):
+    """显示进行中的接龙和管理按钮"""
+    query = update.callback_query
+    
+    config = await get_group_config(group_id)
+    group_name = config.get('group_name', f'群组 {group_id}')
+    chain = await run_db(get_active_chain, group_id)
+    
+    text = f"【{group_name}】接龙设置\n\n"
+    if chain:
+        text += (
+            f"进行中：{chain['title']}\n"
+            f"发起时间：{chain['created_at']:%Y-%m-%d %H:%M}\n"
+            f"参与人数：{chain['entry_count']}\n"
+            f"└ 成员发送“{CHAIN_KEYWORD} 内容”或点击群组消息中的按钮参与"
+        )
+        keyboard = [
+            [
+                InlineKeyboardButton("导出接龙记录", callback_data=f'export_chain_{group_id}'),
+                InlineKeyboardButton("结束接龙", callback_data=f'end_chain_{group_id}')
+            ]
+        ]
+    else:
+        text += "当前没有进行中的接龙。"
+        keyboard = [[InlineKeyboardButton("➕ 发起接龙", callback_data=f'start_chain_{group_id}')]]
+    keyboard.append([InlineKeyboardButton("⬅️ 返回", callback_data=f'select_group_{group_id}')])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.message.edit_text(text, reply_markup=reply_markup)
+
+# 显示反垃圾设置
+async def show_antispam_settings(update, context, group_id):
+    """显示反垃圾开关和检测规则"""
+    query = update.callback_query
+    
+    config = await get_group_config(group_id)
+    group_name = config.get('group_name', f'群组 {group_id}')
+    enabled = config.get('anti_spam', False)
+    
+    settings_text = (
+        f"【{group_name}】反垃圾设置\n\n"
+        f"状态: {'✅ 已开启' if enabled else '❌ 已关闭'}\n\n"
+        f"开启后自动删除：\n"
+        f"• {ANTISPAM_WINDOW // 60} 分钟内 {ANTISPAM_MIN_USERS} 个以上不同用户发送的相同或近似内容\n"
+        f"• {ANTISPAM_LINK_WINDOW} 秒内达到 {ANTISPAM_LINK_LIMIT} 条的同一网站链接\n"
+        f"└ 管理员不受限制"
+    )
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ 开启" if not enabled else "❌ 关闭",
+                                 callback_data=f"antispam_{'disable' if enabled else 'enable'}_{group_id}")
+        ],
+        [InlineKeyboardButton("⬅️ 返回", callback_data=f'select_group_{group_id}')]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
     await query.edit_message_text(settings_text, reply_markup=reply_markup)
 
+# 显示反刷屏设置
+async def show_antiflood_settings(update, context, group_id):
+    """显示反刷屏开关、频率上限和处理方式"""
+    query = update.callback_query
+    
+    config = await get_group_config(group_id)
+    group_name = config.get('group_name', f'群组 {group_id}')
+    enabled = config.get('antiflood_enabled', False)
+    limit = config.get('antiflood_limit') or 5
+    window = config.get('antiflood_window') or 10
+    flood_action = config.get('antiflood_action') or 'mute'
+    mute_seconds = config.get('antiflood_mute_seconds') or 300
+    
+    settings_text = (
+        f"【{group_name}】反刷屏设置\n\n"
+        f"状态: {'✅ 已开启' if enabled else '❌ 已关闭'}\n"
+        f"频率上限: {window} 秒内 {limit} 条消息\n"
+        f"超限处理: {'删除消息并禁言 ' + str(mute_seconds // 60) + ' 分钟' if flood_action == 'mute' else '删除消息并警告'}\n"
+        f"└ 管理员不受限制"
+    )
+    
+    def mark(selected):
+        return '✓' if selected else ''
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ 开启" if not enabled else "❌ 关闭",
+                                 callback_data=f"antiflood_{'disable' if enabled else 'enable'}_{group_id}")
+        ],
+        [
+            InlineKeyboardButton(f"{mark(n == limit)}{n}条", callback_data=f'set_antiflood_limit_{n}_{group_id}')
+            for n in ANTIFLOOD_LIMIT_CHOICES
+        ],
+        [
+            InlineKeyboardButton(f"{mark(n == window)}{n}秒", callback_data=f'set_antiflood_window_{n}_{group_id}')
+            for n in ANTIFLOOD_WINDOW_CHOICES
+        ],
+        [
+            InlineKeyboardButton(f"{mark(flood_action == 'mute')}禁言", callback_data=f'set_antiflood_action_mute_{group_id}'),
+            InlineKeyboardButton(f"{mark(flood_action == 'delete')}仅删除", callback_data=f'set_antiflood_action_delete_{group_id}')
+        ],
+        [
+            InlineKeyboardButton(f"{mark(n == mute_seconds)}禁言{n // 60}分钟", callback_data=f'set_antiflood_mute_seconds_{n}_{group_id}')
+            for n in ANTIFLOOD_MUTE_CHOICES
+        ],
+        [InlineKeyboardButton("⬅️ 返回", callback_data=f'select_group_{group_id}')]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    try:
+        await query.edit_message_text(settings_text, reply_markup=reply_markup)
+    except telegram.error.BadRequest as e:
+        # 重复选择当前设置时消息内容不变
+        if "Message is not modified" not in str(e):
+            raise
+
+# 显示违禁词设置
+async def show_banned_words_menu(update, context, group_id):
+    """显示群组的违禁词数量和管理按钮"""
+    query = update.callback_query
+    
+    config = await get_group_config(group_id)
+    group_name = config.get('group_name', f'群组 {group_id}')
+    words = await run_db(get_banned_words, group_id) or []
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("添加违禁词", callback_data=f'add_banned_word_{group_id}'),
+            InlineKeyboardButton("删除违禁词", callback_data=f'remove_banned_word_{group_id}')
+        ],
+        [
+            InlineKeyboardButton("查看违禁词列表", callback_data=f'list_banned_words_{group_id}'),
+            InlineKeyboardButton("📄 批量导入", callback_data=f'import_banned_words_{group_id}')
+        ],
+        [
+            InlineKeyboardButton("⬅️ 返回", callback_data=f'select_group_{group_id}')
+        ]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.message.edit_text(
+        f"【{group_name}】违禁词设置\n\n"
+        f"当前共有 {len(words)} 个违禁词，包含违禁词的消息会被删除，管理员不受限制。",
+        reply_markup=reply_markup
+    )
+
 # 开始增加积分流程
 async def start_add_points(update, context, group_id):
     """开始增加积分流程"""
     query = update.callback_query
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 初始化增加积分状态
@@ -1800,7 +2649,7 @@ async def start_deduct_points(update, context, group_id):
     query = update.callback_query
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 初始化扣除积分状态
@@ -1835,11 +2684,11 @@ async def confirm_add_points(update, context, group_id):
     points_amount = points_data.get('points_amount')
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 增加积分
-    success = add_user_points(group_id, user_identifier, points_amount)
+    success = await add_user_points(group_id, user_identifier, points_amount)
     
     # 清除增加积分状态
     del context.user_data['adding_points']
@@ -1887,11 +2736,11 @@ async def confirm_deduct_points(update, context, group_id):
     points_amount = points_data.get('points_amount')
     
     # 获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
     group_name = config.get('group_name', f'群组 {group_id}')
     
     # 扣除积分
-    success = deduct_user_points(group_id, user_identifier, points_amount)
+    success = await deduct_user_points(group_id, user_identifier, points_amount)
     
     # 清除扣除积分状态
     del context.user_data['deducting_points']
@@ -1924,31 +2773,36 @@ async def cancel_deduct_points(update, context, group_id):
     await handle_points_action(update, context, group_id)
 
 # 获取积分统计信息 (使用数据库)
-def get_points_stats(group_id):
+async def get_points_stats(group_id):
     # 从数据库获取群组配置
-    config = get_group_config(group_id)
+    config = await get_group_config(group_id)
+    
+    # 优先使用内存积分排行中维护的合计，本进程未加载排行时查询数据库
+    totals = points_leaderboard.group_totals(group_id)
+    if totals is None:
+        totals = await run_db(get_group_points_totals, group_id)
     
     # 返回积分统计信息
     return {
         'enabled': config.get('points_enabled', False),
-        'total_users': 0,  # 这个可以从数据库中获取
-        'total_points': 0  # 这个可以从数据库中获取
+        'total_users': totals['total_users'],
+        'total_points': totals['total_points']
     }
 
 # 获取积分排行榜 (使用数据库)
-def get_points_ranking(group_id, limit=10):
+async def get_points_ranking(group_id, limit=10):
     # 从数据库获取积分排行榜
-    return db_get_points_ranking(group_id, limit)
+    return await run_db(db_get_points_ranking, group_id, limit)
 
 # 增加用户积分 (使用数据库)
-def add_user_points(group_id, user_identifier, points_amount, reason=None, admin_id=None):
+async def add_user_points(group_id, user_identifier, points_amount, reason=None, admin_id=None):
     # 增加用户积分
-    return add_user_points(group_id, user_identifier, points_amount, reason, admin_id)
+    return await run_db(db_add_user_points, group_id, user_identifier, points_amount, reason, admin_id)
 
 # 扣除用户积分 (使用数据库)
-def deduct_user_points(group_id, user_identifier, points_amount, reason=None, admin_id=None):
+async def deduct_user_points(group_id, user_identifier, points_amount, reason=None, admin_id=None):
     # 扣除用户积分
-    return deduct_user_points(group_id, user_identifier, points_amount, reason, admin_id)
+    return await run_db(db_deduct_user_points, group_id, user_identifier, points_amount, reason, admin_id)
 
 # 获取用户管理的群组列表
 def get_admin_groups(user_id):
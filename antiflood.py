@@ -0,0 +1,75 @@
+"""
+反刷屏模块，在内存中为每个 (群组, 用户) 保存最近几条消息的时间，单条消息的检查为 O(1)
+"""
+import time
+from collections import OrderedDict, deque
+
+from config import ANTIFLOOD_MAX_TRACKED, ANTIFLOOD_IDLE_TTL
+
+# 每次记录消息时最多回收的空闲条目数，保持单次检查为常数时间
+_EVICT_PER_HIT = 2
+
+
+class _Window:
+    """单个用户的滑动窗口：times 为最近 limit 条消息的时间，flooding 表示当前是否处于超限状态"""
+
+    __slots__ = ('times', 'flooding')
+
+    def __init__(self, limit):
+        self.times = deque(maxlen=limit)
+        self.flooding = False
+
+
+class FloodTracker:
+    """按 (群组, 用户) 记录发言频率，window 秒内发送 limit 条消息即判为刷屏
+
+    条目按最近活跃时间排序，超过 idle_ttl 秒未发言或超过 max_tracked 个时从最久未活跃的开始回收。
+    只在事件循环中使用，不加锁。
+    """
+
+    def __init__(self, max_tracked=ANTIFLOOD_MAX_TRACKED, idle_ttl=ANTIFLOOD_IDLE_TTL):
+        self.max_tracked = max_tracked
+        self.idle_ttl = idle_ttl
+        self._windows = OrderedDict()
+
+    def __len__(self):
+        return len(self._windows)
+
+    def hit(self, chat_id, user_id, limit, window, now=None):
+        """记录一条消息，返回 (是否超限, 是否刚开始超限)"""
+        now = time.monotonic() if now is None else now
+        key = (chat_id, user_id)
+        entry = self._windows.get(key)
+        if entry is None or entry.times.maxlen != limit:
+            # 新用户或群组修改了条数上限
+            entry = self._windows[key] = _Window(limit)
+        self._windows.move_to_end(key)
+
+        times = entry.times
+        times.append(now)
+        flooded = len(times) == limit and now - times[0] <= window
+        started = flooded and not entry.flooding
+        entry.flooding = flooded
+
+        self._evict(now)
+        return flooded, started
+
+    def _evict(self, now):
+        windows = self._windows
+        while len(windows) > self.max_tracked:
+            windows.popitem(last=False)
+        for _ in range(_EVICT_PER_HIT):
+            if not windows:
+                break
+            key, entry = next(iter(windows.items()))
+            if now - entry.times[-1] < self.idle_ttl:
+                break
+            del windows[key]
+
+    def reset(self, chat_id, user_id):
+        """清除用户的发言记录，例如解除禁言后"""
+        self._windows.pop((chat_id, user_id), None)
+
+
+# 全局反刷屏记录，同一聊天的更新总在同一个进程中处理
+flood_tracker = FloodTracker()
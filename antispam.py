@@ -0,0 +1,200 @@
+"""
+反垃圾模块，用 MinHash 签名和分段（LSH）索引找出不同用户发送的相同或近似内容，并检测同一用户短时间内大量发送同一域名的链接
+"""
+import operator
+import re
+import time
+from array import array
+from collections import Counter, OrderedDict, deque
+from hashlib import blake2b
+
+from config import ANTISPAM_WINDOW, ANTISPAM_INDEX_SIZE, ANTISPAM_MAX_GROUPS, ANTISPAM_MIN_LENGTH
+from config import ANTISPAM_SIMILARITY, ANTISPAM_MIN_USERS, ANTISPAM_LINK_WINDOW, ANTISPAM_LINK_LIMIT
+from config import ANTISPAM_LINK_ALLOWED_DOMAINS
+from word_filter import normalize
+
+# 参与计算签名的最大字符数，保证单条消息的计算量有上限
+_MAX_CHARS = 256
+# 按字符 2-gram 切分，对中文和英文都适用；短消息改一个字只影响 2 个片段
+_SHINGLE = 2
+# 每个片段做一次 64 字节的 blake2b，拆成 32 个 16 位哈希值，各位置取最小值得到 MinHash 签名
+_HASHES = 32
+# 签名分成 16 段、每段 2 个值，任意一段完全相同即为候选：相似度 0.5 的两条消息成为候选的概率约 99%，
+# 0.3 时约 80%；无关消息也可能成为候选，再由整个签名估计的相似度核对
+_BANDS = 16
+_ROWS = _HASHES // _BANDS
+# 每个分段桶最多检查的最近条目数
+_MAX_CANDIDATES = 32
+
+# 有没有协议头都去掉开头的 www.，同一域名只计入一个键
+_URL_PATTERN = re.compile(r'(?:https?://(?:www\.)?|\bwww\.)([^\s/?#]+)|\b(t\.me|telegram\.me)/', re.IGNORECASE)
+
+
+def minhash(text):
+    """计算文本字符 2-gram 集合的 MinHash 签名（32 个 16 位整数），有效字符少于 ANTISPAM_MIN_LENGTH 时返回 None
+
+    两个签名相同位置取值相同的比例是两条消息片段集合 Jaccard 相似度的估计。
+    """
+    normalized = normalize(text[:_MAX_CHARS])[0]
+    chars = ''.join(char for char in normalized if char.isalnum())[:_MAX_CHARS]
+    if len(chars) < ANTISPAM_MIN_LENGTH:
+        return None
+
+    shingles = {chars[i:i + _SHINGLE] for i in range(len(chars) - _SHINGLE + 1)}
+    # 按位置取最小值由 zip 和 min 在 C 代码中完成
+    return tuple(map(min, zip(*[
+        array('H', blake2b(shingle.encode(), digest_size=_HASHES * 2).digest()) for shingle in shingles
+    ])))
+
+
+def similarity(a, b):
+    """两个 MinHash 签名估计的 Jaccard 相似度"""
+    return sum(map(operator.eq, a, b)) / _HASHES
+
+
+def link_domains(text):
+    """提取消息中链接的域名（去掉开头的 www.）"""
+    return {(match.group(1) or match.group(2)).lower() for match in _URL_PATTERN.finditer(text)}
+
+
+def is_allowed_domain(domain, allowed=ANTISPAM_LINK_ALLOWED_DOMAINS):
+    """域名或其上级域名在白名单中"""
+    return any(domain == item or domain.endswith('.' + item) for item in allowed)
+
+
+class _Entry:
+    """索引中的一条消息"""
+
+    __slots__ = ('signature', 'user_id', 'message_id', 'timestamp', 'flagged')
+
+    def __init__(self, signature, user_id, message_id, timestamp):
+        self.signature = signature
+        self.user_id = user_id
+        self.message_id = message_id
+        self.timestamp = timestamp
+        self.flagged = False
+
+
+class _GroupIndex:
+    """单个群组最近消息的签名索引和按 (用户, 域名) 的链接计数"""
+
+    __slots__ = ('entries', 'buckets', 'links', 'link_counts')
+
+    def __init__(self):
+        self.entries = deque()
+        self.buckets = {}
+        self.links = deque()
+        self.link_counts = Counter()
+
+
+def _bands(signature):
+    return [(band, signature[band * _ROWS:(band + 1) * _ROWS]) for band in range(_BANDS)]
+
+
+class SpamDetector:
+    """按群组保存最近 index_size 条消息的签名，每条消息只检查 16 个分段桶中的最近条目"""
+
+    def __init__(self, index_size=ANTISPAM_INDEX_SIZE, max_groups=ANTISPAM_MAX_GROUPS,
+                 window=ANTISPAM_WINDOW, min_similarity=ANTISPAM_SIMILARITY,
+                 min_users=ANTISPAM_MIN_USERS, link_window=ANTISPAM_LINK_WINDOW,
+                 link_limit=ANTISPAM_LINK_LIMIT, allowed_domains=ANTISPAM_LINK_ALLOWED_DOMAINS):
+        self.index_size = index_size
+        self.max_groups = max_groups
+        self.window = window
+        self.min_similarity = min_similarity
+        self.min_users = min_users
+        self.link_window = link_window
+        self.link_limit = link_limit
+        self.allowed_domains = allowed_domains
+        self._groups = OrderedDict()
+
+    def _group(self, chat_id):
+        index = self._groups.get(chat_id)
+        if index is None:
+            index = self._groups[chat_id] = _GroupIndex()
+            if len(self._groups) > self.max_groups:
+                self._groups.popitem(last=False)
+        self._groups.move_to_end(chat_id)
+        return index
+
+    def _expire(self, index, now):
+        # 条目按时间顺序加入，最旧的条目总在各个桶的最左侧
+        entries = index.entries
+        while entries and (len(entries) >= self.index_size or now - entries[0].timestamp > self.window):
+            oldest = entries.popleft()
+            for key in _bands(oldest.signature):
+                bucket = index.buckets[key]
+                bucket.popleft()
+                if not bucket:
+                    del index.buckets[key]
+
+        links = index.links
+        while links and now - links[0][0] > self.link_window:
+            _, key = links.popleft()
+            index.link_counts[key] -= 1
+            if not index.link_counts[key]:
+                del index.link_counts[key]
+
+    def check(self, chat_id, user_id, message_id, text, now=None):
+        """记录一条消息，判定为垃圾消息时返回 (原因, 需要删除的消息ID列表)，否则返回 (None, [])
+
+        管理员的消息不要传入：已记录的消息可能随后来的近似消息一起被删除。
+        """
+        now = time.monotonic() if now is None else now
+        index = self._group(chat_id)
+        self._expire(index, now)
+
+        reason = None
+        message_ids = []
+
+        signature = minhash(text)
+        if signature is not None:
+            # 找出近似消息，按用户去重
+            matches = {}
+            keys = _bands(signature)
+            for key in keys:
+                bucket = index.buckets.get(key)
+                if not bucket:
+                    continue
+                for i in range(len(bucket) - 1, max(len(bucket) - _MAX_CANDIDATES, 0) - 1, -1):
+                    entry = bucket[i]
+                    if entry.user_id == user_id or id(entry) in matches:
+                        continue
+                    if similarity(entry.signature, signature) >= self.min_similarity:
+                        matches[id(entry)] = entry
+
+            entry = _Entry(signature, user_id, message_id, now)
+            index.entries.append(entry)
+            for key in keys:
+                bucket = index.buckets.get(key)
+                if bucket is None:
+                    bucket = index.buckets[key] = deque()
+                bucket.append(entry)
+
+            users = {match.user_id for match in matches.values()}
+            if len(users) + 1 >= self.min_users:
+                reason = 'duplicate'
+                entry.flagged = True
+                message_ids.append(message_id)
+                # 之前发送的近似消息一并删除
+                for match in matches.values():
+                    if not match.flagged:
+                        match.flagged = True
+                        message_ids.append(match.message_id)
+
+        # 链接按用户计数，其他用户正常分享同一网站的链接不受影响
+        for domain in link_domains(text):
+            if is_allowed_domain(domain, self.allowed_domains):
+                continue
+            key = (user_id, domain)
+            index.links.append((now, key))
+            index.link_counts[key] += 1
+            if index.link_counts[key] >= self.link_limit and reason is None:
+                reason = 'link_flood'
+                message_ids.append(message_id)
+
+        return reason, message_ids
+
+
+# 全局垃圾消息检测器，同一聊天的更新总在同一个进程中处理
+spam_detector = SpamDetector()
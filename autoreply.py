@@ -0,0 +1,355 @@
+"""
+自动回复模块，把群组的规则编译成一个匹配器，每条消息只扫描一遍即可找到命中的规则
+"""
+import re
+import threading
+import time
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python 3.10 及更早
+    import sre_parse as _sre_parse
+
+from loguru import logger
+
+from config import AUTO_REPLY_REGEX_MAX_LENGTH, AUTO_REPLY_REGEX_MAX_TEXT
+from db_async import run_db
+from db_operations import get_auto_replies, get_auto_reply_versions
+from word_filter import BannedWordMatcher, normalize
+
+# 规则类型，按优先级排列：完全匹配 > 前缀匹配（最长优先）> 包含匹配（最先出现优先）> 正则（规则顺序）
+MATCH_TYPES = ('exact', 'prefix', 'contains', 'regex')
+
+# 反向引用
+_BACKREFERENCE = re.compile(r'\\\d|\(\?P=')
+
+# 前缀树中标记规则结尾的键
+_END = ''
+
+# 会回溯的重复（占有型重复不回溯，不在其中）
+_REPEATS = (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT)
+
+
+def _subpatterns(value):
+    if isinstance(value, _sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _subpatterns(item)
+
+
+def _nested_repeat(pattern, in_repeat=False):
+    """可重复多次的部分里还有次数不固定的重复，如 (a+)+、(\\w+\\s?)*、(.*a){20}"""
+    for op, value in pattern:
+        if op in _REPEATS:
+            low, high, sub = value
+            if in_repeat and low != high:
+                return True
+            if _nested_repeat(sub, in_repeat or high > 1):
+                return True
+        else:
+            for sub in _subpatterns(value):
+                if _nested_repeat(sub, in_repeat):
+                    return True
+    return False
+
+
+def check_regex(pattern):
+    """检查正则规则能否安全使用，返回错误说明，可以使用时返回 None
+
+    正则在事件循环中对每条群组消息执行，嵌套重复会在特定输入上指数级回溯，卡住同一进程的所有群组，保存时直接拒绝。
+    """
+    if len(pattern) > AUTO_REPLY_REGEX_MAX_LENGTH:
+        return f"正则不能超过 {AUTO_REPLY_REGEX_MAX_LENGTH} 个字符"
+    try:
+        parsed = _sre_parse.parse(pattern)
+        re.compile(pattern)
+    except re.error as e:
+        return f"正则表达式无效：{e}"
+    if _nested_repeat(parsed):
+        return "正则包含嵌套的重复（如 (a+)+），部分消息会导致匹配极慢，请改写"
+    return None
+
+
+# 数据库按原文去重，大小写、全角半角或首尾空格不同的关键词规范化后相同，同一关键词下按规则顺序保留全部规则，
+# 前一条在冷却中时由后一条回复
+def _compile_exact(rules):
+    ids = {}
+    for rule in rules:
+        ids.setdefault(normalize(rule['pattern'].strip())[0], []).append(rule['id'])
+    return ids
+
+
+def _compile_prefix(rules):
+    root = {}
+    for rule in rules:
+        node = root
+        for char in normalize(rule['pattern'].strip())[0]:
+            node = node.setdefault(char, {})
+        node.setdefault(_END, []).append(rule['id'])
+    return root
+
+
+def _compile_contains(rules):
+    ids = {}
+    for rule in rules:
+        ids.setdefault(normalize(rule['pattern'].strip())[0], []).append(rule['id'])
+    return BannedWordMatcher([rule['pattern'] for rule in rules]), ids
+
+
+def _required_literal(pattern):
+    """找出正则匹配时一定出现的最长字面字符串，找不到时返回空字符串
+
+    只分析最外层：最外层有 | 或使用 verbose 模式时直接放弃，分组和字符集内的内容不参与。
+    """
+    if re.search(r'\(\?[a-zA-Z]*x', pattern):
+        return ''
+    best = ''
+    run = []
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == '\\':
+            escaped = pattern[i:i + 1]
+            i += 1
+            # 转义的标点是普通字符，\d \w \b 等不是
+            if escaped and not escaped.isalnum():
+                if depth == 0:
+                    run.append(escaped)
+                continue
+        elif char == '[':
+            # 跳过字符集，] 出现在开头时是普通字符
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return ''
+        elif char in '*?{':
+            # 前一个字符可以不出现
+            if run:
+                run.pop()
+            if char == '{':
+                while i < len(pattern) and pattern[i] != '}':
+                    i += 1
+                i += 1
+        elif char not in '|.^$+':
+            if depth == 0:
+                run.append(char)
+            continue
+        if len(run) > len(best):
+            best = ''.join(run)
+        run = []
+    if len(run) > len(best):
+        best = ''.join(run)
+    return best
+
+
+def _compile_regex(rules):
+    """有必现字面字符串的正则先用 Aho–Corasick 一次扫描筛选，其余合并为一个带命名分组的大正则"""
+    filtered = []
+    parts = []
+    separate = []
+    for rule in rules:
+        pattern = rule['pattern']
+        # 保存时已检查，这里再检查一次，跳过检查加入前保存的规则
+        error = check_regex(pattern)
+        if error:
+            logger.warning(f"自动回复规则 {rule['id']} 的正则不可用，已跳过: {error}")
+            continue
+        compiled = re.compile(pattern)
+        literal = _required_literal(pattern)
+        if len(normalize(literal)[0]) >= 2:
+            filtered.append((literal, compiled, rule['id']))
+            continue
+        try:
+            # 反向引用的编号会因合并而改变，不能合并
+            if _BACKREFERENCE.search(pattern):
+                raise re.error('包含反向引用')
+            re.compile(f"(?P<r{rule['id']}>{pattern})")
+            parts.append(f"(?P<r{rule['id']}>{pattern})")
+        except re.error:
+            separate.append((compiled, rule['id']))
+
+    literals = {}
+    for literal, compiled, rule_id in filtered:
+        literals.setdefault(normalize(literal)[0], []).append((compiled, rule_id))
+    prefilter = BannedWordMatcher([literal for literal, _, _ in filtered])
+    combined = re.compile('|'.join(parts)) if parts else None
+    return prefilter, literals, combined, separate
+
+
+_COMPILERS = {
+    'exact': _compile_exact,
+    'prefix': _compile_prefix,
+    'contains': _compile_contains,
+    'regex': _compile_regex,
+}
+
+
+def _signature(rules):
+    """决定是否需要重新编译的规则特征，只改回复内容或冷却时间时不重新编译"""
+    return tuple((rule['id'], rule['pattern']) for rule in rules)
+
+
+class CompiledReplies:
+    """单个群组编译后的规则，构建后只读；previous 中规则未变化的类型直接复用"""
+
+    def __init__(self, rules, previous=None):
+        self.rules = {rule['id']: rule for rule in rules}
+        self._signatures = {}
+        self._compiled = {}
+        for match_type in MATCH_TYPES:
+            typed = [rule for rule in rules if rule['match_type'] == match_type]
+            signature = _signature(typed)
+            if previous is not None and previous._signatures.get(match_type) == signature:
+                self._compiled[match_type] = previous._compiled[match_type]
+            else:
+                self._compiled[match_type] = _COMPILERS[match_type](typed)
+            self._signatures[match_type] = signature
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, text):
+        """按优先级依次产生命中的规则编号"""
+        normalized = normalize(text.strip())[0]
+
+        yield from self._compiled['exact'].get(normalized, ())
+
+        # 沿前缀树走一遍，记录经过的规则结尾，最长的前缀优先
+        node = self._compiled['prefix']
+        matched = []
+        for char in normalized:
+            node = node.get(char)
+            if node is None:
+                break
+            if _END in node:
+                matched.append(node[_END])
+        for rule_ids in reversed(matched):
+            yield from rule_ids
+
+        matcher, ids = self._compiled['contains']
+        for start, end, word in matcher.search(text):
+            yield from ids[normalize(word)[0]]
+
+        prefilter, literals, combined, separate = self._compiled['regex']
+        # 正则只匹配消息开头的一段，限制超长消息上的匹配耗时
+        text = text[:AUTO_REPLY_REGEX_MAX_TEXT]
+        candidates = {}
+        for start, end, literal in prefilter.search(text):
+            for pattern, rule_id in literals[normalize(literal)[0]]:
+                candidates[rule_id] = pattern
+        for rule_id in sorted(candidates):
+            if candidates[rule_id].search(text):
+                yield rule_id
+        if combined is not None:
+            for match in combined.finditer(text):
+                yield int(match.lastgroup[1:])
+        for pattern, rule_id in separate:
+            if pattern.search(text):
+                yield rule_id
+
+
+class AutoReplyEngine:
+    """各群组编译后的规则和每条规则的冷却状态"""
+
+    def __init__(self):
+        self._groups = {}
+        self._last_fired = {}
+        self._lock = threading.Lock()
+
+    def set(self, group_id, rules):
+        """用新的规则列表替换群组的匹配器，规则未变化的类型不重新编译"""
+        group_id = int(group_id)
+        compiled = CompiledReplies(rules, self._groups.get(group_id))
+        with self._lock:
+            if compiled.rules:
+                self._groups[group_id] = compiled
+            else:
+                self._groups.pop(group_id, None)
+        return compiled
+
+    def remove(self, group_id):
+        with self._lock:
+            self._groups.pop(int(group_id), None)
+
+    def match(self, group_id, text, now=None):
+        """返回文本命中的第一条不在冷却中的规则，并开始该规则的冷却；没有时返回 None"""
+        compiled = self._groups.get(int(group_id))
+        if compiled is None or not text:
+            return None
+        now = time.monotonic() if now is None else now
+        for rule_id in compiled.candidates(text):
+            rule = compiled.rules[rule_id]
+            last_fired = self._last_fired.get(rule_id)
+            if last_fired is not None and now - last_fired < rule['cooldown']:
+                continue
+            if rule['cooldown']:
+                self._last_fired[rule_id] = now
+            return rule
+        return None
+
+    def forget_cooldowns(self, rule_ids):
+        """删除已不存在的规则的冷却记录"""
+        for rule_id in rule_ids:
+            self._last_fired.pop(rule_id, None)
+
+
+class AutoReplyLoader:
+    """记录已加载的各群组规则版本，只重新编译版本号变化的群组"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._versions = {}
+        self._rule_ids = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """加载有变化的群组规则，返回重新编译的群组数（同步函数，需在线程池中执行）"""
+        versions = get_auto_reply_versions()
+        if versions is None:
+            return 0
+
+        with self._lock:
+            changed = 0
+            for group_id, version in versions.items():
+                if self._versions.get(group_id) == version:
+                    continue
+                rules = get_auto_replies(group_id)
+                if rules is None:
+                    continue
+                self.engine.set(group_id, rules)
+                rule_ids = {rule['id'] for rule in rules}
+                self.engine.forget_cooldowns(self._rule_ids.get(group_id, set()) - rule_ids)
+                self._rule_ids[group_id] = rule_ids
+                self._versions[group_id] = version
+                changed += 1
+
+            for group_id in set(self._versions) - set(versions):
+                self.engine.remove(group_id)
+                self.engine.forget_cooldowns(self._rule_ids.pop(group_id, set()))
+                del self._versions[group_id]
+
+        if changed:
+            logger.info(f"已重新编译 {changed} 个群组的自动回复规则")
+        return changed
+
+
+# 全局自动回复引擎和加载器
+auto_reply_engine = AutoReplyEngine()
+auto_reply_loader = AutoReplyLoader(auto_reply_engine)
+
+
+async def reload_job(context):
+    """定时任务：检查自动回复规则版本，重新编译管理员修改过的群组"""
+    await run_db(auto_reply_loader.refresh)
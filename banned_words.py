@@ -0,0 +1,54 @@
+"""
+违禁词加载模块，按版本号从数据库加载有变化的群组违禁词，并替换内存中已编译的匹配器
+"""
+import threading
+
+from loguru import logger
+
+from db_async import run_db
+from db_operations import get_banned_words, get_banned_word_versions
+from word_filter import banned_word_registry
+
+
+class BannedWordsLoader:
+    """记录已加载的各群组违禁词版本，只重新编译版本号变化的群组"""
+
+    def __init__(self, registry=banned_word_registry):
+        self.registry = registry
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """加载有变化的群组违禁词，返回重新编译的群组数（同步函数，需在线程池中执行）"""
+        versions = get_banned_word_versions()
+        if versions is None:
+            return 0
+
+        with self._lock:
+            changed = 0
+            for group_id, version in versions.items():
+                if self._versions.get(group_id) == version:
+                    continue
+                words = get_banned_words(group_id)
+                if words is None:
+                    continue
+                self.registry.set(group_id, words)
+                self._versions[group_id] = version
+                changed += 1
+
+            for group_id in set(self._versions) - set(versions):
+                self.registry.remove(group_id)
+                del self._versions[group_id]
+
+        if changed:
+            logger.info(f"已重新加载 {changed} 个群组的违禁词")
+        return changed
+
+
+# 全局违禁词加载器
+banned_words_loader = BannedWordsLoader()
+
+
+async def reload_job(context):
+    """定时任务：检查违禁词版本，加载管理员修改过的群组"""
+    await run_db(banned_words_loader.refresh)
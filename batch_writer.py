@@ -0,0 +1,85 @@
+"""
+批量写入模块，在内存中排队待插入的行，定时或累计到一定数量时一次写入数据库
+"""
+import asyncio
+
+from loguru import logger
+
+from db_async import run_db
+
+
+class BatchWriter:
+    """待写入行的队列，每隔 flush_interval 毫秒或累计 flush_max 行时调用 write 批量写入
+
+    write 为同步数据库函数，接收行列表，失败时返回 None，这些行会放回队列等待下次重试。
+    """
+
+    def __init__(self, write, name, flush_interval_ms, flush_max):
+        self.write = write
+        self.name = name
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max = flush_max
+        self._queue = []
+        self._writing = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, row):
+        """放入一行，去重由调用方在内存中完成，写入时再由唯一键兜底"""
+        self._queue.append(row)
+        if len(self._queue) >= self.flush_max:
+            self._wakeup.set()
+
+    def pending(self):
+        """尚未写入数据库的行，包括正在写入的"""
+        return self._writing + self._queue
+
+    async def flush(self):
+        """把队列中的行批量写入数据库，失败时放回队列等待下次重试"""
+        async with self._flush_lock:
+            if not self._queue:
+                return
+            batch = self._writing = self._queue
+            self._queue = []
+            try:
+                if await run_db(self.write, batch) is None:
+                    self._queue[:0] = batch
+            except BaseException:
+                # 线程池已关闭等异常同样放回队列，调用方在内存中已把这些行视为写入
+                self._queue[:0] = batch
+                raise
+            finally:
+                self._writing = []
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"批量写入{self.name}失败: {e}")
+
+    def start(self):
+        """启动后台定时写入任务"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入剩余的行"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(f"{self.name}已全部写入数据库")
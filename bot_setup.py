@@ -0,0 +1,127 @@
+"""
+机器人初始化模块，集中创建 Application、注册处理器和定时任务，供启动脚本和分片进程共用
+"""
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, filters
+
+from config import UPDATE_MODE, BOT_API_BASE_URL
+from config import LEADERBOARD_RECONCILE_INTERVAL, LEADERBOARD_FULL_RECONCILE_INTERVAL
+from config import POINTS_HISTORY_RETENTION_INTERVAL, BANNED_WORDS_RELOAD_INTERVAL
+from config import AUTO_REPLY_RELOAD_INTERVAL, SCHEDULE_TICK_INTERVAL, LOTTERY_POLL_INTERVAL, MESSAGE_EDIT_FLUSH_INTERVAL
+from config import CHAIN_POLL_INTERVAL, STATS_FLUSH_INTERVAL, STATS_PRUNE_INTERVAL
+import tg_bot_test
+import chain
+import admin_bot
+import lottery
+import points_lottery
+from autoreply import auto_reply_loader, reload_job as reload_auto_replies_job
+from banned_words import banned_words_loader, reload_job as reload_banned_words_job
+from db_async import run_db
+from leaderboard import points_leaderboard, reconcile_job, full_reconcile_job
+from message_editor import message_editor
+from points_retention import retention_job
+from scheduler import scheduler
+from stats import stats_collector, prune_job as prune_stats_job
+from update_processor import ChatOrderedUpdateProcessor
+
+# 群组中的新消息，不含入群、退群等服务消息
+GROUP_MESSAGES = filters.ChatType.GROUPS & filters.UpdateType.MESSAGE & ~filters.StatusUpdate.ALL
+
+
+def build_application(token, with_updater=True):
+    """创建 Application，不同聊天的更新并发处理；webhook 模式或 with_updater=False 时不创建 Updater，由外部向更新队列放入更新"""
+    builder = Application.builder().token(token).concurrent_updates(ChatOrderedUpdateProcessor())
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    if not with_updater or UPDATE_MODE == 'webhook':
+        builder = builder.updater(None)
+    return builder.build()
+
+
+def register_main_handlers(application):
+    """为主机器人添加处理器"""
+    # 群组统计和刷屏、违禁词检查各占一个组，先于 echo 和命令执行，能看到所有类型的群组消息；
+    # 同一组只执行第一个匹配的处理器，检查删除消息后抛出 ApplicationHandlerStop 跳过之后的组
+    application.add_handler(MessageHandler(GROUP_MESSAGES, tg_bot_test.record_stats), group=-2)
+    application.add_handler(MessageHandler(GROUP_MESSAGES, tg_bot_test.moderate), group=-1)
+    application.add_handler(CommandHandler("start", tg_bot_test.start))
+    application.add_handler(CommandHandler("help", tg_bot_test.help))
+    application.add_handler(CommandHandler("about", tg_bot_test.about))
+    application.add_handler(CallbackQueryHandler(lottery.participate_callback, pattern=r'^participate_lottery_\d+$'))
+    application.add_handler(CallbackQueryHandler(points_lottery.buy_callback, pattern=r'^buy_ticket_\d+_\d+$'))
+    application.add_handler(CallbackQueryHandler(chain.join_callback, pattern=r'^join_chain_\d+$'))
+    application.add_handler(CallbackQueryHandler(tg_bot_test.button_callback))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, tg_bot_test.echo))
+    application.add_handler(MessageHandler(
+        filters.ChatType.GROUPS &
+        (filters.StatusUpdate.NEW_CHAT_MEMBERS | filters.StatusUpdate.LEFT_CHAT_MEMBER),
+        tg_bot_test.handle_chat_member
+    ))
+    application.add_handler(ChatMemberHandler(tg_bot_test.chat_member_status, ChatMemberHandler.ANY_CHAT_MEMBER))
+    application.add_error_handler(tg_bot_test.error)
+
+
+def register_admin_handlers(application):
+    """为管理机器人添加处理器"""
+    application.add_handler(CommandHandler("start", admin_bot.start))
+    application.add_handler(CommandHandler("help", admin_bot.help))
+    application.add_handler(CallbackQueryHandler(admin_bot.button_callback))
+    # 私聊中的文字和文件用于各设置流程的输入
+    application.add_handler(MessageHandler(filters.ChatType.PRIVATE & ~filters.COMMAND, admin_bot.handle_private_message))
+    application.add_error_handler(admin_bot.error)
+
+
+async def setup_main_jobs(application, maintenance=True):
+    """加载积分排行、违禁词和自动回复规则并注册主机器人的定时任务，maintenance=False 时不注册只需运行一份的维护任务"""
+    # 加载积分排行到内存，并定时与数据库校对
+    await run_db(points_leaderboard.warm)
+    application.job_queue.run_repeating(
+        reconcile_job,
+        interval=LEADERBOARD_RECONCILE_INTERVAL,
+        first=LEADERBOARD_RECONCILE_INTERVAL
+    )
+    application.job_queue.run_repeating(
+        full_reconcile_job,
+        interval=LEADERBOARD_FULL_RECONCILE_INTERVAL,
+        first=LEADERBOARD_FULL_RECONCILE_INTERVAL
+    )
+
+    # 加载违禁词，并定时检查管理员的修改
+    await run_db(banned_words_loader.refresh)
+    application.job_queue.run_repeating(
+        reload_banned_words_job,
+        interval=BANNED_WORDS_RELOAD_INTERVAL,
+        first=BANNED_WORDS_RELOAD_INTERVAL
+    )
+    
+    # 编译自动回复规则，并定时检查管理员的修改
+    await run_db(auto_reply_loader.refresh)
+    application.job_queue.run_repeating(
+        reload_auto_replies_job,
+        interval=AUTO_REPLY_RELOAD_INTERVAL,
+        first=AUTO_REPLY_RELOAD_INTERVAL
+    )
+    
+    # 群组统计定时写入汇总表
+    application.job_queue.run_repeating(stats_collector.flush, interval=STATS_FLUSH_INTERVAL, first=STATS_FLUSH_INTERVAL)
+    
+    # 合并后的消息编辑（如抽奖参与人数），由处理该群组更新的进程执行
+    application.job_queue.run_repeating(
+        message_editor.flush,
+        interval=MESSAGE_EDIT_FLUSH_INTERVAL,
+        first=MESSAGE_EDIT_FLUSH_INTERVAL
+    )
+    
+    if maintenance:
+        # 定时汇总过期积分明细、维护积分历史分区
+        application.job_queue.run_repeating(retention_job, interval=POINTS_HISTORY_RETENTION_INTERVAL, first=60)
+        # 定时消息只在一个进程中发送
+        application.job_queue.run_repeating(scheduler.tick, interval=SCHEDULE_TICK_INTERVAL, first=SCHEDULE_TICK_INTERVAL)
+        # 发布新抽奖并安排自动开奖
+        application.job_queue.run_repeating(lottery.lottery_manager.poll, interval=LOTTERY_POLL_INTERVAL, first=5)
+        application.job_queue.run_repeating(
+            points_lottery.points_lottery_manager.poll, interval=LOTTERY_POLL_INTERVAL, first=5
+        )
+        # 发布新发起的接龙，收尾已结束的接龙
+        application.job_queue.run_repeating(chain.chain_manager.poll, interval=CHAIN_POLL_INTERVAL, first=5)
+        # 清理过期的群组统计
+        application.job_queue.run_repeating(prune_stats_job, interval=STATS_PRUNE_INTERVAL, first=STATS_PRUNE_INTERVAL)
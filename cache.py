@@ -0,0 +1,96 @@
+"""
+进程内缓存模块，提供带过期时间和容量上限的 LRU 缓存
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """线程安全的 TTL + LRU 缓存，超过容量时淘汰最久未使用的条目
+
+    每个键记录被失效的次数作为版本号：读取数据前取 generation(key)，写入时传给 set，
+    读取期间条目被失效过（数据已被修改）就不写入，避免把旧数据留在缓存中直到过期。
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """读取缓存，不存在或已过期时返回 default"""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, key):
+        """条目当前的版本号，在读取数据之前获取"""
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def set(self, key, value, ttl=None, generation=None):
+        """写入缓存；给出 generation 且之后条目被失效过时不写入，返回是否写入"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key, 0)):
+                return False
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key):
+        """删除指定缓存条目，进行中的读取不再写入"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if len(self._generations) > self.maxsize:
+                self._reset_generations()
+
+    def clear(self):
+        """清空缓存，进行中的读取不再写入"""
+        with self._lock:
+            self._data.clear()
+            self._reset_generations()
+
+    def _reset_generations(self):
+        # 版本号表整体换代，限制其大小；换代前取得的版本号全部作废
+        self._generations.clear()
+        self._epoch += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """缓存命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,238 @@
+"""
+接龙模块，每个群组进行中的接龙在内存中保存一份按顺序追加的记录，批量写入数据库，群组消息只渲染最近的记录
+"""
+import time
+from datetime import datetime, timedelta
+
+from loguru import logger
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from batch_writer import BatchWriter
+from cache import TTLCache
+from config import CHAIN_KEYWORD, CHAIN_CONTENT_MAX_LENGTH, CHAIN_RENDER_TAIL, CHAIN_EDIT_INTERVAL
+from config import CHAIN_STATUS_TTL, CHAIN_FLUSH_INTERVAL_MS, CHAIN_FLUSH_MAX
+from db_async import run_db
+from db_operations import get_active_chain, get_chain_state, get_chain_entries, add_chain_entries
+from db_operations import set_chain_message, get_chains_to_sync, mark_chain_post_closed
+from message_editor import message_editor
+
+# 参与按钮的回调数据前缀，后面是接龙ID
+JOIN_PREFIX = 'join_chain_'
+
+# Telegram 消息的长度上限留出余量
+MESSAGE_MAX_LENGTH = 4000
+
+# 全局接龙记录写入队列，行为 (接龙ID, 序号, 用户ID, 显示名称, 内容)
+chain_writer = BatchWriter(add_chain_entries, '接龙记录', CHAIN_FLUSH_INTERVAL_MS, CHAIN_FLUSH_MAX)
+
+
+def format_entry(seq, display_name, content):
+    """单条接龙记录在消息中的一行"""
+    return f"{seq}. {display_name} {content}".rstrip()
+
+
+def join_markup(chain_id):
+    """接龙消息下方的参与按钮"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🐉 参与接龙", callback_data=f'{JOIN_PREFIX}{chain_id}')]])
+
+
+def header_text(row):
+    text = f"🐉 接龙：{row['title']}\n"
+    if row['description']:
+        text += f"{row['description']}\n"
+    return text
+
+
+class Chain:
+    """一个进行中的接龙：按顺序追加的记录行和已参与用户，追加和查重都是 O(1)"""
+
+    def __init__(self, row, entries):
+        self.id = row['id']
+        self.group_id = row['group_id']
+        self.message_id = row['message_id']
+        self.header = header_text(row)
+        self.lines = []
+        self.users = {}
+        for entry in entries:
+            self._append(entry['seq'], entry['user_id'], entry['display_name'], entry['content'])
+        self.checked_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _append(self, seq, user_id, display_name, content):
+        # 记录行在追加时格式化一次，之后渲染只取最近的若干行
+        self.lines.append(format_entry(seq, display_name or str(user_id), content or ''))
+        self.users[user_id] = seq
+
+    def append(self, user_id, display_name, content):
+        """追加一条记录，用户已参与时返回 None，否则返回序号"""
+        if user_id in self.users:
+            return None
+        seq = len(self.lines) + 1
+        self._append(seq, user_id, display_name, content)
+        return seq
+
+    def render(self):
+        """群组消息的内容：标题、参与人数和最近的记录，耗时与接龙总长度无关"""
+        total = len(self.lines)
+        tail = self.lines[-CHAIN_RENDER_TAIL:]
+        head = f"{self.header}\n共 {total} 人参与\n\n"
+        while tail:
+            skipped = total - len(tail)
+            text = head + (f"……（前 {skipped} 条已省略）\n" if skipped else '') + "\n".join(tail)
+            if len(text) <= MESSAGE_MAX_LENGTH:
+                break
+            tail = tail[1:]
+        else:
+            text = head + ("……" if total else "还没有人参与，发送“接龙 内容”或点击下方按钮参与。")
+        return {'text': text, 'reply_markup': join_markup(self.id)}
+
+
+class ChainManager:
+    """各群组进行中的接龙，处理参与请求、请求更新群组消息，并发布和收尾接龙消息"""
+
+    def __init__(self, status_ttl=CHAIN_STATUS_TTL):
+        self.status_ttl = status_ttl
+        # 群组ID -> Chain，同一群组的更新按顺序处理，载入和追加不会并发
+        self._chains = {}
+        # 没有进行中接龙的群组，短时间内不再查询数据库
+        self._absent = TTLCache(maxsize=10000, ttl=status_ttl)
+
+    async def _load(self, group_id):
+        row = await run_db(get_active_chain, group_id)
+        if not row:
+            self._absent.set(group_id, True)
+            return None
+        entries = await run_db(get_chain_entries, row['id'])
+        if entries is None:
+            return None
+        # 加上尚未写入数据库的记录
+        written = {entry['seq'] for entry in entries}
+        for chain_id, seq, user_id, display_name, content in chain_writer.pending():
+            if chain_id == row['id'] and seq not in written:
+                entries.append({'seq': seq, 'user_id': user_id, 'display_name': display_name, 'content': content})
+        entries.sort(key=lambda entry: entry['seq'])
+        chain = self._chains[group_id] = Chain(row, entries)
+        return chain
+
+    async def get(self, group_id):
+        """获取群组进行中的接龙，定期向数据库确认接龙是否已被管理员结束"""
+        chain = self._chains.get(group_id)
+        if chain is None:
+            if self._absent.get(group_id):
+                return None
+            return await self._load(group_id)
+
+        if time.monotonic() - chain.checked_at >= self.status_ttl:
+            state = await run_db(get_chain_state, chain.id)
+            if state is not None:
+                if state['status'] != 'active':
+                    del self._chains[group_id]
+                    return None
+                if state['message_id'] != chain.message_id:
+                    # 接龙消息在发布前已有人参与，发布后补一次更新
+                    chain.message_id = state['message_id']
+                    if chain.message_id and chain.lines:
+                        message_editor.request(chain.group_id, chain.message_id, chain.render)
+                chain.checked_at = time.monotonic()
+        return chain
+
+    async def join(self, group_id, user, content='', chain_id=None):
+        """参与接龙，返回 (结果, 序号)，结果为 joined / duplicate / missing"""
+        chain = await self.get(group_id)
+        if chain is None or (chain_id is not None and chain.id != chain_id):
+            return 'missing', None
+        display_name = user.full_name[:255]
+        seq = chain.append(user.id, display_name, content)
+        if seq is None:
+            return 'duplicate', chain.users[user.id]
+
+        chain_writer.add((chain.id, seq, user.id, display_name, content))
+        if chain.message_id:
+            message_editor.request(chain.group_id, chain.message_id, chain.render, min_interval=CHAIN_EDIT_INTERVAL)
+        return 'joined', seq
+
+    def forget(self, group_id):
+        """管理员发起或结束接龙后，下次参与时重新从数据库载入"""
+        self._chains.pop(group_id, None)
+        self._absent.invalidate(group_id)
+
+    async def poll(self, context):
+        """发布新发起的接龙；接龙结束一段时间后（各进程都已停止接受参与）移除按钮并公布参与人数"""
+        closed_before = datetime.now() - timedelta(seconds=self.status_ttl + CHAIN_EDIT_INTERVAL)
+        rows = await run_db(get_chains_to_sync, closed_before)
+        if rows is None:
+            return
+
+        for row in rows:
+            if row['status'] == 'active':
+                await self._announce(context.bot, row)
+            else:
+                await self._finish(context.bot, row)
+
+    async def _announce(self, bot, row):
+        try:
+            message = await bot.send_message(
+                chat_id=row['group_id'],
+                text=header_text(row) + "\n还没有人参与，发送“接龙 内容”或点击下方按钮参与。",
+                reply_markup=join_markup(row['id'])
+            )
+        except Exception as e:
+            logger.error(f"发布接龙 {row['id']} 到群组 {row['group_id']} 失败: {e}")
+            return
+        await run_db(set_chain_message, row['id'], message.message_id)
+        logger.info(f"接龙 {row['id']} 已发布到群组 {row['group_id']}")
+
+    async def _finish(self, bot, row):
+        if row['message_id']:
+            message_editor.cancel(row['group_id'], row['message_id'])
+            try:
+                await bot.edit_message_reply_markup(
+                    chat_id=row['group_id'], message_id=row['message_id'], reply_markup=None
+                )
+                await bot.send_message(
+                    chat_id=row['group_id'],
+                    text=f"接龙「{row['title']}」已结束，共 {row['entry_count']} 人参与。",
+                    reply_to_message_id=row['message_id']
+                )
+            except Exception as e:
+                logger.error(f"更新已结束的接龙 {row['id']} 失败: {e}")
+        await run_db(mark_chain_post_closed, row['id'])
+
+
+# 全局接龙管理器
+chain_manager = ChainManager()
+
+
+def parse_chain_message(text):
+    """群组消息是接龙时返回接龙内容（可以为空），否则返回 None"""
+    text = text.strip()
+    if not text.startswith(CHAIN_KEYWORD):
+        return None
+    content = text[len(CHAIN_KEYWORD):]
+    if content and not content[0].isspace():
+        return None
+    return ' '.join(content.split())[:CHAIN_CONTENT_MAX_LENGTH]
+
+
+async def handle_chain_message(update):
+    """群组中以“接龙”开头的消息参与进行中的接龙，返回消息是否已作为接龙处理"""
+    content = parse_chain_message(update.message.text)
+    if content is None:
+        return False
+    result, _ = await chain_manager.join(update.effective_chat.id, update.effective_user, content)
+    return result != 'missing'
+
+
+async def join_callback(update, context):
+    """群组中“参与接龙”按钮的回调"""
+    query = update.callback_query
+    chain_id = int(query.data[len(JOIN_PREFIX):])
+    result, seq = await chain_manager.join(query.message.chat.id, query.from_user, chain_id=chain_id)
+    messages = {
+        'joined': f"✅ 接龙成功，您是第 {seq} 位。",
+        'duplicate': f"您已参与过该接龙，是第 {seq} 位。",
+        'missing': "该接龙已结束。",
+    }
+    await query.answer(messages[result])
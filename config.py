@@ -10,6 +10,31 @@ MAIN_BOT_USERNAME = 'TEST999kkkBot'  # 替换为您的主机器人用户名
 ADMIN_BOT_TOKEN = '7676940394:AAFAX1DEUyca_zvcXA2ODAaAUbyx_jdUnd0'  # 替换为您的管理机器人Token
 ADMIN_BOT_USERNAME = 'TEST1_SASABOT'  # 替换为您的管理机器人用户名
 
+# 更新接收配置
+UPDATE_MODE = 'polling'  # 'polling' 长轮询，'webhook' 由本地 HTTP 服务接收推送
+WEBHOOK_URL = 'https://example.com/tg'  # Telegram 推送的公网地址前缀，每个机器人使用 WEBHOOK_URL/<密钥路径>
+WEBHOOK_LISTEN = '127.0.0.1'  # 本地 HTTP 服务监听地址
+WEBHOOK_PORT = 8443  # 本地 HTTP 服务监听端口
+WEBHOOK_SECRET_TOKEN = ''  # 校验请求头 X-Telegram-Bot-Api-Secret-Token，留空时每次启动随机生成
+WEBHOOK_MAX_CONNECTIONS = 40  # 同时处理的 webhook 请求数上限，同时作为 setWebhook 的 max_connections
+WEBHOOK_MAX_BODY_SIZE = 1024 * 1024  # 单个 webhook 请求体大小上限（字节）
+BOT_API_BASE_URL = None  # 自定义 Bot API 地址（如本地模拟服务 'http://127.0.0.1:8081/bot'），None 使用官方地址
+
+# 更新并发处理配置
+UPDATE_CONCURRENCY = 64  # 每个机器人同时处理的更新数上限，同一聊天内的更新始终按顺序处理
+CHAT_QUEUE_WARN_DEPTH = 100  # 单个聊天积压的更新达到该数量时记录警告
+
+# 主机器人分片配置
+MAIN_BOT_SHARDS = 0  # 大于 0 时主机器人的更新按 chat_id 分发到该数量的工作进程处理，0 表示单进程运行
+SHARD_QUEUE_SIZE = 1000  # 每个分片待处理更新的上限，超过后暂停分发（反压）
+SHARD_MONITOR_INTERVAL = 5  # 检查分片进程存活的间隔（秒）
+SHARD_STOP_TIMEOUT = 30  # 停止时等待分片进程处理完剩余更新的时间（秒）
+
+# 停止配置
+SHUTDOWN_DRAIN_TIMEOUT = 30  # 停止时等待已接收的更新处理完成的最长时间（秒）
+SHUTDOWN_STEP_TIMEOUT = 30  # 其他停止步骤（写入缓冲数据、关闭连接等）的最长时间（秒）
+LIFECYCLE_STATE_FILE = 'last_shutdown.txt'  # 记录上次停止的时间，用于统计重启到收到第一条更新的耗时
+
 # 数据库配置
 DB_HOST = 'localhost'
 DB_USER = 'root'
@@ -17,6 +42,105 @@ DB_PASSWORD = '123456'
 DB_PORT = 3306
 DB_NAME = 'tg_bot_db'
 
+# 数据库连接池配置
+DB_POOL_SIZE = 10  # 连接池最大连接数
+DB_POOL_TIMEOUT = 10  # 等待空闲连接的超时时间（秒）
+DB_POOL_PING_INTERVAL = 30  # 连接空闲超过该时间（秒）后取出时先 ping 检查
+DB_EXECUTOR_WORKERS = DB_POOL_SIZE  # 异步数据库访问线程数，不超过连接池大小
+
+# 缓存配置
+GROUP_CONFIG_CACHE_SIZE = 2048  # 群组配置缓存最多保存的群组数
+GROUP_CONFIG_CACHE_TTL = 300  # 群组配置缓存过期时间（秒）
+MEMBER_STATUS_CACHE_SIZE = 10000  # 群成员状态缓存最多保存的 (群组, 用户) 数
+MEMBER_STATUS_CACHE_TTL = 60  # 群成员状态缓存过期时间（秒）
+
+# 发言积分批量写入配置
+MESSAGE_POINTS_FLUSH_INTERVAL_MS = 2000  # 定时写入间隔（毫秒）
+MESSAGE_POINTS_FLUSH_MAX_EVENTS = 500  # 累计发言数达到该值时立即写入
+
+# 积分排行配置
+LEADERBOARD_RECONCILE_INTERVAL = 600  # 内存排行与数据库增量校对的间隔（秒）
+LEADERBOARD_RECONCILE_OVERLAP = 60  # 增量校对时检查点向前多取的时间（秒）
+LEADERBOARD_FULL_RECONCILE_INTERVAL = 86400  # 完整重新加载排行的间隔（秒）
+
+# 反刷屏配置
+ANTIFLOOD_MAX_TRACKED = 100000  # 内存中最多记录的 (群组, 用户) 数
+ANTIFLOOD_IDLE_TTL = 300  # 用户超过该时间未发言后回收其记录（秒）
+ANTIFLOOD_LIMIT_CHOICES = (3, 5, 10, 20)  # 管理员可选的消息条数上限
+ANTIFLOOD_WINDOW_CHOICES = (5, 10, 30, 60)  # 管理员可选的统计时间窗口（秒）
+ANTIFLOOD_MUTE_CHOICES = (60, 300, 3600)  # 管理员可选的禁言时长（秒）
+
+# 反垃圾配置
+ANTISPAM_WINDOW = 600  # 近似消息的比对时间范围（秒）
+ANTISPAM_INDEX_SIZE = 256  # 每个群组保留的最近消息签名数
+ANTISPAM_MAX_GROUPS = 10000  # 内存中最多保留索引的群组数
+ANTISPAM_MIN_LENGTH = 20  # 有效字符少于该数量的消息不做近似比对
+ANTISPAM_SIMILARITY = 0.5  # 两条消息字符 2-gram 集合的相似度（MinHash 估计）不低于该值视为近似内容
+ANTISPAM_MIN_USERS = 3  # 至少这么多不同用户发送近似内容时判为垃圾消息
+ANTISPAM_LINK_WINDOW = 60  # 链接计数的时间窗口（秒）
+ANTISPAM_LINK_LIMIT = 5  # 时间窗口内同一用户发送同一域名的链接达到该数量时判为刷链接
+ANTISPAM_LINK_ALLOWED_DOMAINS = ()  # 不计入刷链接检测的域名（包括其子域名），如 ('youtube.com',)
+
+# 违禁词配置
+BANNED_WORDS_RELOAD_INTERVAL = 10  # 检查违禁词版本变化的间隔（秒）
+BANNED_WORDS_MAX_FILE_SIZE = 1024 * 1024  # 批量导入违禁词文件的大小上限（字节）
+
+# 自动回复配置
+AUTO_REPLY_RELOAD_INTERVAL = 10  # 检查自动回复规则版本变化的间隔（秒）
+AUTO_REPLY_DEFAULT_COOLDOWN = 30  # 新规则的默认冷却时间（秒），冷却中的规则不会再次回复
+AUTO_REPLY_REGEX_MAX_LENGTH = 200  # 正则规则的最大长度（字符）
+AUTO_REPLY_REGEX_MAX_TEXT = 500  # 正则规则只匹配消息的前这么多个字符，限制单条消息的匹配耗时
+
+# 定时消息配置
+SCHEDULE_TICK_INTERVAL = 1  # 检查到期定时消息的间隔（秒）
+SCHEDULE_LOAD_HORIZON = 600  # 只把该时间内到期的定时消息载入内存（秒）
+SCHEDULE_RELOAD_INTERVAL = 30  # 重新从数据库载入定时消息的间隔（秒）
+SCHEDULE_MISFIRE_GRACE = 300  # 停机期间错过的触发时间在该时间内仍会补发（秒）
+SCHEDULE_CHAT_MIN_INTERVAL = 3  # 同一群组两条定时消息之间的最小间隔（秒）
+SCHEDULE_SENDS_PER_TICK = 20  # 每次检查最多发送的定时消息数
+SCHEDULE_MIN_INTERVAL = 60  # 管理员可设置的最小发送间隔（秒）
+
+# 抽奖配置
+LOTTERY_POLL_INTERVAL = 10  # 检查新抽奖并安排开奖的间隔（秒）
+LOTTERY_SCHEDULE_HORIZON = 86400  # 只为该时间内开奖的抽奖创建开奖任务（秒）
+LOTTERY_CACHE_SIZE = 1000  # 缓存参与者的抽奖数
+LOTTERY_CACHE_TTL = 300  # 参与者缓存的有效期（秒），过期后从数据库重新载入
+LOTTERY_JOIN_FLUSH_INTERVAL_MS = 1000  # 抽奖参与者定时批量写入的间隔（毫秒）
+LOTTERY_JOIN_FLUSH_MAX = 500  # 累计参与者达到该数量时立即写入
+LOTTERY_COUNT_EDIT_INTERVAL = 5  # 抽奖消息中的参与人数最多每隔该时间更新一次（秒）
+
+# 积分抽奖配置
+POINTS_LOTTERY_TICKET_CHOICES = (1, 5)  # 群组消息中购买按钮的张数
+POINTS_LOTTERY_DEFAULT_MAX_TICKETS = 100  # 未指定时每人最多购买的抽奖券数
+
+# 接龙配置
+CHAIN_KEYWORD = '接龙'  # 以该词开头的群组消息参与接龙，后面的文字为接龙内容
+CHAIN_CONTENT_MAX_LENGTH = 50  # 每条接龙内容的最大长度
+CHAIN_RENDER_TAIL = 30  # 群组消息中显示最近的接龙条数
+CHAIN_EDIT_INTERVAL = 3  # 接龙消息最多每隔该时间更新一次（秒）
+CHAIN_STATUS_TTL = 10  # 内存中的接龙每隔该时间向数据库确认一次是否已结束（秒）
+CHAIN_POLL_INTERVAL = 10  # 检查新发起和已结束接龙的间隔（秒）
+CHAIN_FLUSH_INTERVAL_MS = 1000  # 接龙记录定时批量写入的间隔（毫秒）
+CHAIN_FLUSH_MAX = 500  # 累计接龙记录达到该数量时立即写入
+
+# 群组统计配置
+STATS_FLUSH_INTERVAL = 60  # 内存中的统计计数写入汇总表的间隔（秒）
+STATS_HLL_PRECISION = 11  # 活跃用户 HyperLogLog 的精度，2^11 个寄存器，标准误差约 2.3%
+STATS_HOURLY_RETENTION_DAYS = 35  # 按小时汇总的统计保留天数
+STATS_HLL_RETENTION_DAYS = 35  # 每日活跃用户 HyperLogLog 的保留天数，之后只保留估算人数
+STATS_PRUNE_INTERVAL = 3600  # 清理过期统计的间隔（秒）
+
+# 消息编辑合并配置
+MESSAGE_EDIT_FLUSH_INTERVAL = 1  # 检查待编辑消息的间隔（秒）
+MESSAGE_EDIT_CHAT_MIN_INTERVAL = 3  # 同一群组两次编辑消息之间的最小间隔（秒）
+MESSAGE_EDITS_PER_FLUSH = 20  # 每次检查最多编辑的消息数
+
+# 积分历史保留配置
+POINTS_HISTORY_RETENTION_CHOICES = (30, 90, 180, 365)  # 管理菜单中可选的明细保留天数
+POINTS_HISTORY_MAX_RETENTION_DAYS = 365  # 超过该天数的月分区汇总后整体删除
+POINTS_HISTORY_PARTITIONS_AHEAD = 2  # 提前创建的未来月分区数
+POINTS_HISTORY_RETENTION_INTERVAL = 86400  # 保留任务执行间隔（秒）
+
 # 日志配置
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'bot.log'
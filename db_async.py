@@ -0,0 +1,43 @@
+"""
+异步数据库访问模块，在独立的有界线程池中执行同步数据库操作，避免阻塞事件循环
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from config import DB_EXECUTOR_WORKERS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """获取数据库专用线程池（首次调用时创建）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS,
+                    thread_name_prefix='db'
+                )
+    return _executor
+
+
+async def run_db(func, *args, **kwargs):
+    """在数据库线程池中执行同步数据库函数并等待结果"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor(wait=True):
+    """关闭数据库线程池，wait=True 时等待已提交的任务完成"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+        logger.info("数据库线程池已关闭")
@@ -1,26 +1,138 @@
+from contextlib import contextmanager
+from datetime import date
 import pymysql
 from loguru import logger
-from config import DB_HOST, DB_USER, DB_PASSWORD, DB_PORT, DB_NAME
+from cache import TTLCache
+from config import GROUP_CONFIG_CACHE_SIZE, GROUP_CONFIG_CACHE_TTL
+from db_pool import get_connection
+from leaderboard import points_leaderboard
+
+# 群组配置缓存，同一进程内的主机器人和管理机器人共用这一个实例
+group_config_cache = TTLCache(maxsize=GROUP_CONFIG_CACHE_SIZE, ttl=GROUP_CONFIG_CACHE_TTL)
 
 def get_db_connection():
-    """获取数据库连接"""
-    try:
-        conn = pymysql.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT,
-            database=DB_NAME,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        return conn
-    except Exception as e:
-        logger.error(f"数据库连接失败: {e}")
-        return None
+    """从连接池获取数据库连接"""
+    return get_connection()
+
+def get_group_config_cache():
+    """获取群组配置缓存实例"""
+    return group_config_cache
+
+class Rollback(Exception):
+    """在 transaction() 中抛出以回滚事务，异常本身不会向外传播"""
+
+@contextmanager
+def transaction():
+    """工作单元：在同一个连接上执行一个事务，正常结束时提交，出现异常时回滚"""
+    conn = get_db_connection()
+    if not conn:
+        raise pymysql.err.OperationalError("无法获取数据库连接")
+    
+    cursor = conn.cursor()
+    cursor.on_commit = []
+    try:
+        yield cursor
+        conn.commit()
+        _run_on_commit(cursor.on_commit)
+    except Rollback:
+        conn.rollback()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def on_commit(cursor, callback):
+    """注册事务提交成功后执行的回调，用于同步内存中的数据"""
+    cursor.on_commit.append(callback)
+
+def _run_on_commit(callbacks):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"执行事务提交回调失败: {e}")
+
+# 事务内的积分变动操作，调用方负责提供 transaction() 中的 cursor
+def credit_points(cursor, group_id, user_id, points, reason=None, admin_id=None):
+    """在当前事务中增加用户积分并记录历史"""
+    # 单条语句插入或累加积分，并发时由唯一键 group_user 保证正确
+    affected = cursor.execute(
+        "INSERT INTO user_points (group_id, user_id, points) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE points = points + VALUES(points)",
+        (group_id, user_id, points)
+    )
+    
+    # 插入返回1，更新返回2，积分有变化时不应为0
+    if affected == 0 and points:
+        return False
+    
+    # 记录积分变动历史
+    cursor.execute(
+        "INSERT INTO points_history (group_id, user_id, points_change, reason, admin_id) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        (group_id, user_id, points, reason, admin_id)
+    )
+    on_commit(cursor, lambda: points_leaderboard.apply_delta(group_id, user_id, points))
+    return True
+
+def credit_points_bulk(cursor, rows, reason=None):
+    """在当前事务中批量增加积分，rows 为 (group_id, user_id, points) 列表"""
+    if not rows:
+        return
+    cursor.executemany(
+        "INSERT INTO user_points (group_id, user_id, points) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE points = points + VALUES(points)",
+        rows
+    )
+    cursor.executemany(
+        "INSERT INTO points_history (group_id, user_id, points_change, reason) "
+        "VALUES (%s, %s, %s, %s)",
+        [tuple(row) + (reason,) for row in rows]
+    )
+    
+    def apply_to_leaderboard():
+        for group_id, user_id, points in rows:
+            points_leaderboard.apply_delta(group_id, user_id, points)
+    on_commit(cursor, apply_to_leaderboard)
+
+def debit_points(cursor, group_id, user_id, points, reason=None, admin_id=None):
+    """在当前事务中扣除用户积分并记录历史，积分不足时返回 False"""
+    # 条件更新：只有积分足够时才扣除，用户不存在或积分不足时影响行数为0
+    affected = cursor.execute(
+        "UPDATE user_points SET points = points - %s "
+        "WHERE group_id = %s AND user_id = %s AND points >= %s",
+        (points, group_id, user_id, points)
+    )
+    if affected == 0:
+        return False
+    
+    # 记录积分变动历史
+    cursor.execute(
+        "INSERT INTO points_history (group_id, user_id, points_change, reason, admin_id) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        (group_id, user_id, -points, reason, admin_id)
+    )
+    on_commit(cursor, lambda: points_leaderboard.apply_delta(group_id, user_id, -points))
+    return True
 
 # 群组配置相关操作
 def get_group_config_db(group_id):
+    """获取群组配置，优先读取缓存"""
+    key = str(group_id)
+    cached = group_config_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+    
+    # 读取期间管理员修改了配置（update_group_config_db 提交后使缓存失效）时不写入读到的旧配置
+    generation = group_config_cache.generation(key)
+    config = _load_group_config_db(group_id)
+    if config:
+        group_config_cache.set(key, config, generation=generation)
+    return dict(config)
+
+def _load_group_config_db(group_id):
     """从数据库获取群组配置"""
     conn = get_db_connection()
     if not conn:
@@ -79,11 +191,13 @@ def update_group_config_db(group_id, key, value):
     cursor = conn.cursor()
     try:
         # 确定更新哪个表
-        if key in ['group_name', 'welcome_msg', 'language', 'anti_spam', 'auto_delete']:
+        if key in ['group_name', 'welcome_msg', 'language', 'anti_spam', 'auto_delete',
+                   'antiflood_enabled', 'antiflood_limit', 'antiflood_window',
+                   'antiflood_action', 'antiflood_mute_seconds']:
             table = 'group_configs'
         elif key in ['points_enabled', 'checkin_points', 'message_points', 'daily_message_limit', 
                     'min_message_length', 'invite_points', 'daily_invite_limit', 
-                    'points_alias', 'ranking_alias']:
+                    'points_alias', 'ranking_alias', 'history_retention_days']:
             table = 'points_configs'
         else:
             logger.error(f"未知的配置键: {key}")
@@ -137,6 +251,8 @@ def update_group_config_db(group_id, key, value):
         logger.error(f"更新群组配置失败: {e}")
         return False
     finally:
+        # 写入后使缓存失效，下次读取时重新加载
+        group_config_cache.invalidate(str(group_id))
         cursor.close()
         conn.close()
 
@@ -164,92 +280,36 @@ def get_user_points(group_id, user_id):
 
 def add_user_points(group_id, user_id, points, reason=None, admin_id=None):
     """增加用户积分"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-    
-    cursor = conn.cursor()
     try:
-        # 检查用户是否存在
-        cursor.execute(
-            "SELECT points FROM user_points WHERE group_id = %s AND user_id = %s",
-            (group_id, user_id)
-        )
-        user_exists = cursor.fetchone()
-        
-        if user_exists:
-            # 更新积分
-            cursor.execute(
-                "UPDATE user_points SET points = points + %s WHERE group_id = %s AND user_id = %s",
-                (points, group_id, user_id)
-            )
-        else:
-            # 插入新记录
-            cursor.execute(
-                "INSERT INTO user_points (group_id, user_id, points) VALUES (%s, %s, %s)",
-                (group_id, user_id, points)
-            )
-        
-        # 记录积分变动历史
-        cursor.execute(
-            "INSERT INTO points_history (group_id, user_id, points_change, reason, admin_id) "
-            "VALUES (%s, %s, %s, %s, %s)",
-            (group_id, user_id, points, reason, admin_id)
-        )
-        
-        conn.commit()
-        return True
+        with transaction() as cursor:
+            if not credit_points(cursor, group_id, user_id, points, reason, admin_id):
+                raise Rollback()
+            return True
+        return False
     except Exception as e:
-        conn.rollback()
         logger.error(f"增加用户积分失败: {e}")
         return False
-    finally:
-        cursor.close()
-        conn.close()
 
 def deduct_user_points(group_id, user_id, points, reason=None, admin_id=None):
     """扣除用户积分"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-    
-    cursor = conn.cursor()
     try:
-        # 检查用户是否存在且积分是否足够
-        cursor.execute(
-            "SELECT points FROM user_points WHERE group_id = %s AND user_id = %s",
-            (group_id, user_id)
-        )
-        user_points = cursor.fetchone()
-        
-        if not user_points or user_points['points'] < points:
-            return False
-        
-        # 更新积分
-        cursor.execute(
-            "UPDATE user_points SET points = points - %s WHERE group_id = %s AND user_id = %s",
-            (points, group_id, user_id)
-        )
-        
-        # 记录积分变动历史
-        cursor.execute(
-            "INSERT INTO points_history (group_id, user_id, points_change, reason, admin_id) "
-            "VALUES (%s, %s, %s, %s, %s)",
-            (group_id, user_id, -points, reason, admin_id)
-        )
-        
-        conn.commit()
-        return True
+        with transaction() as cursor:
+            if not debit_points(cursor, group_id, user_id, points, reason, admin_id):
+                raise Rollback()
+            return True
+        return False
     except Exception as e:
-        conn.rollback()
         logger.error(f"扣除用户积分失败: {e}")
         return False
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_points_ranking(group_id, limit=10):
-    """获取积分排行榜"""
+    """获取积分排行榜，排行已加载到内存时直接读取内存索引"""
+    if points_leaderboard.loaded:
+        try:
+            return points_leaderboard.top(group_id, limit)
+        except Exception as e:
+            logger.error(f"读取内存积分排行失败: {e}")
+    
     conn = get_db_connection()
     if not conn:
         return []
@@ -269,184 +329,1046 @@ def get_points_ranking(group_id, limit=10):
         cursor.close()
         conn.close()
 
-def clear_group_points(group_id):
-    """清空群组所有用户的积分"""
+def get_user_rank(group_id, user_id):
+    """获取用户的积分和名次，没有积分记录时返回 None"""
+    if points_leaderboard.loaded:
+        try:
+            return points_leaderboard.user_rank(group_id, user_id)
+        except Exception as e:
+            logger.error(f"读取内存积分排行失败: {e}")
+    
     conn = get_db_connection()
     if not conn:
-        return False
+        return None
     
     cursor = conn.cursor()
     try:
-        # 删除用户积分记录
-        cursor.execute("DELETE FROM user_points WHERE group_id = %s", (group_id,))
-        
-        # 记录清空操作到历史记录
         cursor.execute(
-            "INSERT INTO points_history (group_id, user_id, points_change, reason) "
-            "VALUES (%s, %s, %s, %s)",
-            (group_id, 0, 0, "清空群组积分")
+            "SELECT points FROM user_points WHERE group_id = %s AND user_id = %s",
+            (group_id, user_id)
         )
+        result = cursor.fetchone()
+        if not result:
+            return None
         
-        conn.commit()
-        return True
+        cursor.execute(
+            "SELECT COUNT(*) AS higher FROM user_points WHERE group_id = %s AND points > %s",
+            (group_id, result['points'])
+        )
+        return {'rank': cursor.fetchone()['higher'] + 1, 'points': result['points']}
     except Exception as e:
-        conn.rollback()
-        logger.error(f"清空群组积分失败: {e}")
-        return False
+        logger.error(f"获取用户积分排名失败: {e}")
+        return None
     finally:
         cursor.close()
         conn.close()
 
+def clear_group_points(group_id):
+    """清空群组所有用户的积分"""
+    try:
+        with transaction() as cursor:
+            # 删除用户积分记录
+            cursor.execute("DELETE FROM user_points WHERE group_id = %s", (group_id,))
+            
+            # 记录清空操作到历史记录
+            cursor.execute(
+                "INSERT INTO points_history (group_id, user_id, points_change, reason) "
+                "VALUES (%s, %s, %s, %s)",
+                (group_id, 0, 0, "清空群组积分")
+            )
+            on_commit(cursor, lambda: points_leaderboard.clear_group(group_id))
+            return True
+    except Exception as e:
+        logger.error(f"清空群组积分失败: {e}")
+        return False
+
 # 签到相关操作
 def record_user_checkin(group_id, user_id, points):
-    """记录用户签到"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-    
-    cursor = conn.cursor()
+    """记录用户签到，签到记录和积分在同一个事务中写入"""
     try:
-        # 检查今日是否已签到
-        cursor.execute(
-            "SELECT 1 FROM checkin_records WHERE group_id = %s AND user_id = %s AND checkin_date = CURDATE()",
-            (group_id, user_id)
-        )
-        already_checked_in = cursor.fetchone()
-        
-        if already_checked_in:
-            return False
-        
-        # 记录签到
-        cursor.execute(
-            "INSERT INTO checkin_records (group_id, user_id, checkin_date, points_earned) "
-            "VALUES (%s, %s, CURDATE(), %s)",
-            (group_id, user_id, points)
-        )
-        
-        # 增加用户积分
-        add_user_points(group_id, user_id, points, "每日签到")
-        
-        conn.commit()
-        return True
+        with transaction() as cursor:
+            # 唯一键 group_user_date 保证每日只能签到一次，已签到时影响行数为0
+            inserted = cursor.execute(
+                "INSERT IGNORE INTO checkin_records (group_id, user_id, checkin_date, points_earned) "
+                "VALUES (%s, %s, CURDATE(), %s)",
+                (group_id, user_id, points)
+            )
+            if not inserted:
+                raise Rollback()
+            
+            # 增加用户积分
+            credit_points(cursor, group_id, user_id, points, "每日签到")
+            return True
+        return False
     except Exception as e:
-        conn.rollback()
         logger.error(f"记录用户签到失败: {e}")
         return False
-    finally:
-        cursor.close()
-        conn.close()
 
 # 发言积分相关操作
 def record_message_points(group_id, user_id, points):
-    """记录用户发言积分"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-    
-    cursor = conn.cursor()
+    """记录用户发言积分，发言记录和积分在同一个事务中写入"""
+    # 与发言积分批量写入使用同一个时钟（本进程的日期），避免与数据库时区不一致时每日上限错位
+    today = date.today()
     try:
-        # 检查今日是否已有记录
-        cursor.execute(
-            "SELECT points_earned, message_count FROM message_points_records "
-            "WHERE group_id = %s AND user_id = %s AND message_date = CURDATE()",
-            (group_id, user_id)
-        )
-        today_record = cursor.fetchone()
-        
-        # 获取每日上限
-        cursor.execute(
-            "SELECT daily_message_limit FROM points_configs WHERE group_id = %s",
-            (group_id,)
-        )
-        config = cursor.fetchone()
-        daily_limit = config['daily_message_limit'] if config else 0
-        
-        # 检查是否达到每日上限
-        if today_record:
-            if daily_limit > 0 and today_record['points_earned'] >= daily_limit:
-                return False
+        with transaction() as cursor:
+            # 锁定今日记录，避免并发时超过每日上限
+            cursor.execute(
+                "SELECT points_earned FROM message_points_records "
+                "WHERE group_id = %s AND user_id = %s AND message_date = %s FOR UPDATE",
+                (group_id, user_id, today)
+            )
+            today_record = cursor.fetchone()
             
-            # 更新记录
+            # 获取每日上限
             cursor.execute(
-                "UPDATE message_points_records SET points_earned = points_earned + %s, "
-                "message_count = message_count + 1 WHERE group_id = %s AND user_id = %s AND message_date = CURDATE()",
-                (points, group_id, user_id)
+                "SELECT daily_message_limit FROM points_configs WHERE group_id = %s",
+                (group_id,)
             )
-        else:
-            # 创建新记录
+            config = cursor.fetchone()
+            daily_limit = config['daily_message_limit'] if config else 0
+            
+            # 检查是否达到每日上限
+            if today_record and daily_limit > 0 and today_record['points_earned'] >= daily_limit:
+                raise Rollback()
+            
+            # 创建或更新今日记录
             cursor.execute(
                 "INSERT INTO message_points_records (group_id, user_id, message_date, points_earned, message_count) "
-                "VALUES (%s, %s, CURDATE(), %s, 1)",
-                (group_id, user_id, points)
+                "VALUES (%s, %s, %s, %s, 1) "
+                "ON DUPLICATE KEY UPDATE points_earned = points_earned + VALUES(points_earned), "
+                "message_count = message_count + 1",
+                (group_id, user_id, today, points)
             )
-        
-        # 增加用户积分
-        add_user_points(group_id, user_id, points, "发言奖励")
-        
-        conn.commit()
-        return True
+            
+            # 增加用户积分
+            credit_points(cursor, group_id, user_id, points, "发言奖励")
+            return True
+        return False
     except Exception as e:
-        conn.rollback()
         logger.error(f"记录发言积分失败: {e}")
         return False
+
+# 邀请积分相关操作
+def record_invite_points(group_id, inviter_id, invitee_id, points):
+    """记录邀请积分，邀请记录和积分在同一个事务中写入"""
+    try:
+        with transaction() as cursor:
+            # 获取每日上限
+            cursor.execute(
+                "SELECT daily_invite_limit FROM points_configs WHERE group_id = %s",
+                (group_id,)
+            )
+            config = cursor.fetchone()
+            daily_limit = config['daily_invite_limit'] if config else 0
+            
+            # 检查今日邀请数量是否达到上限
+            if daily_limit > 0:
+                cursor.execute(
+                    "SELECT COUNT(*) as invite_count FROM invite_points_records "
+                    "WHERE group_id = %s AND inviter_id = %s AND invite_date = CURDATE() FOR UPDATE",
+                    (group_id, inviter_id)
+                )
+                today_count = cursor.fetchone()
+                if today_count and today_count['invite_count'] >= daily_limit:
+                    raise Rollback()
+            
+            # 记录邀请，唯一键保证同一邀请只记录一次
+            inserted = cursor.execute(
+                "INSERT IGNORE INTO invite_points_records (group_id, inviter_id, invitee_id, invite_date, points_earned) "
+                "VALUES (%s, %s, %s, CURDATE(), %s)",
+                (group_id, inviter_id, invitee_id, points)
+            )
+            if not inserted:
+                raise Rollback()
+            
+            # 增加用户积分
+            credit_points(cursor, group_id, inviter_id, points, "邀请新成员")
+            return True
+        return False
+    except Exception as e:
+        logger.error(f"记录邀请积分失败: {e}")
+        return False
+
+# 违禁词相关操作
+def _bump_banned_words_version(cursor, group_id):
+    """违禁词变化后递增群组版本号，各进程据此重新加载"""
+    cursor.execute(
+        "INSERT INTO banned_words_versions (group_id, version) VALUES (%s, 1) "
+        "ON DUPLICATE KEY UPDATE version = version + 1",
+        (group_id,)
+    )
+
+def get_banned_words(group_id):
+    """获取群组的违禁词列表，失败时返回 None（避免加载失败时清空内存中的违禁词）"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT word FROM banned_words WHERE group_id = %s ORDER BY id", (group_id,))
+        return [row['word'] for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"获取违禁词失败: {e}")
+        return None
     finally:
         cursor.close()
         conn.close()
 
-# 邀请积分相关操作
-def record_invite_points(group_id, inviter_id, invitee_id, points):
-    """记录邀请积分"""
+def get_banned_word_versions():
+    """获取所有群组的违禁词版本号 {群组ID: 版本号}，失败时返回 None"""
     conn = get_db_connection()
     if not conn:
-        return False
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT group_id, version FROM banned_words_versions")
+        return {row['group_id']: row['version'] for row in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"获取违禁词版本失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def add_banned_words(group_id, words, admin_id=None):
+    """批量添加违禁词，已存在的忽略，返回新增数量，失败时返回 None"""
+    rows = [(group_id, word, admin_id) for word in words]
+    if not rows:
+        return 0
+    try:
+        with transaction() as cursor:
+            added = cursor.executemany(
+                "INSERT IGNORE INTO banned_words (group_id, word, created_by) VALUES (%s, %s, %s)",
+                rows
+            )
+            if added:
+                _bump_banned_words_version(cursor, group_id)
+            return added
+    except Exception as e:
+        logger.error(f"添加违禁词失败: {e}")
+        return None
+
+def remove_banned_words(group_id, words):
+    """批量删除违禁词，返回删除数量，失败时返回 None"""
+    if not words:
+        return 0
+    try:
+        with transaction() as cursor:
+            placeholders = ', '.join(['%s'] * len(words))
+            removed = cursor.execute(
+                f"DELETE FROM banned_words WHERE group_id = %s AND word IN ({placeholders})",
+                [group_id, *words]
+            )
+            if removed:
+                _bump_banned_words_version(cursor, group_id)
+            return removed
+    except Exception as e:
+        logger.error(f"删除违禁词失败: {e}")
+        return None
+
+def _bump_auto_replies_version(cursor, group_id):
+    """自动回复规则变化后递增群组版本号，各进程据此重新编译"""
+    cursor.execute(
+        "INSERT INTO auto_replies_versions (group_id, version) VALUES (%s, 1) "
+        "ON DUPLICATE KEY UPDATE version = version + 1",
+        (group_id,)
+    )
+
+def get_auto_replies(group_id):
+    """获取群组的自动回复规则，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
     
     cursor = conn.cursor()
     try:
-        # 检查是否已记录过该邀请
-        cursor.execute(
-            "SELECT 1 FROM invite_points_records WHERE group_id = %s AND inviter_id = %s AND invitee_id = %s",
-            (group_id, inviter_id, invitee_id)
-        )
-        already_recorded = cursor.fetchone()
-        
-        if already_recorded:
-            return False
-        
-        # 获取每日上限
         cursor.execute(
-            "SELECT daily_invite_limit FROM points_configs WHERE group_id = %s",
+            "SELECT id, match_type, pattern, reply, cooldown FROM auto_replies WHERE group_id = %s ORDER BY id",
             (group_id,)
         )
-        config = cursor.fetchone()
-        daily_limit = config['daily_invite_limit'] if config else 0
-        
-        # 检查今日邀请数量是否达到上限
-        if daily_limit > 0:
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取自动回复规则失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_auto_reply_versions():
+    """获取所有群组的自动回复规则版本号 {群组ID: 版本号}，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT group_id, version FROM auto_replies_versions")
+        return {row['group_id']: row['version'] for row in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"获取自动回复版本失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def add_auto_reply(group_id, match_type, pattern, reply, cooldown, admin_id=None):
+    """添加或覆盖同类型同关键词的自动回复规则，成功返回 True"""
+    try:
+        with transaction() as cursor:
             cursor.execute(
-                "SELECT COUNT(*) as invite_count FROM invite_points_records "
-                "WHERE group_id = %s AND inviter_id = %s AND invite_date = CURDATE()",
-                (group_id, inviter_id)
+                "INSERT INTO auto_replies (group_id, match_type, pattern, reply, cooldown, created_by) "
+                "VALUES (%s, %s, %s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE reply = VALUES(reply), cooldown = VALUES(cooldown)",
+                (group_id, match_type, pattern, reply, cooldown, admin_id)
             )
-            today_count = cursor.fetchone()
-            if today_count and today_count['invite_count'] >= daily_limit:
-                return False
-        
-        # 记录邀请
-        cursor.execute(
-            "INSERT INTO invite_points_records (group_id, inviter_id, invitee_id, invite_date, points_earned) "
-            "VALUES (%s, %s, %s, CURDATE(), %s)",
-            (group_id, inviter_id, invitee_id, points)
-        )
-        
-        # 增加用户积分
-        add_user_points(group_id, inviter_id, points, "邀请新成员")
-        
-        conn.commit()
+            _bump_auto_replies_version(cursor, group_id)
         return True
     except Exception as e:
-        conn.rollback()
-        logger.error(f"记录邀请积分失败: {e}")
+        logger.error(f"添加自动回复规则失败: {e}")
         return False
-    finally:
+
+def delete_auto_replies(group_id, rule_ids):
+    """按编号删除群组的自动回复规则，返回删除数量，失败时返回 None"""
+    if not rule_ids:
+        return 0
+    try:
+        with transaction() as cursor:
+            placeholders = ', '.join(['%s'] * len(rule_ids))
+            removed = cursor.execute(
+                f"DELETE FROM auto_replies WHERE group_id = %s AND id IN ({placeholders})",
+                [group_id, *rule_ids]
+            )
+            if removed:
+                _bump_auto_replies_version(cursor, group_id)
+            return removed
+    except Exception as e:
+        logger.error(f"删除自动回复规则失败: {e}")
+        return None
+
+def get_due_scheduled_messages(until):
+    """获取 until 之前到期的已启用定时消息，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, group_id, text, schedule_type, interval_seconds, cron, next_run_at "
+            "FROM scheduled_messages WHERE enabled = TRUE AND next_run_at <= %s",
+            (until,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取到期定时消息失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def update_scheduled_next_runs(updates):
+    """批量更新定时消息的下一次触发时间，updates 为 [(下一次触发时间, 定时消息ID)]"""
+    if not updates:
+        return True
+    try:
+        with transaction() as cursor:
+            cursor.executemany("UPDATE scheduled_messages SET next_run_at = %s WHERE id = %s", updates)
+        return True
+    except Exception as e:
+        logger.error(f"更新定时消息触发时间失败: {e}")
+        return False
+
+def disable_scheduled_messages(schedule_ids):
+    """停用定时消息，例如机器人已被移出群组"""
+    if not schedule_ids:
+        return True
+    try:
+        with transaction() as cursor:
+            placeholders = ', '.join(['%s'] * len(schedule_ids))
+            cursor.execute(
+                f"UPDATE scheduled_messages SET enabled = FALSE WHERE id IN ({placeholders})",
+                list(schedule_ids)
+            )
+        return True
+    except Exception as e:
+        logger.error(f"停用定时消息失败: {e}")
+        return False
+
+def get_scheduled_messages(group_id):
+    """获取群组的全部定时消息，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, text, schedule_type, interval_seconds, cron, next_run_at, enabled "
+            "FROM scheduled_messages WHERE group_id = %s ORDER BY id",
+            (group_id,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取定时消息失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def add_scheduled_message(group_id, text, schedule_type, interval_seconds, cron, next_run_at, admin_id=None):
+    """添加定时消息，返回新定时消息的ID，失败时返回 None"""
+    try:
+        with transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO scheduled_messages "
+                "(group_id, text, schedule_type, interval_seconds, cron, next_run_at, created_by) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (group_id, text, schedule_type, interval_seconds, cron, next_run_at, admin_id)
+            )
+            return cursor.lastrowid
+    except Exception as e:
+        logger.error(f"添加定时消息失败: {e}")
+        return None
+
+def delete_scheduled_messages(group_id, schedule_ids):
+    """按编号删除群组的定时消息，返回删除数量，失败时返回 None"""
+    if not schedule_ids:
+        return 0
+    try:
+        with transaction() as cursor:
+            placeholders = ', '.join(['%s'] * len(schedule_ids))
+            return cursor.execute(
+                f"DELETE FROM scheduled_messages WHERE group_id = %s AND id IN ({placeholders})",
+                [group_id, *schedule_ids]
+            )
+    except Exception as e:
+        logger.error(f"删除定时消息失败: {e}")
+        return None
+
+def create_lottery(group_id, title, description, prize_count, end_time, admin_id=None):
+    """创建抽奖，返回抽奖ID，失败时返回 None"""
+    try:
+        with transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO lotteries (group_id, title, description, prize_count, end_time, created_by) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                (group_id, title, description, prize_count, end_time, admin_id)
+            )
+            return cursor.lastrowid
+    except Exception as e:
+        logger.error(f"创建抽奖失败: {e}")
+        return None
+
+def get_lottery(lottery_id):
+    """获取抽奖信息，不存在或失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, group_id, title, description, prize_count, end_time, status, message_id "
+            "FROM lotteries WHERE id = %s",
+            (lottery_id,)
+        )
+        return cursor.fetchone()
+    except Exception as e:
+        logger.error(f"获取抽奖信息失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_schedulable_lotteries(until):
+    """获取尚未发布或将在 until 之前开奖的未开奖抽奖，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, group_id, title, description, prize_count, end_time, message_id FROM lotteries "
+            "WHERE status = 'pending' AND (message_id IS NULL OR end_time <= %s)",
+            (until,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取待开奖抽奖失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def set_lottery_message(lottery_id, message_id):
+    """记录抽奖在群组中的消息ID"""
+    try:
+        with transaction() as cursor:
+            cursor.execute("UPDATE lotteries SET message_id = %s WHERE id = %s", (message_id, lottery_id))
+        return True
+    except Exception as e:
+        logger.error(f"记录抽奖消息失败: {e}")
+        return False
+
+def end_lottery_now(group_id, lottery_id):
+    """把未开奖抽奖的开奖时间提前到现在，由主机器人尽快开奖"""
+    try:
+        with transaction() as cursor:
+            return cursor.execute(
+                "UPDATE lotteries SET end_time = NOW() WHERE id = %s AND group_id = %s AND status = 'pending'",
+                (lottery_id, group_id)
+            ) > 0
+    except Exception as e:
+        logger.error(f"提前开奖失败: {e}")
+        return False
+
+def add_lottery_participants(participants):
+    """批量写入抽奖参与者 [(抽奖ID, 用户ID, 显示名称)]，已参与的忽略；返回新写入的数量，失败时返回 None"""
+    if not participants:
+        return 0
+    try:
+        with transaction() as cursor:
+            return cursor.executemany(
+                "INSERT IGNORE INTO lottery_participants (lottery_id, user_id, display_name) VALUES (%s, %s, %s)",
+                participants
+            )
+    except Exception as e:
+        logger.error(f"批量写入抽奖参与者失败: {e}")
+        return None
+
+def get_lottery_participant_ids(lottery_id):
+    """获取抽奖的全部参与者ID，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    # 参与者可能很多，使用元组游标减少构造字典的开销
+    cursor = conn.cursor(pymysql.cursors.Cursor)
+    try:
+        cursor.execute("SELECT user_id FROM lottery_participants WHERE lottery_id = %s", (lottery_id,))
+        return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"获取抽奖参与者失败: {e}")
+        return None
+    finally:
         cursor.close()
-        conn.close() 
\ No newline at end of file
+        conn.close()
+
+def finish_lottery(lottery_id, winner_ids):
+    """标记抽奖已开奖并记录中奖者；返回 True 表示本次完成开奖，False 表示抽奖已不是未开奖状态，失败时返回 None"""
+    try:
+        with transaction() as cursor:
+            if not cursor.execute(
+                "UPDATE lotteries SET status = 'drawn', drawn_at = NOW() WHERE id = %s AND status = 'pending'",
+                (lottery_id,)
+            ):
+                return False
+            if winner_ids:
+                placeholders = ', '.join(['%s'] * len(winner_ids))
+                cursor.execute(
+                    f"UPDATE lottery_participants SET is_winner = TRUE "
+                    f"WHERE lottery_id = %s AND user_id IN ({placeholders})",
+                    [lottery_id, *winner_ids]
+                )
+            return True
+    except Exception as e:
+        logger.error(f"保存开奖结果失败: {e}")
+        return None
+
+def get_lottery_winners(lottery_id):
+    """获取抽奖的中奖者 [{user_id, display_name}]"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT user_id, display_name FROM lottery_participants WHERE lottery_id = %s AND is_winner = TRUE",
+            (lottery_id,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取中奖者失败: {e}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_lottery_stats(group_id):
+    """统计群组各状态的抽奖数量 {状态: 数量}"""
+    conn = get_db_connection()
+    if not conn:
+        return {}
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT status, COUNT(*) AS total FROM lotteries WHERE group_id = %s GROUP BY status",
+            (group_id,)
+        )
+        return {row['status']: row['total'] for row in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"统计抽奖失败: {e}")
+        return {}
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_group_lotteries(group_id, status=None, limit=20):
+    """获取群组最近的抽奖及参与人数、中奖人数，status 为空时返回全部状态"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    
+    cursor = conn.cursor()
+    try:
+        sql = (
+            "SELECT l.id, l.title, l.prize_count, l.end_time, l.status, l.created_at, l.drawn_at, "
+            "COUNT(p.user_id) AS participant_count, COALESCE(SUM(p.is_winner), 0) AS winner_count "
+            "FROM lotteries l LEFT JOIN lottery_participants p ON p.lottery_id = l.id "
+            "WHERE l.group_id = %s"
+        )
+        params = [group_id]
+        if status:
+            sql += " AND l.status = %s"
+            params.append(status)
+        sql += " GROUP BY l.id ORDER BY l.id DESC LIMIT %s"
+        params.append(limit)
+        cursor.execute(sql, params)
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取抽奖记录失败: {e}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+
+# 积分抽奖相关操作
+def create_points_lottery(group_id, title, ticket_price, max_tickets, prize_count, end_time, admin_id=None):
+    """创建积分抽奖，返回抽奖ID，失败时返回 None"""
+    try:
+        with transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO points_lotteries "
+                "(group_id, title, ticket_price, max_tickets, prize_count, end_time, created_by) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (group_id, title, ticket_price, max_tickets, prize_count, end_time, admin_id)
+            )
+            return cursor.lastrowid
+    except Exception as e:
+        logger.error(f"创建积分抽奖失败: {e}")
+        return None
+
+def get_points_lottery(lottery_id):
+    """获取积分抽奖信息和已售抽奖券数，不存在或失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, group_id, title, ticket_price, max_tickets, prize_count, end_time, status, message_id, "
+            "(SELECT COALESCE(SUM(tickets), 0) FROM points_lottery_tickets WHERE lottery_id = points_lotteries.id) "
+            "AS tickets_sold "
+            "FROM points_lotteries WHERE id = %s",
+            (lottery_id,)
+        )
+        return cursor.fetchone()
+    except Exception as e:
+        logger.error(f"获取积分抽奖信息失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_schedulable_points_lotteries(until):
+    """获取尚未发布或将在 until 之前开奖的未开奖积分抽奖，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, group_id, title, ticket_price, max_tickets, prize_count, end_time, message_id "
+            "FROM points_lotteries WHERE status = 'pending' AND (message_id IS NULL OR end_time <= %s)",
+            (until,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取待开奖积分抽奖失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def set_points_lottery_message(lottery_id, message_id):
+    """记录积分抽奖在群组中的消息ID"""
+    try:
+        with transaction() as cursor:
+            cursor.execute("UPDATE points_lotteries SET message_id = %s WHERE id = %s", (message_id, lottery_id))
+        return True
+    except Exception as e:
+        logger.error(f"记录积分抽奖消息失败: {e}")
+        return False
+
+def buy_lottery_tickets(lottery_id, user_id, display_name, count):
+    """用积分购买抽奖券，扣积分和写入抽奖券在同一个事务中完成
+
+    返回 (结果, 用户持有的抽奖券数)，结果为 ok / closed / limit / insufficient / error。
+    """
+    result = 'error'
+    try:
+        with transaction() as cursor:
+            # 共享锁：开奖前的状态更新会等待进行中的购买完成，开奖后不会再有购买成功
+            cursor.execute(
+                "SELECT group_id, ticket_price, max_tickets FROM points_lotteries "
+                "WHERE id = %s AND status = 'pending' AND end_time > NOW() LOCK IN SHARE MODE",
+                (lottery_id,)
+            )
+            lottery = cursor.fetchone()
+            if not lottery:
+                result = 'closed'
+                raise Rollback()
+            
+            # 抽奖券行被本事务锁定，同一用户的并发购买依次执行
+            cursor.execute(
+                "INSERT INTO points_lottery_tickets (lottery_id, user_id, display_name, tickets) "
+                "VALUES (%s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE tickets = tickets + VALUES(tickets), display_name = VALUES(display_name)",
+                (lottery_id, user_id, display_name, count)
+            )
+            cursor.execute(
+                "SELECT tickets FROM points_lottery_tickets WHERE lottery_id = %s AND user_id = %s",
+                (lottery_id, user_id)
+            )
+            tickets = cursor.fetchone()['tickets']
+            if tickets > lottery['max_tickets']:
+                result = 'limit'
+                raise Rollback()
+            
+            if not debit_points(cursor, lottery['group_id'], user_id, lottery['ticket_price'] * count,
+                                f"购买积分抽奖 #{lottery_id} 抽奖券 {count} 张"):
+                result = 'insufficient'
+                raise Rollback()
+            return 'ok', tickets
+        return result, None
+    except Exception as e:
+        logger.error(f"购买抽奖券失败: {e}")
+        return 'error', None
+
+def draw_points_lottery(lottery_id, choose_winners):
+    """在一个事务中开奖：先标记已开奖，再读取全部抽奖券，由 choose_winners([(用户ID, 抽奖券数)]) 抽出中奖者并记录
+
+    返回中奖者ID列表；抽奖已不是未开奖状态或出错时返回 None，保证重复触发只开奖一次。
+    """
+    try:
+        with transaction() as cursor:
+            # 排他锁等待持有共享锁的进行中购买提交；之后的购买读到已开奖状态，不会再扣积分
+            if not cursor.execute(
+                "UPDATE points_lotteries SET status = 'drawn', drawn_at = NOW() WHERE id = %s AND status = 'pending'",
+                (lottery_id,)
+            ):
+                return None
+            
+            # 本事务的第一次一致性读，能看到上面等待过的购买；参与者可能很多，使用元组游标减少构造字典的开销
+            tickets_cursor = cursor.connection.cursor(pymysql.cursors.Cursor)
+            try:
+                tickets_cursor.execute(
+                    "SELECT user_id, tickets FROM points_lottery_tickets WHERE lottery_id = %s",
+                    (lottery_id,)
+                )
+                entries = list(tickets_cursor.fetchall())
+            finally:
+                tickets_cursor.close()
+            
+            winner_ids = choose_winners(entries)
+            if winner_ids:
+                placeholders = ', '.join(['%s'] * len(winner_ids))
+                cursor.execute(
+                    f"UPDATE points_lottery_tickets SET is_winner = TRUE "
+                    f"WHERE lottery_id = %s AND user_id IN ({placeholders})",
+                    [lottery_id, *winner_ids]
+                )
+            return winner_ids
+    except Exception as e:
+        logger.error(f"积分抽奖开奖失败: {e}")
+        return None
+
+def get_points_lottery_winners(lottery_id):
+    """获取积分抽奖的中奖者及其抽奖券数"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT user_id, display_name, tickets FROM points_lottery_tickets "
+            "WHERE lottery_id = %s AND is_winner = TRUE",
+            (lottery_id,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取积分抽奖中奖者失败: {e}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_group_points_lotteries(group_id, limit=20):
+    """获取群组最近的积分抽奖及参与人数、已售抽奖券数和中奖人数"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT l.id, l.title, l.ticket_price, l.prize_count, l.end_time, l.status, l.created_at, "
+            "COUNT(t.user_id) AS participant_count, COALESCE(SUM(t.tickets), 0) AS tickets_sold, "
+            "COALESCE(SUM(t.is_winner), 0) AS winner_count "
+            "FROM points_lotteries l LEFT JOIN points_lottery_tickets t ON t.lottery_id = l.id "
+            "WHERE l.group_id = %s GROUP BY l.id ORDER BY l.id DESC LIMIT %s",
+            (group_id, limit)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取积分抽奖记录失败: {e}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+
+# 接龙相关操作
+def create_chain(group_id, title, description, admin_id=None):
+    """发起接龙，返回接龙ID；群组已有进行中的接龙时返回 0，失败时返回 None"""
+    try:
+        with transaction() as cursor:
+            # 锁定群组行，保证同一群组同时只有一个进行中的接龙
+            cursor.execute("SELECT group_id FROM group_configs WHERE group_id = %s FOR UPDATE", (group_id,))
+            cursor.execute("SELECT id FROM chains WHERE group_id = %s AND status = 'active'", (group_id,))
+            if cursor.fetchone():
+                return 0
+            cursor.execute(
+                "INSERT INTO chains (group_id, title, description, created_by) VALUES (%s, %s, %s, %s)",
+                (group_id, title, description, admin_id)
+            )
+            return cursor.lastrowid
+    except Exception as e:
+        logger.error(f"发起接龙失败: {e}")
+        return None
+
+def get_active_chain(group_id):
+    """获取群组进行中的接龙及参与人数，没有或失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, group_id, title, description, message_id, created_at, "
+            "(SELECT COUNT(*) FROM chain_entries WHERE chain_id = chains.id) AS entry_count "
+            "FROM chains WHERE group_id = %s AND status = 'active'",
+            (group_id,)
+        )
+        return cursor.fetchone()
+    except Exception as e:
+        logger.error(f"获取进行中的接龙失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_chain_state(chain_id):
+    """获取接龙的状态和群组消息ID，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT status, message_id FROM chains WHERE id = %s", (chain_id,))
+        return cursor.fetchone()
+    except Exception as e:
+        logger.error(f"获取接龙状态失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_chain_entries(chain_id):
+    """按顺序获取接龙的全部记录，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT seq, user_id, display_name, content FROM chain_entries WHERE chain_id = %s ORDER BY seq",
+            (chain_id,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取接龙记录失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def add_chain_entries(entries):
+    """批量写入接龙记录 [(接龙ID, 序号, 用户ID, 显示名称, 内容)]，已写入的忽略；返回新写入的数量，失败时返回 None"""
+    if not entries:
+        return 0
+    try:
+        with transaction() as cursor:
+            return cursor.executemany(
+                "INSERT IGNORE INTO chain_entries (chain_id, seq, user_id, display_name, content) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                entries
+            )
+    except Exception as e:
+        logger.error(f"批量写入接龙记录失败: {e}")
+        return None
+
+def set_chain_message(chain_id, message_id):
+    """记录接龙在群组中的消息ID"""
+    try:
+        with transaction() as cursor:
+            cursor.execute("UPDATE chains SET message_id = %s WHERE id = %s", (message_id, chain_id))
+        return True
+    except Exception as e:
+        logger.error(f"记录接龙消息失败: {e}")
+        return False
+
+def close_chain(group_id):
+    """结束群组进行中的接龙，没有进行中的接龙时返回 False"""
+    try:
+        with transaction() as cursor:
+            return cursor.execute(
+                "UPDATE chains SET status = 'closed', closed_at = NOW() WHERE group_id = %s AND status = 'active'",
+                (group_id,)
+            ) > 0
+    except Exception as e:
+        logger.error(f"结束接龙失败: {e}")
+        return False
+
+def get_chains_to_sync(closed_before):
+    """获取尚未发布的进行中接龙，以及在 closed_before 之前结束但群组消息还未更新的接龙，失败时返回 None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, group_id, title, description, status, message_id, "
+            "(SELECT COUNT(*) FROM chain_entries WHERE chain_id = chains.id) AS entry_count "
+            "FROM chains WHERE (status = 'active' AND message_id IS NULL) "
+            "OR (status = 'closed' AND post_closed = FALSE AND closed_at <= %s)",
+            (closed_before,)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取待同步接龙失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def mark_chain_post_closed(chain_id):
+    """记录已结束接龙的群组消息已更新"""
+    try:
+        with transaction() as cursor:
+            cursor.execute("UPDATE chains SET post_closed = TRUE WHERE id = %s", (chain_id,))
+        return True
+    except Exception as e:
+        logger.error(f"更新接龙消息状态失败: {e}")
+        return False
+
+# 群组统计相关操作
+def get_group_points_totals(group_id):
+    """统计群组有积分记录的用户数和总积分，积分排行未加载时使用"""
+    conn = get_db_connection()
+    if not conn:
+        return {'total_users': 0, 'total_points': 0}
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT COUNT(*) AS total_users, COALESCE(SUM(points), 0) AS total_points "
+            "FROM user_points WHERE group_id = %s",
+            (group_id,)
+        )
+        row = cursor.fetchone()
+        return {'total_users': row['total_users'], 'total_points': int(row['total_points'])}
+    except Exception as e:
+        logger.error(f"统计群组积分失败: {e}")
+        return {'total_users': 0, 'total_points': 0}
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_group_daily_stats(group_id, since_day):
+    """获取群组从 since_day 起每天的统计汇总，按日期排序"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT day, messages, joins, leaves, active_users, active_users_hll FROM group_stats_daily "
+            "WHERE group_id = %s AND day >= %s ORDER BY day",
+            (group_id, since_day)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取群组每日统计失败: {e}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_group_hourly_stats(group_id, since_hour):
+    """获取群组从 since_hour 起每小时的统计汇总，按时间排序"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT hour, messages, joins, leaves FROM group_stats_hourly "
+            "WHERE group_id = %s AND hour >= %s ORDER BY hour",
+            (group_id, since_hour)
+        )
+        return list(cursor.fetchall())
+    except Exception as e:
+        logger.error(f"获取群组每小时统计失败: {e}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+
+def prune_group_stats(hourly_before, hll_before):
+    """删除过期的每小时统计，清空过期的活跃用户 HyperLogLog（保留估算人数）"""
+    try:
+        with transaction() as cursor:
+            hourly = cursor.execute("DELETE FROM group_stats_hourly WHERE hour < %s", (hourly_before,))
+            daily = cursor.execute(
+                "UPDATE group_stats_daily SET active_users_hll = NULL "
+                "WHERE day < %s AND active_users_hll IS NOT NULL",
+                (hll_before,)
+            )
+            return hourly, daily
+    except Exception as e:
+        logger.error(f"清理过期统计失败: {e}")
+        return None
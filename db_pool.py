@@ -0,0 +1,246 @@
+"""
+数据库连接池模块，db_operations 和 db_utils 共用同一个 MySQL 连接池
+"""
+import threading
+import time
+from collections import deque
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from loguru import logger
+
+from config import (
+    DB_HOST, DB_USER, DB_PASSWORD, DB_PORT, DB_NAME,
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_INTERVAL
+)
+
+
+class PoolTimeoutError(Exception):
+    """等待空闲连接超时"""
+
+
+class PooledConnection:
+    """连接池中的连接包装，close() 时归还连接池而不是断开"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def raw(self):
+        """底层 pymysql 连接"""
+        return self._conn
+
+    def close(self):
+        """归还连接到连接池"""
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        pool.release(self)
+
+
+class ConnectionPool:
+    """固定大小的 MySQL 连接池，取出时做健康检查，断线自动重连"""
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 ping_interval=DB_POOL_PING_INTERVAL, **connect_kwargs):
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.connect_kwargs = connect_kwargs
+        self._idle = deque()
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'connects': 0,
+            'reconnects': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _connect(self):
+        """建立新的数据库连接"""
+        conn = pymysql.connect(**self.connect_kwargs)
+        self._incr('connects')
+        return conn
+
+    def _incr(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _checkout_conn(self):
+        """从空闲队列取连接，必要时等待或新建，返回 (连接, 上次使用时间)"""
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise pymysql.err.InterfaceError("连接池已关闭")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    # 先占位，在锁外建立连接
+                    self._created += 1
+                    conn, last_used = None, None
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"等待数据库连接超时 ({self.timeout}s)")
+                self._cond.wait(remaining)
+
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_time = time.monotonic() - start
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._forget()
+                raise
+        return conn, last_used
+
+    def _forget(self):
+        """丢弃一个连接占位并唤醒等待者"""
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _ensure_alive(self, conn, last_used):
+        """健康检查：空闲超过 ping_interval 的连接先 ping，失败则重连"""
+        if last_used is None or time.monotonic() - last_used < self.ping_interval:
+            return conn
+        try:
+            conn.ping(reconnect=False)
+            return conn
+        except pymysql.err.OperationalError as e:
+            logger.warning(f"数据库连接已失效，正在重连: {e}")
+            self._incr('reconnects')
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return self._connect()
+
+    def get_connection(self):
+        """从连接池取出一个连接"""
+        conn, last_used = self._checkout_conn()
+        try:
+            conn = self._ensure_alive(conn, last_used)
+        except Exception:
+            self._forget()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, pooled):
+        """归还连接，结束未提交的事务，已断开的连接直接丢弃"""
+        conn = pooled.raw
+        reusable = conn.open and not self._closed
+        if reusable and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                conn.rollback()
+            except pymysql.err.MySQLError as e:
+                logger.warning(f"归还连接时回滚失败，丢弃该连接: {e}")
+                reusable = False
+
+        if not reusable:
+            self._incr('discarded')
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._forget()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        """连接池使用情况和等待指标"""
+        with self._cond:
+            idle = len(self._idle)
+            result = dict(self._stats)
+            result.update({
+                'size': self.size,
+                'created': self._created,
+                'idle': idle,
+                'in_use': self._created - idle,
+            })
+        result['wait_time_avg'] = result['wait_time_total'] / result['waits'] if result['waits'] else 0.0
+        return result
+
+    def close_all(self):
+        """关闭连接池中的所有空闲连接，之后不再分配连接"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取全局连接池（首次调用时创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    host=DB_HOST,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    port=DB_PORT,
+                    database=DB_NAME,
+                    charset='utf8mb4',
+                    cursorclass=pymysql.cursors.DictCursor
+                )
+    return _pool
+
+
+def get_connection():
+    """从全局连接池获取连接，失败时返回 None"""
+    try:
+        return get_pool().get_connection()
+    except Exception as e:
+        logger.error(f"数据库连接失败: {e}")
+        return None
+
+
+def close_pool():
+    """关闭全局连接池"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close_all()
+        logger.info(f"数据库连接池已关闭: {pool.stats()}")
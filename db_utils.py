@@ -1,29 +1,5 @@
-import pymysql
 from loguru import logger
-
-# 数据库连接信息
-DB_HOST = 'localhost'
-DB_USER = 'root'
-DB_PASSWORD = '123456'
-DB_PORT = 3306
-DB_NAME = 'tg_bot_db'
-
-# 创建数据库连接
-def get_connection():
-    try:
-        connection = pymysql.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT,
-            database=DB_NAME,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        return connection
-    except Exception as e:
-        logger.error(f"数据库连接失败: {e}")
-        return None
+from db_pool import get_connection
 
 # 保存群组信息
 def save_group(group_id, group_name):
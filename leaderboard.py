@@ -0,0 +1,342 @@
+"""
+积分排行榜模块，在内存中为每个群组维护按积分排序的索引
+"""
+import random
+import threading
+from datetime import timedelta
+
+from loguru import logger
+
+from config import LEADERBOARD_RECONCILE_OVERLAP
+from db_async import run_db
+from db_pool import get_connection
+
+
+class _Node:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class RankedSkipList:
+    """可按名次索引的跳表，插入、删除、查询名次和按名次取值均为 O(log n)"""
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        """插入一个键（键不能重复）"""
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                update[i].span[i] = self._length
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._length += 1
+
+    def remove(self, key):
+        """删除一个键，不存在时返回 False"""
+        update = [None] * self.MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        target = node.forward[0]
+        if target is None or target.key != key:
+            return False
+
+        for i in range(self._level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+        return True
+
+    def rank(self, key):
+        """返回键的名次（从1开始），不存在时返回 None"""
+        rank = 0
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                rank += node.span[i]
+                node = node.forward[i]
+            if node is not self._head and node.key == key:
+                return rank
+        return None
+
+    def _node_at(self, rank):
+        traversed = 0
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and traversed + node.span[i] <= rank:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if traversed == rank:
+                return node
+        return None
+
+    def slice(self, start, count):
+        """从第 start 名（从1开始）起取 count 个键"""
+        if count <= 0 or start > self._length:
+            return []
+        node = self._node_at(max(start, 1))
+        result = []
+        while node is not None and len(result) < count:
+            result.append(node.key)
+            node = node.forward[0]
+        return result
+
+
+class GroupRanking:
+    """单个群组的积分排行，键为 (-积分, 用户ID)，积分相同时按用户ID排序"""
+
+    def __init__(self):
+        self.points = {}
+        self.index = RankedSkipList()
+        self.total = 0
+
+    def set(self, user_id, points):
+        old = self.points.get(user_id)
+        if old is not None:
+            self.index.remove((-old, user_id))
+        self.total += points - (old or 0)
+        self.points[user_id] = points
+        self.index.insert((-points, user_id))
+
+    def add(self, user_id, delta):
+        self.set(user_id, self.points.get(user_id, 0) + delta)
+
+    def top(self, limit):
+        return [{'user_id': user_id, 'points': -neg_points}
+                for neg_points, user_id in self.index.slice(1, limit)]
+
+    def rank(self, user_id):
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return {'rank': self.index.rank((-points, user_id)), 'points': points}
+
+
+class Leaderboard:
+    """所有群组的积分排行，启动时从数据库加载，积分变动时增量更新
+
+    从数据库读取期间发生的积分变动记入日志，读取完成后在锁内重放到新数据上再替换，
+    避免读取和替换之间的变动丢失。定期校对只读取检查点之后更新过的用户。
+    """
+
+    def __init__(self):
+        self._groups = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # 正在从数据库读取时记录的变动：('delta', 群组, 用户, 变动) 或 ('clear', 群组)
+        self._journal = None
+        # 上次读取时数据库的时间，下次只校对此后更新过的用户
+        self._checkpoint = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _begin_journal(self):
+        with self._lock:
+            self._journal = []
+
+    def _read(self, since=None):
+        """读取数据库当前时间和用户积分，since 不为空时只读取此后更新过的行"""
+        conn = get_connection()
+        if not conn:
+            return None
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT NOW() AS now")
+            now = cursor.fetchone()['now']
+            if since is None:
+                cursor.execute("SELECT group_id, user_id, points FROM user_points")
+            else:
+                cursor.execute(
+                    "SELECT group_id, user_id, points FROM user_points WHERE updated_at >= %s",
+                    (since,)
+                )
+            return now, cursor.fetchall()
+        except Exception as e:
+            logger.error(f"读取用户积分失败: {e}")
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+    def warm(self):
+        """从数据库加载全部用户积分，重建所有群组的排行（同步函数，需在线程池中执行）"""
+        self._begin_journal()
+        result = self._read()
+        if result is None:
+            with self._lock:
+                self._journal = None
+            return False
+
+        now, rows = result
+        groups = {}
+        for row in rows:
+            ranking = groups.get(row['group_id'])
+            if ranking is None:
+                ranking = groups[row['group_id']] = GroupRanking()
+            ranking.set(row['user_id'], row['points'])
+
+        with self._lock:
+            # 重放读取期间的变动后再替换
+            for entry in self._journal:
+                if entry[0] == 'clear':
+                    groups[entry[1]] = GroupRanking()
+                else:
+                    _, group_id, user_id, delta = entry
+                    ranking = groups.get(group_id)
+                    if ranking is None:
+                        ranking = groups[group_id] = GroupRanking()
+                    ranking.add(user_id, delta)
+            self._journal = None
+            self._groups = groups
+            self._loaded = True
+            self._checkpoint = now
+        logger.info(f"积分排行已加载: {len(groups)} 个群组")
+        return True
+
+    def reconcile(self):
+        """只校对检查点之后更新过的用户，尚未加载时完整加载（同步函数，需在线程池中执行）
+
+        检查点向前多取 LEADERBOARD_RECONCILE_OVERLAP 秒，覆盖更新时间早于检查点但之后才提交的事务。
+        """
+        if not self._loaded or self._checkpoint is None:
+            return self.warm()
+
+        self._begin_journal()
+        result = self._read(self._checkpoint - timedelta(seconds=LEADERBOARD_RECONCILE_OVERLAP))
+        if result is None:
+            with self._lock:
+                self._journal = None
+            return False
+
+        now, rows = result
+        with self._lock:
+            # 读取之后本进程内的变动已经作用在内存排行上，数据库的值要加上这些变动
+            cleared = set()
+            deltas = {}
+            for entry in self._journal:
+                if entry[0] == 'clear':
+                    cleared.add(entry[1])
+                else:
+                    _, group_id, user_id, delta = entry
+                    deltas[(group_id, user_id)] = deltas.get((group_id, user_id), 0) + delta
+            for row in rows:
+                group_id, user_id = row['group_id'], row['user_id']
+                if group_id in cleared:
+                    continue
+                points = row['points'] + deltas.get((group_id, user_id), 0)
+                ranking = self._group(group_id, create=True)
+                if ranking.points.get(user_id) != points:
+                    ranking.set(user_id, points)
+            self._journal = None
+            self._checkpoint = now
+        return True
+
+    def _group(self, group_id, create=False):
+        ranking = self._groups.get(int(group_id))
+        if ranking is None and create and self._loaded:
+            ranking = self._groups[int(group_id)] = GroupRanking()
+        return ranking
+
+    def apply_delta(self, group_id, user_id, delta):
+        """积分变动后增量更新排行"""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(('delta', int(group_id), int(user_id), delta))
+            ranking = self._group(group_id, create=True)
+            if ranking is not None:
+                ranking.add(int(user_id), delta)
+
+    def clear_group(self, group_id):
+        """清空群组排行"""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(('clear', int(group_id)))
+            if self._loaded:
+                self._groups[int(group_id)] = GroupRanking()
+
+    def top(self, group_id, limit=10):
+        """获取群组前 limit 名"""
+        with self._lock:
+            ranking = self._group(group_id)
+            return ranking.top(limit) if ranking else []
+
+    def group_totals(self, group_id):
+        """获取群组有积分记录的用户数和总积分，排行尚未加载时返回 None"""
+        with self._lock:
+            if not self._loaded:
+                return None
+            ranking = self._group(group_id)
+            if ranking is None:
+                return {'total_users': 0, 'total_points': 0}
+            return {'total_users': len(ranking.points), 'total_points': ranking.total}
+
+    def user_rank(self, group_id, user_id):
+        """获取用户在群组中的名次和积分，没有积分记录时返回 None"""
+        with self._lock:
+            ranking = self._group(group_id)
+            return ranking.rank(int(user_id)) if ranking else None
+
+
+# 全局积分排行，同一进程内的两个机器人共用
+points_leaderboard = Leaderboard()
+
+
+async def reconcile_job(context):
+    """定时任务：增量校对其他进程写入的积分变动"""
+    await run_db(points_leaderboard.reconcile)
+
+
+async def full_reconcile_job(context):
+    """定时任务：完整重新加载排行，校正增量校对看不到的删除（如其他进程清空群组积分）"""
+    await run_db(points_leaderboard.warm)
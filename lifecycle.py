@@ -0,0 +1,105 @@
+"""
+进程生命周期模块，处理停止信号，按顺序执行停止步骤，并统计重启后收到第一条更新的耗时
+"""
+import asyncio
+import inspect
+import signal
+import time
+
+from loguru import logger
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from config import SHUTDOWN_STEP_TIMEOUT, LIFECYCLE_STATE_FILE
+
+
+class Lifecycle:
+    """收到 SIGTERM/SIGINT 后按注册顺序执行停止步骤，每一步有超时，失败不影响后续步骤"""
+
+    def __init__(self, state_file=LIFECYCLE_STATE_FILE):
+        self.state_file = state_file
+        self.started_at = time.monotonic()
+        self.first_update_at = None
+        self._stop_event = asyncio.Event()
+        self._steps = []
+
+    def install_signal_handlers(self):
+        """注册停止信号处理，需在事件循环中调用"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_stop, sig)
+            except NotImplementedError:
+                # Windows 的事件循环不支持 add_signal_handler
+                signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(self.request_stop, signum))
+
+    def request_stop(self, signum=None):
+        """请求停止，重复调用无效"""
+        if not self._stop_event.is_set():
+            name = signal.Signals(signum).name if signum else '手动'
+            logger.info(f"收到停止信号 {name}，开始停止...")
+            self._stop_event.set()
+
+    async def wait(self):
+        """等待停止信号"""
+        await self._stop_event.wait()
+
+    def watch(self, application):
+        """在最先执行的处理器组中记录收到的第一条更新；同一组只执行第一个匹配的处理器，组号不与 webhook_server 和业务处理器共用"""
+        application.add_handler(TypeHandler(Update, self._on_update), group=-20)
+
+    async def _on_update(self, update, context):
+        self.mark_update()
+
+    def mark_update(self):
+        """记录第一条更新，输出启动和重启到收到第一条更新的耗时"""
+        if self.first_update_at is not None:
+            return
+        self.first_update_at = time.monotonic()
+        message = f"启动后 {self.first_update_at - self.started_at:.2f} 秒收到第一条更新"
+        stopped_at = self._last_stopped_at()
+        if stopped_at is not None:
+            message += f"，距上次停止 {time.time() - stopped_at:.2f} 秒"
+        logger.info(message)
+
+    def _last_stopped_at(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return float(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def add_step(self, name, func, timeout=SHUTDOWN_STEP_TIMEOUT):
+        """注册停止步骤，func 为无参数的异步函数或普通函数，timeout 为 None 时不限时
+
+        普通函数在线程中执行，等待数据库线程池关闭等阻塞操作时事件循环上的其他任务照常运行。
+        """
+        self._steps.append((name, func, timeout))
+
+    async def shutdown(self):
+        """按注册顺序执行全部停止步骤"""
+        started = time.monotonic()
+        for name, func, timeout in self._steps:
+            step_started = time.monotonic()
+            try:
+                if inspect.iscoroutinefunction(func):
+                    result = func()
+                else:
+                    result = asyncio.to_thread(func)
+                await asyncio.wait_for(result, timeout)
+                logger.info(f"{name}完成，耗时 {time.monotonic() - step_started:.2f} 秒")
+            except asyncio.TimeoutError:
+                logger.warning(f"{name}超过 {timeout} 秒未完成，继续执行后续步骤")
+            except Exception as e:
+                logger.error(f"{name}失败: {e}")
+
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                f.write(str(time.time()))
+        except OSError as e:
+            logger.error(f"记录停止时间失败: {e}")
+        logger.info(f"已全部停止，耗时 {time.monotonic() - started:.2f} 秒")
+
+
+# 全局生命周期管理器，在导入时记录进程启动时间
+lifecycle = Lifecycle()
@@ -0,0 +1,235 @@
+"""
+抽奖模块，处理群组中的参与按钮，由主机器人发布新抽奖并在开奖时间自动开奖
+"""
+import asyncio
+import html
+import random
+from datetime import datetime, timedelta
+
+from loguru import logger
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from batch_writer import BatchWriter
+from cache import TTLCache
+from config import LOTTERY_SCHEDULE_HORIZON, LOTTERY_CACHE_SIZE, LOTTERY_CACHE_TTL
+from config import LOTTERY_JOIN_FLUSH_INTERVAL_MS, LOTTERY_JOIN_FLUSH_MAX, LOTTERY_COUNT_EDIT_INTERVAL
+from db_async import run_db
+from db_operations import get_lottery, get_schedulable_lotteries, set_lottery_message, add_lottery_participants
+from db_operations import get_lottery_participant_ids, finish_lottery, get_lottery_winners
+from message_editor import message_editor
+
+# 参与按钮的回调数据前缀，后面是抽奖ID
+PARTICIPATE_PREFIX = 'participate_lottery_'
+
+# 开奖使用系统随机数
+_random = random.SystemRandom()
+
+
+def sample_winners(user_ids, count, rng=_random):
+    """部分 Fisher–Yates 洗牌：只随机交换前 count 个位置，O(count) 抽出不重复的中奖者（会打乱 user_ids）"""
+    count = min(count, len(user_ids))
+    for i in range(count):
+        j = rng.randrange(i, len(user_ids))
+        user_ids[i], user_ids[j] = user_ids[j], user_ids[i]
+    return user_ids[:count]
+
+
+def draw(lottery_id, prize_count):
+    """抽出中奖者并保存开奖结果（同步函数，需在线程池中执行）
+
+    返回中奖者ID列表；抽奖已开奖或已取消时返回 None，保证重复触发只开奖一次。
+    """
+    user_ids = get_lottery_participant_ids(lottery_id)
+    if user_ids is None:
+        return None
+    winners = sample_winners(user_ids, prize_count)
+    if not finish_lottery(lottery_id, winners):
+        return None
+    return winners
+
+
+def participate_markup(lottery_id):
+    """抽奖消息下方的参与按钮"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🎲 参与抽奖", callback_data=f'{PARTICIPATE_PREFIX}{lottery_id}')]
+    ])
+
+
+def post_text(row, count):
+    """群组中抽奖消息的内容"""
+    text = f"🎁 新抽奖活动\n\n标题：{row['title']}\n"
+    if row['description']:
+        text += f"描述：{row['description']}\n"
+    text += (
+        f"奖品数量：{row['prize_count']}\n"
+        f"开奖时间：{row['end_time']:%Y-%m-%d %H:%M}\n"
+        f"参与人数：{count}\n\n"
+        f"点击下方按钮参与抽奖！"
+    )
+    return text
+
+
+# 全局抽奖参与者写入队列，行为 (抽奖ID, 用户ID, 显示名称)
+participation_queue = BatchWriter(
+    add_lottery_participants, '抽奖参与者', LOTTERY_JOIN_FLUSH_INTERVAL_MS, LOTTERY_JOIN_FLUSH_MAX
+)
+
+
+class LotteryManager:
+    """缓存抽奖信息和参与者，并为即将开奖的抽奖安排开奖任务"""
+
+    def __init__(self, cache_size=LOTTERY_CACHE_SIZE, cache_ttl=LOTTERY_CACHE_TTL):
+        # 抽奖ID -> 抽奖信息，members 为已参与的用户ID集合，过期后重新从数据库载入
+        self._lotteries = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # 正在载入的抽奖ID -> 载入任务，同一抽奖的并发点击只查询一次数据库
+        self._loading = {}
+        # 已安排开奖任务的抽奖ID -> (开奖时间, 任务)
+        self._scheduled = {}
+
+    async def _load(self, lottery_id):
+        row = await run_db(get_lottery, lottery_id)
+        if not row:
+            return None
+        user_ids = await run_db(get_lottery_participant_ids, lottery_id)
+        if user_ids is None:
+            return None
+        row['members'] = set(user_ids)
+        row['members'].update(
+            user_id for queued_id, user_id, _ in participation_queue.pending() if queued_id == lottery_id
+        )
+        self._lotteries.set(lottery_id, row)
+        return row
+
+    async def _info(self, lottery_id):
+        info = self._lotteries.get(lottery_id)
+        if info is not None:
+            return info
+        task = self._loading.get(lottery_id)
+        if task is None:
+            task = self._loading[lottery_id] = asyncio.ensure_future(self._load(lottery_id))
+            task.add_done_callback(lambda _: self._loading.pop(lottery_id, None))
+        return await asyncio.shield(task)
+
+    async def participate(self, lottery_id, user):
+        """用户参与抽奖，返回 (结果, 参与人数)，结果为 joined / duplicate / closed / missing
+
+        缓存中有抽奖信息时不访问数据库：在内存中去重后放入写入队列，并请求更新群组消息中的参与人数。
+        """
+        info = await self._info(lottery_id)
+        if info is None:
+            return 'missing', 0
+        members = info['members']
+        if info['status'] != 'pending' or datetime.now() >= info['end_time']:
+            return 'closed', len(members)
+        if user.id in members:
+            return 'duplicate', len(members)
+
+        members.add(user.id)
+        participation_queue.add((lottery_id, user.id, user.full_name[:255]))
+        if info['message_id']:
+            message_editor.request(
+                info['group_id'], info['message_id'],
+                lambda: self._render_post(info),
+                min_interval=LOTTERY_COUNT_EDIT_INTERVAL
+            )
+        return 'joined', len(members)
+
+    def _render_post(self, info):
+        # 已截止的抽奖不再更新，避免和开奖后的消息冲突
+        if info['status'] != 'pending' or datetime.now() >= info['end_time']:
+            return None
+        return {'text': post_text(info, len(info['members'])), 'reply_markup': participate_markup(info['id'])}
+
+    async def poll(self, context):
+        """发布尚未发布的抽奖，为即将开奖的抽奖安排开奖任务"""
+        now = datetime.now()
+        rows = await run_db(get_schedulable_lotteries, now + timedelta(seconds=LOTTERY_SCHEDULE_HORIZON))
+        if rows is None:
+            return
+
+        for row in rows:
+            if row['message_id'] is None:
+                await self._announce(context.bot, row)
+
+            scheduled = self._scheduled.get(row['id'])
+            if scheduled is not None:
+                if scheduled[0] == row['end_time']:
+                    continue
+                # 管理员修改了开奖时间（如提前开奖）
+                scheduled[1].schedule_removal()
+            if row['end_time'] > now + timedelta(seconds=LOTTERY_SCHEDULE_HORIZON):
+                self._scheduled.pop(row['id'], None)
+                continue
+            # 截止后再等一个写入间隔，让各进程队列中的参与者写入数据库
+            job = context.job_queue.run_once(
+                self.draw_job,
+                when=max((row['end_time'] - now).total_seconds(), 0) + participation_queue.flush_interval,
+                data=row,
+                name=f"lottery_draw_{row['id']}"
+            )
+            self._scheduled[row['id']] = (row['end_time'], job)
+
+    async def _announce(self, bot, row):
+        try:
+            message = await bot.send_message(
+                chat_id=row['group_id'],
+                text=post_text(row, 0),
+                reply_markup=participate_markup(row['id'])
+            )
+        except Exception as e:
+            logger.error(f"发布抽奖 {row['id']} 到群组 {row['group_id']} 失败: {e}")
+            return
+        row['message_id'] = message.message_id
+        await run_db(set_lottery_message, row['id'], message.message_id)
+        logger.info(f"抽奖 {row['id']} 已发布到群组 {row['group_id']}")
+
+    async def draw_job(self, context):
+        """定时任务：到开奖时间后抽出中奖者并在群组中公布"""
+        row = context.job.data
+        self._scheduled.pop(row['id'], None)
+        self._lotteries.invalidate(row['id'])
+        if row['message_id']:
+            message_editor.cancel(row['group_id'], row['message_id'])
+
+        await participation_queue.flush()
+        winners = await run_db(draw, row['id'], row['prize_count'])
+        if winners is None:
+            return
+        logger.info(f"抽奖 {row['id']} 已开奖，中奖 {len(winners)} 人")
+
+        if winners:
+            names = {item['user_id']: item['display_name'] for item in await run_db(get_lottery_winners, row['id'])}
+            lines = [
+                f'{i}. <a href="tg://user?id={user_id}">{html.escape(names.get(user_id) or str(user_id))}</a>'
+                for i, user_id in enumerate(winners, 1)
+            ]
+            text = f"🎉 抽奖「{html.escape(row['title'])}」已开奖！\n\n中奖名单：\n" + "\n".join(lines)
+        else:
+            text = f"抽奖「{html.escape(row['title'])}」已结束，没有用户参与。"
+
+        try:
+            if row['message_id']:
+                await context.bot.edit_message_reply_markup(
+                    chat_id=row['group_id'], message_id=row['message_id'], reply_markup=None
+                )
+            await context.bot.send_message(chat_id=row['group_id'], text=text, parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"公布抽奖 {row['id']} 结果失败: {e}")
+
+
+# 全局抽奖管理器
+lottery_manager = LotteryManager()
+
+
+async def participate_callback(update, context):
+    """群组中“参与抽奖”按钮的回调，参与记录由写入队列批量保存，这里立即回复用户"""
+    query = update.callback_query
+    lottery_id = int(query.data[len(PARTICIPATE_PREFIX):])
+    result, count = await lottery_manager.participate(lottery_id, query.from_user)
+    messages = {
+        'joined': f"✅ 参与成功！当前共 {count} 人参与。",
+        'duplicate': f"您已参与过该抽奖，当前共 {count} 人参与。",
+        'closed': "该抽奖已结束。",
+        'missing': "该抽奖不存在或暂时无法参与，请稍后重试。",
+    }
+    await query.answer(messages[result], show_alert=result == 'joined')
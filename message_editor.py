@@ -0,0 +1,100 @@
+"""
+消息编辑合并模块，把对同一条消息的多次编辑请求合并为一次，并限制每条消息和每个群组的编辑频率
+"""
+import asyncio
+import time
+
+import telegram
+from loguru import logger
+
+from config import MESSAGE_EDIT_CHAT_MIN_INTERVAL, MESSAGE_EDITS_PER_FLUSH
+
+
+class MessageEditor:
+    """待编辑消息的合并队列
+
+    request() 只记录最新的渲染函数，由定时任务 flush() 统一编辑：同一条消息两次编辑至少间隔
+    min_interval 秒，同一群组两次编辑至少间隔 chat_min_interval 秒，被限流时整个群组推迟。
+    渲染函数在真正编辑时才调用，所以总是使用最新的内容。
+    """
+
+    def __init__(self, chat_min_interval=MESSAGE_EDIT_CHAT_MIN_INTERVAL, edits_per_flush=MESSAGE_EDITS_PER_FLUSH):
+        self.chat_min_interval = chat_min_interval
+        self.edits_per_flush = edits_per_flush
+        # (群组, 消息ID) -> (渲染函数, 最小间隔)
+        self._pending = {}
+        # (群组, 消息ID) -> 上次编辑时间，群组 -> 下次允许编辑的时间
+        self._last_edit = {}
+        self._chat_ready_at = {}
+        self.edits = 0
+        self.requests = 0
+
+    def request(self, chat_id, message_id, render, min_interval=0):
+        """请求编辑消息，render 返回 edit_message_text 的参数字典，返回 None 时放弃本次编辑"""
+        self.requests += 1
+        self._pending[(chat_id, message_id)] = (render, min_interval)
+
+    def cancel(self, chat_id, message_id):
+        """放弃尚未执行的编辑，消息被删除或改为最终内容前调用"""
+        self._pending.pop((chat_id, message_id), None)
+
+    def _take_due(self, now):
+        due = []
+        for key, (render, min_interval) in list(self._pending.items()):
+            if len(due) >= self.edits_per_flush:
+                break
+            chat_id = key[0]
+            if self._chat_ready_at.get(chat_id, 0) > now:
+                continue
+            last_edit = self._last_edit.get(key)
+            if last_edit is not None and now - last_edit < min_interval:
+                continue
+            del self._pending[key]
+            self._last_edit[key] = now
+            self._chat_ready_at[chat_id] = now + self.chat_min_interval
+            due.append((key, render, min_interval))
+        return due
+
+    async def _edit(self, bot, key, render, min_interval):
+        kwargs = render()
+        if kwargs is None:
+            return
+        chat_id, message_id = key
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, **kwargs)
+            self.edits += 1
+        except telegram.error.RetryAfter as e:
+            # 被限流时推迟整个群组，期间的新请求会覆盖这次的内容
+            self._chat_ready_at[chat_id] = time.monotonic() + e.retry_after
+            self._pending.setdefault(key, (render, min_interval))
+        except telegram.error.BadRequest as e:
+            if 'not modified' not in str(e):
+                logger.warning(f"编辑群组 {chat_id} 的消息 {message_id} 失败: {e}")
+        except Exception as e:
+            logger.error(f"编辑群组 {chat_id} 的消息 {message_id} 失败: {e}")
+
+    async def flush(self, context):
+        """定时任务：编辑已到允许时间的消息"""
+        now = time.monotonic()
+        due = self._take_due(now)
+        if due:
+            await asyncio.gather(*(self._edit(context.bot, key, render, min_interval) for key, render, min_interval in due))
+
+        # 清理已不再限制编辑的记录
+        horizon = now - max(self.chat_min_interval, 3600)
+        for key in [key for key, last_edit in self._last_edit.items() if last_edit < horizon]:
+            del self._last_edit[key]
+        for chat_id in [chat_id for chat_id, ready_at in self._chat_ready_at.items() if ready_at < now]:
+            del self._chat_ready_at[chat_id]
+
+    def stats(self):
+        """待编辑消息数、累计请求数和实际编辑数"""
+        return {
+            'pending': len(self._pending),
+            'requests': self.requests,
+            'edits': self.edits,
+        }
+
+
+# 全局消息编辑队列
+message_editor = MessageEditor()
@@ -0,0 +1,619 @@
+"""
+数据库结构迁移模块，按版本号顺序执行迁移并记录已应用的版本
+
+用法：
+    python migrations.py            创建数据库并迁移到最新版本
+    python migrations.py --explain  检查热点查询是否使用了索引
+"""
+import sys
+from datetime import date
+
+import pymysql
+from loguru import logger
+
+from config import DB_HOST, DB_USER, DB_PASSWORD, DB_PORT, DB_NAME, POINTS_HISTORY_PARTITIONS_AHEAD
+
+
+# 迁移步骤辅助函数
+def add_index(table, name, columns):
+    """生成添加索引的迁移步骤，索引已存在时跳过"""
+    def step(cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, name)
+        )
+        if cursor.fetchone():
+            return
+        cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({columns})")
+    step.__doc__ = f"添加索引 {table}.{name}"
+    return step
+
+
+def add_column(table, name, definition):
+    """生成添加字段的迁移步骤，字段已存在时跳过"""
+    def step(cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1",
+            (table, name)
+        )
+        if cursor.fetchone():
+            return
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    step.__doc__ = f"添加字段 {table}.{name}"
+    return step
+
+
+# 按月分区辅助函数，分区 pYYYYMM 保存该月的数据，p_future 兜底保存更晚的数据
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_partition(month):
+    upper = _add_months(month, 1)
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{upper:%Y-%m-%d} 00:00:00'))"
+
+
+def list_partitions(cursor, table):
+    """按顺序返回表的分区 [(分区名, 上界时间戳)]，p_future 的上界为 None，未分区时返回空列表"""
+    cursor.execute(
+        "SELECT partition_name AS name, partition_description AS bound FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL "
+        "ORDER BY partition_ordinal_position",
+        (table,)
+    )
+    return [
+        (row['name'], None if row['bound'] == 'MAXVALUE' else int(row['bound']))
+        for row in cursor.fetchall()
+    ]
+
+
+def ensure_future_partitions(cursor, table='points_history', months_ahead=POINTS_HISTORY_PARTITIONS_AHEAD):
+    """从 p_future 中拆分出未来 months_ahead 个月的分区，返回新建的分区数"""
+    monthly = [name for name, bound in list_partitions(cursor, table) if bound is not None]
+    if not monthly:
+        return 0
+
+    last = monthly[-1]
+    month = _add_months(date(int(last[1:5]), int(last[5:7]), 1), 1)
+    target = _add_months(date.today().replace(day=1), months_ahead)
+    partitions = []
+    while month <= target:
+        partitions.append(_month_partition(month))
+        month = _add_months(month, 1)
+
+    if partitions:
+        cursor.execute(
+            f"ALTER TABLE {table} REORGANIZE PARTITION p_future INTO "
+            f"({', '.join(partitions)}, PARTITION p_future VALUES LESS THAN MAXVALUE)"
+        )
+        logger.info(f"{table} 新建 {len(partitions)} 个月分区")
+    return len(partitions)
+
+
+def _partition_points_history(cursor):
+    """把 points_history 改为按 created_at 的月分区表"""
+    if list_partitions(cursor, 'points_history'):
+        return
+
+    # 分区表不支持外键，先删除外键
+    cursor.execute(
+        "SELECT constraint_name AS name FROM information_schema.table_constraints "
+        "WHERE table_schema = DATABASE() AND table_name = 'points_history' AND constraint_type = 'FOREIGN KEY'"
+    )
+    for row in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE points_history DROP FOREIGN KEY {row['name']}")
+
+    # 分区字段必须包含在主键中
+    cursor.execute("UPDATE points_history SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    cursor.execute(
+        "ALTER TABLE points_history "
+        "MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+    )
+
+    # 从最早的数据所在月份开始建分区
+    cursor.execute("SELECT MIN(created_at) AS oldest FROM points_history")
+    oldest = cursor.fetchone()['oldest']
+    month = (oldest.date() if oldest else date.today()).replace(day=1)
+    target = _add_months(date.today().replace(day=1), POINTS_HISTORY_PARTITIONS_AHEAD)
+    partitions = []
+    while month <= target:
+        partitions.append(_month_partition(month))
+        month = _add_months(month, 1)
+
+    cursor.execute(
+        "ALTER TABLE points_history PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) "
+        f"({', '.join(partitions)}, PARTITION p_future VALUES LESS THAN MAXVALUE)"
+    )
+
+
+# 迁移列表：(版本号, 说明, 步骤列表)，步骤为 SQL 字符串或接收 cursor 的函数
+MIGRATIONS = [
+    (1, '初始表结构', [
+        """
+        CREATE TABLE IF NOT EXISTS bot_groups (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT NOT NULL,
+            group_name VARCHAR(255) NOT NULL,
+            join_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE,
+            UNIQUE KEY (group_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS group_configs (
+            group_id BIGINT PRIMARY KEY,
+            group_name VARCHAR(255) DEFAULT '未命名群组',
+            welcome_msg TEXT,
+            language VARCHAR(10) DEFAULT 'zh',
+            anti_spam BOOLEAN DEFAULT FALSE,
+            auto_delete BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS points_configs (
+            group_id BIGINT PRIMARY KEY,
+            points_enabled BOOLEAN DEFAULT FALSE,
+            checkin_points INT DEFAULT 1,
+            message_points INT DEFAULT 1,
+            daily_message_limit INT DEFAULT 0,
+            min_message_length INT DEFAULT 0,
+            invite_points INT DEFAULT 1,
+            daily_invite_limit INT DEFAULT 0,
+            points_alias VARCHAR(50) DEFAULT '积分',
+            ranking_alias VARCHAR(50) DEFAULT '积分排行',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_points (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT,
+            user_id BIGINT,
+            points INT DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY group_user (group_id, user_id),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS points_history (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT,
+            user_id BIGINT,
+            points_change INT NOT NULL,
+            reason VARCHAR(255),
+            admin_id BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS checkin_records (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT,
+            user_id BIGINT,
+            checkin_date DATE,
+            points_earned INT DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY group_user_date (group_id, user_id, checkin_date),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS message_points_records (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT,
+            user_id BIGINT,
+            message_date DATE,
+            points_earned INT DEFAULT 0,
+            message_count INT DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY group_user_date (group_id, user_id, message_date),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS invite_points_records (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT,
+            inviter_id BIGINT,
+            invitee_id BIGINT,
+            invite_date DATE,
+            points_earned INT DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY group_inviter_invitee (group_id, inviter_id, invitee_id),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (2, '积分表覆盖索引', [
+        add_index('points_history', 'idx_group_user_created', 'group_id, user_id, created_at'),
+        add_index('invite_points_records', 'idx_group_inviter_date', 'group_id, inviter_id, invite_date'),
+        add_index('user_points', 'idx_group_points', 'group_id, points'),
+    ]),
+    (3, '积分历史按月分区和每日汇总', [
+        add_column('points_configs', 'history_retention_days', 'INT DEFAULT 90'),
+        """
+        CREATE TABLE IF NOT EXISTS points_history_daily (
+            group_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            summary_date DATE NOT NULL,
+            reason VARCHAR(255) NOT NULL DEFAULT '',
+            points_change INT NOT NULL DEFAULT 0,
+            entries INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, user_id, summary_date, reason)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS points_history_compacted (
+            partition_name VARCHAR(64) PRIMARY KEY,
+            compacted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        add_index('points_history', 'idx_group_created', 'group_id, created_at'),
+        _partition_points_history,
+    ]),
+    (4, '违禁词表', [
+        """
+        CREATE TABLE IF NOT EXISTS banned_words (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT NOT NULL,
+            word VARCHAR(255) NOT NULL,
+            created_by BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY group_word (group_id, word),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS banned_words_versions (
+            group_id BIGINT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (5, '反刷屏设置', [
+        add_column('group_configs', 'antiflood_enabled', 'BOOLEAN DEFAULT FALSE'),
+        add_column('group_configs', 'antiflood_limit', 'INT DEFAULT 5'),
+        add_column('group_configs', 'antiflood_window', 'INT DEFAULT 10'),
+        add_column('group_configs', 'antiflood_action', "VARCHAR(10) DEFAULT 'mute'"),
+        add_column('group_configs', 'antiflood_mute_seconds', 'INT DEFAULT 300'),
+    ]),
+    (6, '自动回复规则', [
+        """
+        CREATE TABLE IF NOT EXISTS auto_replies (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT NOT NULL,
+            match_type VARCHAR(10) NOT NULL,
+            pattern VARCHAR(255) NOT NULL,
+            reply TEXT NOT NULL,
+            cooldown INT NOT NULL DEFAULT 0,
+            created_by BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY group_type_pattern (group_id, match_type, pattern),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS auto_replies_versions (
+            group_id BIGINT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (7, '定时消息', [
+        """
+        CREATE TABLE IF NOT EXISTS scheduled_messages (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT NOT NULL,
+            text TEXT NOT NULL,
+            schedule_type VARCHAR(10) NOT NULL,
+            interval_seconds INT,
+            cron VARCHAR(100),
+            next_run_at DATETIME NOT NULL,
+            enabled BOOLEAN DEFAULT TRUE,
+            created_by BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            KEY idx_enabled_next_run (enabled, next_run_at),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (8, '抽奖和参与者', [
+        """
+        CREATE TABLE IF NOT EXISTS lotteries (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            prize_count INT NOT NULL,
+            end_time DATETIME NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'pending',
+            message_id BIGINT,
+            created_by BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            drawn_at DATETIME,
+            KEY idx_status_end_time (status, end_time),
+            KEY idx_group_status (group_id, status),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lottery_participants (
+            lottery_id INT NOT NULL,
+            user_id BIGINT NOT NULL,
+            display_name VARCHAR(255),
+            is_winner BOOLEAN NOT NULL DEFAULT FALSE,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (lottery_id, user_id),
+            FOREIGN KEY (lottery_id) REFERENCES lotteries(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (9, '积分抽奖和抽奖券', [
+        """
+        CREATE TABLE IF NOT EXISTS points_lotteries (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            ticket_price INT NOT NULL,
+            max_tickets INT NOT NULL,
+            prize_count INT NOT NULL,
+            end_time DATETIME NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'pending',
+            message_id BIGINT,
+            created_by BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            drawn_at DATETIME,
+            KEY idx_status_end_time (status, end_time),
+            KEY idx_group_status (group_id, status),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS points_lottery_tickets (
+            lottery_id INT NOT NULL,
+            user_id BIGINT NOT NULL,
+            display_name VARCHAR(255),
+            tickets INT NOT NULL,
+            is_winner BOOLEAN NOT NULL DEFAULT FALSE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (lottery_id, user_id),
+            FOREIGN KEY (lottery_id) REFERENCES points_lotteries(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (10, '接龙和接龙记录', [
+        """
+        CREATE TABLE IF NOT EXISTS chains (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            group_id BIGINT NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            status VARCHAR(10) NOT NULL DEFAULT 'active',
+            message_id BIGINT,
+            post_closed BOOLEAN NOT NULL DEFAULT FALSE,
+            created_by BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at DATETIME,
+            KEY idx_group_status (group_id, status),
+            KEY idx_status_post_closed (status, post_closed),
+            FOREIGN KEY (group_id) REFERENCES group_configs(group_id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chain_entries (
+            chain_id INT NOT NULL,
+            seq INT NOT NULL,
+            user_id BIGINT NOT NULL,
+            display_name VARCHAR(255),
+            content VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chain_id, seq),
+            UNIQUE KEY chain_user (chain_id, user_id),
+            FOREIGN KEY (chain_id) REFERENCES chains(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (11, '群组统计汇总表', [
+        """
+        CREATE TABLE IF NOT EXISTS group_stats_hourly (
+            group_id BIGINT NOT NULL,
+            hour DATETIME NOT NULL,
+            messages INT NOT NULL DEFAULT 0,
+            joins INT NOT NULL DEFAULT 0,
+            leaves INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, hour)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS group_stats_daily (
+            group_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            messages INT NOT NULL DEFAULT 0,
+            joins INT NOT NULL DEFAULT 0,
+            leaves INT NOT NULL DEFAULT 0,
+            active_users INT NOT NULL DEFAULT 0,
+            active_users_hll BLOB,
+            PRIMARY KEY (group_id, day)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (12, '积分排行增量校对索引', [
+        add_index('user_points', 'idx_updated_at', 'updated_at'),
+    ]),
+]
+
+# 热点查询及其应使用的索引，用于 EXPLAIN 检查
+HOT_QUERIES = [
+    (
+        "SELECT user_id, points FROM user_points WHERE group_id = 0 ORDER BY points DESC LIMIT 10",
+        'user_points', 'idx_group_points'
+    ),
+    (
+        "SELECT points FROM user_points WHERE group_id = 0 AND user_id = 0",
+        'user_points', 'group_user'
+    ),
+    (
+        "SELECT points_change, reason, created_at FROM points_history "
+        "WHERE group_id = 0 AND user_id = 0 ORDER BY created_at DESC LIMIT 20",
+        'points_history', 'idx_group_user_created'
+    ),
+    (
+        "SELECT COUNT(*) FROM invite_points_records "
+        "WHERE group_id = 0 AND inviter_id = 0 AND invite_date = CURDATE()",
+        'invite_points_records', 'idx_group_inviter_date'
+    ),
+    (
+        "SELECT points_earned FROM message_points_records "
+        "WHERE group_id = 0 AND user_id = 0 AND message_date = CURDATE()",
+        'message_points_records', 'group_user_date'
+    ),
+    (
+        "SELECT id FROM scheduled_messages WHERE enabled = TRUE AND next_run_at <= NOW()",
+        'scheduled_messages', 'idx_enabled_next_run'
+    ),
+]
+
+
+def get_connection(database=DB_NAME):
+    """获取迁移专用的数据库连接（DDL 会隐式提交，不使用连接池）"""
+    return pymysql.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        port=DB_PORT,
+        database=database,
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def create_database():
+    """创建数据库（如果不存在）"""
+    conn = get_connection(database=None)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE DATABASE IF NOT EXISTS {DB_NAME} "
+                "DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"
+            )
+        logger.info(f"数据库 {DB_NAME} 创建成功或已存在")
+    finally:
+        conn.close()
+
+
+def _ensure_version_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def current_version(cursor):
+    """获取已应用的最高版本号"""
+    _ensure_version_table(cursor)
+    cursor.execute("SELECT MAX(version) AS version FROM schema_migrations")
+    row = cursor.fetchone()
+    return row['version'] or 0
+
+
+def migrate(target=None):
+    """把数据库迁移到 target 版本（默认最新版本），返回迁移后的版本号"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            version = current_version(cursor)
+            for migration_version, description, steps in MIGRATIONS:
+                if migration_version <= version:
+                    continue
+                if target is not None and migration_version > target:
+                    break
+
+                logger.info(f"应用迁移 {migration_version}: {description}")
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (migration_version, description)
+                )
+                conn.commit()
+                version = migration_version
+
+        logger.info(f"数据库结构已是版本 {version}")
+        return version
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _is_unique_index(cursor, table, index):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s AND non_unique = 0 LIMIT 1",
+        (table, index)
+    )
+    return cursor.fetchone() is not None
+
+
+def check_query_plans():
+    """对热点查询执行 EXPLAIN，返回实际没有使用预期索引的查询列表
+
+    执行计划中该表的 key 必须是预期索引且不是全表扫描；possible_keys 只说明优化器考虑过该索引，不算使用。
+    唯一索引上的常量查找在表中没有匹配行时，MySQL 在优化阶段就已得出结果，执行计划中没有该表，这种情况视为使用了索引。
+    """
+    failures = []
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            for sql, table, index in HOT_QUERIES:
+                cursor.execute(f"EXPLAIN {sql}")
+                rows = cursor.fetchall()
+                plan = [row for row in rows if row.get('table') == table]
+                if plan:
+                    used = any(row.get('key') == index and row.get('type') != 'ALL' for row in plan)
+                else:
+                    used = (
+                        any('no matching row in const table' in (row.get('Extra') or '') for row in rows)
+                        and _is_unique_index(cursor, table, index)
+                    )
+                if not used:
+                    failures.append((sql, index, rows))
+    finally:
+        conn.close()
+    return failures
+
+
+if __name__ == "__main__":
+    if '--explain' in sys.argv:
+        failures = check_query_plans()
+        for sql, index, plan in failures:
+            print(f"未使用索引 {index}: {sql}\n  执行计划: {plan}")
+        if failures:
+            sys.exit(1)
+        print("所有热点查询均使用了索引")
+    else:
+        create_database()
+        migrate()
+        print("数据库迁移完成")
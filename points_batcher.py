@@ -0,0 +1,188 @@
+"""
+发言积分批量写入模块，在内存中累计发言积分，定时批量写入数据库
+"""
+import asyncio
+from datetime import date
+
+from loguru import logger
+
+from config import MESSAGE_POINTS_FLUSH_INTERVAL_MS, MESSAGE_POINTS_FLUSH_MAX_EVENTS
+from db_async import run_db
+from db_operations import transaction, credit_points_bulk
+
+
+class _PendingPoints:
+    """单个 (群组, 用户, 日期) 的累计状态"""
+
+    __slots__ = ('earned', 'points', 'count', 'daily_limit')
+
+    def __init__(self):
+        self.earned = 0  # 当日已获得积分（已写入 + 待写入）
+        self.points = 0  # 待写入的积分
+        self.count = 0  # 待写入的发言次数
+        self.daily_limit = 0
+
+
+class MessagePointsBatcher:
+    """发言积分累加器，每隔 flush_interval 毫秒或累计 flush_max_events 条发言时批量写入"""
+
+    def __init__(self, flush_interval_ms=MESSAGE_POINTS_FLUSH_INTERVAL_MS,
+                 flush_max_events=MESSAGE_POINTS_FLUSH_MAX_EVENTS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_events = flush_max_events
+        self._entries = {}
+        self._pending_events = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+
+    def add(self, group_id, user_id, text_length, points, daily_limit=0, min_length=0):
+        """记录一次发言，返回是否获得积分（每日上限和最小字数在内存中判断）"""
+        if points <= 0:
+            return False
+        if min_length and text_length < min_length:
+            return False
+
+        # 日期按本进程时钟计算并直接写入 message_date，数据库一侧不使用 CURDATE()
+        key = (int(group_id), int(user_id), date.today())
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _PendingPoints()
+        entry.daily_limit = daily_limit
+
+        if daily_limit > 0:
+            if entry.earned >= daily_limit:
+                return False
+            points = min(points, daily_limit - entry.earned)
+
+        entry.earned += points
+        entry.points += points
+        entry.count += 1
+
+        self._pending_events += 1
+        if self._pending_events >= self.flush_max_events:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """把累计的发言积分批量写入数据库"""
+        async with self._flush_lock:
+            batch = {}
+            for key, entry in self._entries.items():
+                if entry.count:
+                    batch[key] = (entry.points, entry.count, entry.daily_limit)
+                    entry.points = 0
+                    entry.count = 0
+            self._pending_events = 0
+
+            if batch:
+                try:
+                    totals = await run_db(_write_batch, batch)
+                except BaseException:
+                    # 线程池已关闭等异常同样不能丢失数据
+                    self._requeue(batch)
+                    raise
+                if totals is None:
+                    # 写入失败，把数据放回累加器等待下次重试
+                    self._requeue(batch)
+                else:
+                    # 用数据库中的当日积分校正内存状态
+                    for key, total in totals.items():
+                        entry = self._entries[key]
+                        entry.earned = total + entry.points
+
+            # 清理已经过去的日期
+            today = date.today()
+            for key in [k for k, e in self._entries.items() if k[2] < today and not e.count]:
+                del self._entries[key]
+
+    def _requeue(self, batch):
+        for key, (points, count, _) in batch.items():
+            entry = self._entries[key]
+            entry.points += points
+            entry.count += count
+            self._pending_events += count
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"批量写入发言积分失败: {e}")
+
+    def start(self):
+        """启动后台定时写入任务"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入剩余数据"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info("发言积分已全部写入数据库")
+
+
+def _write_batch(batch):
+    """在一个事务中批量写入发言记录、用户积分和积分历史，返回各键写入后的当日积分"""
+    try:
+        with transaction() as cursor:
+            keys = list(batch)
+
+            # 读取当日已有记录并加锁，用于按每日上限截断
+            placeholders = ', '.join(['(%s, %s, %s)'] * len(keys))
+            cursor.execute(
+                "SELECT group_id, user_id, message_date, points_earned FROM message_points_records "
+                f"WHERE (group_id, user_id, message_date) IN ({placeholders}) FOR UPDATE",
+                [value for key in keys for value in key]
+            )
+            existing = {
+                (row['group_id'], row['user_id'], row['message_date']): row['points_earned']
+                for row in cursor.fetchall()
+            }
+
+            records = []
+            user_deltas = {}
+            totals = {}
+            for key in keys:
+                points, count, daily_limit = batch[key]
+                earned = existing.get(key, 0)
+                if daily_limit > 0:
+                    points = max(0, min(points, daily_limit - earned))
+                group_id, user_id, message_date = key
+                records.append((group_id, user_id, message_date, points, count))
+                totals[key] = earned + points
+                if points:
+                    user_deltas[(group_id, user_id)] = user_deltas.get((group_id, user_id), 0) + points
+
+            cursor.executemany(
+                "INSERT INTO message_points_records (group_id, user_id, message_date, points_earned, message_count) "
+                "VALUES (%s, %s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE points_earned = points_earned + VALUES(points_earned), "
+                "message_count = message_count + VALUES(message_count)",
+                records
+            )
+
+            credit_points_bulk(
+                cursor,
+                [(group_id, user_id, points) for (group_id, user_id), points in user_deltas.items()],
+                '发言奖励'
+            )
+            return totals
+    except Exception as e:
+        logger.error(f"批量写入发言积分失败: {e}")
+        return None
+
+
+# 全局发言积分累加器
+message_points_batcher = MessagePointsBatcher()
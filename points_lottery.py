@@ -0,0 +1,262 @@
+"""
+积分抽奖模块，用户用积分购买抽奖券，开奖时按抽奖券数加权抽出中奖者
+"""
+import html
+import random
+from datetime import datetime, timedelta
+
+from loguru import logger
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from cache import TTLCache
+from config import LOTTERY_SCHEDULE_HORIZON, LOTTERY_CACHE_SIZE, LOTTERY_CACHE_TTL, LOTTERY_COUNT_EDIT_INTERVAL
+from config import POINTS_LOTTERY_TICKET_CHOICES
+from db_async import run_db
+from db_operations import get_points_lottery, get_schedulable_points_lotteries, set_points_lottery_message
+from db_operations import buy_lottery_tickets, draw_points_lottery
+from db_operations import get_points_lottery_winners
+from message_editor import message_editor
+
+# 购买按钮的回调数据前缀，后面是抽奖ID和购买张数
+BUY_PREFIX = 'buy_ticket_'
+
+# 开奖使用系统随机数
+_random = random.SystemRandom()
+
+
+class WeightedSampler:
+    """树状数组（Fenwick 树）上的加权不放回抽样
+
+    构建 O(n)，每次抽取按前缀和二分定位 O(log n)，抽中后把权重置零 O(log n)，
+    大量参与者抽多个中奖者时不必每次重建前缀和数组。
+    """
+
+    def __init__(self, weights):
+        self._weights = list(weights)
+        size = len(self._weights)
+        self._tree = [0] + self._weights
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self._tree[parent] += self._tree[i]
+        self.total = sum(self._weights)
+        self._top = 1 << (size.bit_length() - 1) if size else 0
+
+    def _find(self, target):
+        """找出前缀和第一次超过 target 的下标"""
+        pos = 0
+        step = self._top
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return pos
+
+    def _remove(self, index):
+        weight = self._weights[index]
+        self._weights[index] = 0
+        self.total -= weight
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] -= weight
+            i += i & -i
+
+    def take(self, rng=_random):
+        """按权重抽出一个下标并移除，全部抽完时返回 None"""
+        if self.total <= 0:
+            return None
+        index = self._find(rng.randrange(self.total))
+        self._remove(index)
+        return index
+
+
+def weighted_winners(entries, count, rng=_random):
+    """从 [(用户ID, 抽奖券数)] 中按抽奖券数不放回地抽出 count 个中奖者"""
+    sampler = WeightedSampler(tickets for _, tickets in entries)
+    winners = []
+    while len(winners) < count:
+        index = sampler.take(rng)
+        if index is None:
+            break
+        winners.append(entries[index][0])
+    return winners
+
+
+def draw(lottery_id, prize_count):
+    """抽出中奖者并保存开奖结果（同步函数，需在线程池中执行）
+
+    读取抽奖券和保存结果在同一个事务中，与开奖同时提交的购买也会参与抽奖。
+    返回中奖者ID列表；抽奖已开奖时返回 None，保证重复触发只开奖一次。
+    """
+    return draw_points_lottery(lottery_id, lambda entries: weighted_winners(entries, prize_count))
+
+
+def post_markup(lottery_id):
+    """积分抽奖消息下方的购买按钮"""
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(f"🎟 购买 {count} 张", callback_data=f'{BUY_PREFIX}{lottery_id}_{count}')
+        for count in POINTS_LOTTERY_TICKET_CHOICES
+    ]])
+
+
+def post_text(row, tickets_sold):
+    """群组中积分抽奖消息的内容"""
+    return (
+        f"🎁 积分抽奖\n\n"
+        f"标题：{row['title']}\n"
+        f"每张抽奖券：{row['ticket_price']} 积分（每人最多 {row['max_tickets']} 张）\n"
+        f"奖品数量：{row['prize_count']}\n"
+        f"开奖时间：{row['end_time']:%Y-%m-%d %H:%M}\n"
+        f"已售抽奖券：{tickets_sold} 张\n\n"
+        f"抽奖券越多，中奖概率越高，每人最多中奖一次。"
+    )
+
+
+class PointsLotteryManager:
+    """缓存积分抽奖信息和已售抽奖券数，并为即将开奖的积分抽奖安排开奖任务"""
+
+    def __init__(self, cache_size=LOTTERY_CACHE_SIZE, cache_ttl=LOTTERY_CACHE_TTL):
+        self._lotteries = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # 已安排开奖任务的抽奖ID -> (开奖时间, 任务)
+        self._scheduled = {}
+
+    async def _info(self, lottery_id):
+        info = self._lotteries.get(lottery_id)
+        if info is None:
+            info = await run_db(get_points_lottery, lottery_id)
+            if not info:
+                return None
+            self._lotteries.set(lottery_id, info)
+        return info
+
+    def _closed(self, info):
+        return info['status'] != 'pending' or datetime.now() >= info['end_time']
+
+    async def buy(self, lottery_id, user, count):
+        """购买抽奖券，返回 (结果, 持有张数, 抽奖信息)，结果为 ok / closed / limit / insufficient / missing / error"""
+        info = await self._info(lottery_id)
+        if info is None:
+            return 'missing', None, None
+        if self._closed(info):
+            return 'closed', None, info
+
+        result, tickets = await run_db(buy_lottery_tickets, lottery_id, user.id, user.full_name[:255], count)
+        if result == 'ok':
+            info['tickets_sold'] += count
+            if info['message_id']:
+                message_editor.request(
+                    info['group_id'], info['message_id'],
+                    lambda: self._render_post(info),
+                    min_interval=LOTTERY_COUNT_EDIT_INTERVAL
+                )
+        return result, tickets, info
+
+    def _render_post(self, info):
+        if self._closed(info):
+            return None
+        return {'text': post_text(info, info['tickets_sold']), 'reply_markup': post_markup(info['id'])}
+
+    async def poll(self, context):
+        """发布尚未发布的积分抽奖，为即将开奖的积分抽奖安排开奖任务"""
+        now = datetime.now()
+        until = now + timedelta(seconds=LOTTERY_SCHEDULE_HORIZON)
+        rows = await run_db(get_schedulable_points_lotteries, until)
+        if rows is None:
+            return
+
+        for row in rows:
+            if row['message_id'] is None:
+                await self._announce(context.bot, row)
+
+            scheduled = self._scheduled.get(row['id'])
+            if scheduled is not None:
+                if scheduled[0] == row['end_time']:
+                    continue
+                scheduled[1].schedule_removal()
+            if row['end_time'] > until:
+                self._scheduled.pop(row['id'], None)
+                continue
+            job = context.job_queue.run_once(
+                self.draw_job,
+                when=max((row['end_time'] - now).total_seconds(), 0),
+                data=row,
+                name=f"points_lottery_draw_{row['id']}"
+            )
+            self._scheduled[row['id']] = (row['end_time'], job)
+
+    async def _announce(self, bot, row):
+        try:
+            message = await bot.send_message(
+                chat_id=row['group_id'],
+                text=post_text(row, 0),
+                reply_markup=post_markup(row['id'])
+            )
+        except Exception as e:
+            logger.error(f"发布积分抽奖 {row['id']} 到群组 {row['group_id']} 失败: {e}")
+            return
+        row['message_id'] = message.message_id
+        await run_db(set_points_lottery_message, row['id'], message.message_id)
+        logger.info(f"积分抽奖 {row['id']} 已发布到群组 {row['group_id']}")
+
+    async def draw_job(self, context):
+        """定时任务：到开奖时间后按抽奖券数加权抽出中奖者并在群组中公布"""
+        row = context.job.data
+        self._scheduled.pop(row['id'], None)
+        self._lotteries.invalidate(row['id'])
+        if row['message_id']:
+            message_editor.cancel(row['group_id'], row['message_id'])
+
+        winners = await run_db(draw, row['id'], row['prize_count'])
+        if winners is None:
+            return
+        logger.info(f"积分抽奖 {row['id']} 已开奖，中奖 {len(winners)} 人")
+
+        if winners:
+            entries = {item['user_id']: item for item in await run_db(get_points_lottery_winners, row['id'])}
+            lines = []
+            for i, user_id in enumerate(winners, 1):
+                entry = entries.get(user_id, {})
+                name = html.escape(entry.get('display_name') or str(user_id))
+                lines.append(f'{i}. <a href="tg://user?id={user_id}">{name}</a>（{entry.get("tickets", "?")} 张）')
+            text = f"🎉 积分抽奖「{html.escape(row['title'])}」已开奖！\n\n中奖名单：\n" + "\n".join(lines)
+        else:
+            text = f"积分抽奖「{html.escape(row['title'])}」已结束，没有用户购买抽奖券。"
+
+        try:
+            if row['message_id']:
+                await context.bot.edit_message_reply_markup(
+                    chat_id=row['group_id'], message_id=row['message_id'], reply_markup=None
+                )
+            await context.bot.send_message(chat_id=row['group_id'], text=text, parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"公布积分抽奖 {row['id']} 结果失败: {e}")
+
+
+# 全局积分抽奖管理器
+points_lottery_manager = PointsLotteryManager()
+
+
+async def buy_callback(update, context):
+    """群组中“购买抽奖券”按钮的回调"""
+    query = update.callback_query
+    lottery_id, count = (int(part) for part in query.data[len(BUY_PREFIX):].split('_'))
+    if count not in POINTS_LOTTERY_TICKET_CHOICES:
+        await query.answer()
+        return
+
+    result, tickets, info = await points_lottery_manager.buy(lottery_id, query.from_user, count)
+    if result == 'ok':
+        text = f"✅ 购买成功！您当前持有 {tickets} 张抽奖券。"
+    elif result == 'insufficient':
+        text = f"积分不足，购买 {count} 张需要 {info['ticket_price'] * count} 积分。"
+    elif result == 'limit':
+        text = f"每人最多购买 {info['max_tickets']} 张抽奖券。"
+    elif result == 'closed':
+        text = "该积分抽奖已结束。"
+    elif result == 'missing':
+        text = "该积分抽奖不存在。"
+    else:
+        text = "购买失败，请稍后重试。"
+    await query.answer(text, show_alert=result == 'ok')
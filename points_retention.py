@@ -0,0 +1,104 @@
+"""
+积分历史保留模块，把超过保留天数的积分明细汇总为每日记录，并整体删除过期的月分区
+"""
+from datetime import date, datetime, timedelta
+
+from loguru import logger
+
+from config import POINTS_HISTORY_MAX_RETENTION_DAYS
+from db_async import run_db
+from db_operations import transaction
+from migrations import list_partitions, ensure_future_partitions
+
+
+def _rollup_sql(source, where):
+    """生成把明细按 (群组, 用户, 日期, 原因) 累加到每日汇总表的 SQL"""
+    return (
+        "INSERT INTO points_history_daily (group_id, user_id, summary_date, reason, points_change, entries) "
+        "SELECT * FROM ("
+        "SELECT group_id, user_id, DATE(created_at) AS summary_date, IFNULL(reason, '') AS reason, "
+        "SUM(points_change) AS points_change, COUNT(*) AS entries "
+        f"FROM points_history {source} WHERE {where} "
+        "GROUP BY group_id, user_id, DATE(created_at), IFNULL(reason, '')"
+        ") AS s "
+        "ON DUPLICATE KEY UPDATE points_change = points_history_daily.points_change + s.points_change, "
+        "entries = points_history_daily.entries + s.entries"
+    )
+
+
+def compact_group_history(group_id, retention_days, today=None):
+    """把群组中早于保留天数的明细逐日汇总并删除，返回删除的明细条数"""
+    cutoff = datetime.combine((today or date.today()) - timedelta(days=retention_days), datetime.min.time())
+    compacted = 0
+    while True:
+        with transaction() as cursor:
+            cursor.execute(
+                "SELECT MIN(created_at) AS oldest FROM points_history WHERE group_id = %s AND created_at < %s",
+                (group_id, cutoff)
+            )
+            oldest = cursor.fetchone()['oldest']
+            if oldest is None:
+                return compacted
+
+            # 每个事务处理一天，汇总和删除在同一事务中，避免重复累加
+            start = datetime.combine(oldest.date(), datetime.min.time())
+            end = min(start + timedelta(days=1), cutoff)
+            cursor.execute(
+                _rollup_sql('', 'group_id = %s AND created_at >= %s AND created_at < %s'),
+                (group_id, start, end)
+            )
+            compacted += cursor.execute(
+                "DELETE FROM points_history WHERE group_id = %s AND created_at >= %s AND created_at < %s",
+                (group_id, start, end)
+            )
+
+
+def drop_expired_partitions(now=None):
+    """汇总并删除整体超过最长保留天数的月分区，返回删除的分区数"""
+    cutoff = int(((now or datetime.now()) - timedelta(days=POINTS_HISTORY_MAX_RETENTION_DAYS)).timestamp())
+    with transaction() as cursor:
+        partitions = list_partitions(cursor, 'points_history')
+
+    dropped = 0
+    for name, bound in partitions:
+        if bound is None or bound > cutoff:
+            break
+
+        # 标记和汇总在同一事务中，删除分区中途失败时重试不会重复汇总
+        with transaction() as cursor:
+            if cursor.execute(
+                "INSERT IGNORE INTO points_history_compacted (partition_name) VALUES (%s)", (name,)
+            ):
+                cursor.execute(_rollup_sql(f'PARTITION ({name})', '1 = 1'))
+
+        with transaction() as cursor:
+            cursor.execute(f"ALTER TABLE points_history DROP PARTITION {name}")
+        dropped += 1
+        logger.info(f"积分历史分区 {name} 已汇总并删除")
+    return dropped
+
+
+def run_retention():
+    """执行一次积分历史保留任务（同步函数，需在线程池中执行）"""
+    with transaction() as cursor:
+        ensure_future_partitions(cursor)
+        cursor.execute(
+            "SELECT group_id, history_retention_days FROM points_configs "
+            "WHERE history_retention_days > 0 AND history_retention_days < %s",
+            (POINTS_HISTORY_MAX_RETENTION_DAYS,)
+        )
+        groups = cursor.fetchall()
+
+    compacted = 0
+    for row in groups:
+        compacted += compact_group_history(row['group_id'], row['history_retention_days'])
+    dropped = drop_expired_partitions()
+    logger.info(f"积分历史保留任务完成: 汇总明细 {compacted} 条，删除分区 {dropped} 个")
+
+
+async def retention_job(context):
+    """定时任务：汇总过期积分明细并删除过期分区"""
+    try:
+        await run_db(run_retention)
+    except Exception as e:
+        logger.error(f"积分历史保留任务失败: {e}")
@@ -0,0 +1,247 @@
+"""
+定时消息模块，只把即将到期的定时消息载入内存中的最小堆，由一个定时任务统一检查并发送
+"""
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+
+import telegram
+from loguru import logger
+
+from config import SCHEDULE_LOAD_HORIZON, SCHEDULE_RELOAD_INTERVAL, SCHEDULE_MISFIRE_GRACE
+from config import SCHEDULE_CHAT_MIN_INTERVAL, SCHEDULE_SENDS_PER_TICK
+from db_async import run_db
+from db_operations import get_due_scheduled_messages, update_scheduled_next_runs, disable_scheduled_messages
+
+# cron 各字段的取值范围：分 时 日 月 星期（0 和 7 都表示星期日）
+_CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+_INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+            if step <= 0:
+                raise ValueError(f"步长必须大于 0: {field}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"取值超出范围 {low}-{high}: {field}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """五段式 cron 表达式：分 时 日 月 星期，支持 * 、列表、范围和步长"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("cron 表达式需要 5 个字段：分 时 日 月 星期")
+        self.expression = ' '.join(fields)
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, _CRON_FIELDS)
+        )
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        # 日和星期都有限制时满足其一即可，与标准 cron 一致
+        self._day_any = fields[2] == '*'
+        self._weekday_any = fields[4] == '*'
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._day_any or self._weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """返回 moment 之后（不含）的下一次触发时间，五年内没有时返回 None"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                moment = moment.replace(year=moment.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        return None
+
+
+def parse_interval(text):
+    """解析 30m、2h、1d 这样的间隔，返回秒数，格式不正确时返回 None"""
+    text = text.strip().lower()
+    if len(text) < 2 or text[-1] not in _INTERVAL_UNITS or not text[:-1].isdigit():
+        return None
+    return int(text[:-1]) * _INTERVAL_UNITS[text[-1]]
+
+
+def next_run_after(row, moment):
+    """计算定时消息在 moment 之后的下一次触发时间
+
+    间隔类型从上一次计划时间按整数倍向后推，重启或延迟发送都不会让触发时间逐渐漂移。
+    """
+    if row['schedule_type'] == 'interval':
+        interval = timedelta(seconds=row['interval_seconds'])
+        planned = row['next_run_at']
+        if planned > moment:
+            return planned
+        return planned + interval * ((moment - planned) // interval + 1)
+    return CronSchedule(row['cron']).next_after(moment)
+
+
+class Scheduler:
+    """定时消息调度器
+
+    只载入 horizon 秒内到期的定时消息，按触发时间放入最小堆；每次 tick 取出到期的消息分批发送，
+    同一群组两次发送至少间隔 chat_min_interval 秒，新的触发时间批量写回数据库。
+    只应在一个进程中运行，分片模式下由维护分片负责。
+    """
+
+    def __init__(self, horizon=SCHEDULE_LOAD_HORIZON, reload_interval=SCHEDULE_RELOAD_INTERVAL,
+                 misfire_grace=SCHEDULE_MISFIRE_GRACE, chat_min_interval=SCHEDULE_CHAT_MIN_INTERVAL,
+                 sends_per_tick=SCHEDULE_SENDS_PER_TICK):
+        self.horizon = timedelta(seconds=horizon)
+        self.reload_interval = timedelta(seconds=reload_interval)
+        self.misfire_grace = timedelta(seconds=misfire_grace)
+        self.chat_min_interval = timedelta(seconds=chat_min_interval)
+        self.sends_per_tick = sends_per_tick
+        # 定时消息编号 -> 数据库中的行，fire_at 为实际发送时间（受群组发送间隔影响可能晚于 next_run_at）
+        self._entries = {}
+        self._heap = []
+        self._last_sent = {}
+        self._pending = {}
+        self._loaded_at = None
+        self._loaded_until = None
+        self._reload_requested = True
+        self.sent = 0
+
+    def request_reload(self):
+        """定时消息被修改后，在下一次 tick 时重新载入"""
+        self._reload_requested = True
+
+    def _push(self, row, fire_at):
+        row['fire_at'] = fire_at
+        heapq.heappush(self._heap, (fire_at, row['id']))
+
+    def _reschedule(self, row, next_run_at):
+        """记录新的触发时间，超出已载入范围的消息移出内存，等下次载入"""
+        self._pending[row['id']] = next_run_at
+        if next_run_at is None or next_run_at > self._loaded_until:
+            self._entries.pop(row['id'], None)
+            return
+        row['next_run_at'] = next_run_at
+        self._push(row, next_run_at)
+
+    def _rebuild(self, rows, now):
+        self._entries = {}
+        self._heap = []
+        self._loaded_at = now
+        self._loaded_until = now + self.horizon
+        for row in rows:
+            self._entries[row['id']] = row
+            if row['next_run_at'] < now - self.misfire_grace:
+                # 停机期间错过太久的不再补发，直接计算下一次
+                self._reschedule(row, next_run_after(row, now))
+            else:
+                self._push(row, row['next_run_at'])
+        logger.info(f"已载入 {len(self._entries)} 条 {self.horizon.total_seconds():.0f} 秒内到期的定时消息")
+
+    async def flush(self):
+        """把新的触发时间批量写回数据库，失败时保留，下次再写"""
+        if not self._pending:
+            return True
+        pending = self._pending
+        self._pending = {}
+        updates = [(next_run_at, schedule_id) for schedule_id, next_run_at in pending.items() if next_run_at]
+        finished = [schedule_id for schedule_id, next_run_at in pending.items() if next_run_at is None]
+        ok = await run_db(update_scheduled_next_runs, updates)
+        if ok and finished:
+            ok = await run_db(disable_scheduled_messages, finished)
+        if not ok:
+            for schedule_id, next_run_at in pending.items():
+                self._pending.setdefault(schedule_id, next_run_at)
+        return ok
+
+    def _take_due(self, now):
+        """取出本次要发送的消息，群组发送过于频繁的推迟到允许的时间"""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.sends_per_tick:
+            fire_at, schedule_id = heapq.heappop(self._heap)
+            row = self._entries.get(schedule_id)
+            if row is None or row['fire_at'] != fire_at:
+                # 已被删除或重新安排的旧堆条目
+                continue
+            last_sent = self._last_sent.get(row['group_id'])
+            if last_sent is not None and now - last_sent < self.chat_min_interval:
+                self._push(row, last_sent + self.chat_min_interval)
+                continue
+            self._last_sent[row['group_id']] = now
+            due.append(row)
+        return due
+
+    async def _send(self, bot, row):
+        """发送一条定时消息，返回是否应继续保留该定时消息"""
+        try:
+            await bot.send_message(chat_id=row['group_id'], text=row['text'])
+            self.sent += 1
+        except telegram.error.RetryAfter as e:
+            # 被限流时推迟，不计为一次发送
+            self._push(row, datetime.now() + timedelta(seconds=e.retry_after))
+            return None
+        except telegram.error.Forbidden as e:
+            logger.warning(f"定时消息 {row['id']} 无法发送到群组 {row['group_id']}，已停用: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"发送定时消息 {row['id']} 失败: {e}")
+        return True
+
+    async def tick(self, context):
+        """定时任务：按需重新载入，发送到期的消息并写回下一次触发时间"""
+        now = datetime.now()
+        if self._reload_requested or self._loaded_at is None or now - self._loaded_at >= self.reload_interval:
+            # 先写回已发送消息的触发时间，避免重新载入后重复发送
+            if await self.flush():
+                rows = await run_db(get_due_scheduled_messages, now + self.horizon)
+                if rows is not None:
+                    self._reload_requested = False
+                    self._rebuild(rows, now)
+        if self._loaded_at is None:
+            return
+
+        due = self._take_due(now)
+        if due:
+            results = await asyncio.gather(*(self._send(context.bot, row) for row in due))
+            for row, keep in zip(due, results):
+                if keep is None:
+                    continue
+                self._reschedule(row, next_run_after(row, now) if keep else None)
+        await self.flush()
+
+    def stats(self):
+        """内存中的定时消息数、堆大小、待写回数和累计发送数"""
+        return {
+            'loaded': len(self._entries),
+            'heap': len(self._heap),
+            'pending': len(self._pending),
+            'sent': self.sent,
+        }
+
+
+# 全局定时消息调度器
+scheduler = Scheduler()
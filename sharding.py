@@ -0,0 +1,219 @@
+"""
+主机器人分片模块，由监督进程统一接收更新，按 chat_id 分发到多个工作进程处理
+"""
+import asyncio
+import multiprocessing
+import queue
+import signal
+
+from loguru import logger
+from telegram import Bot, Update
+
+from config import MAIN_BOT_TOKEN, UPDATE_MODE, BOT_API_BASE_URL
+from config import MAIN_BOT_SHARDS, SHARD_QUEUE_SIZE, SHARD_MONITOR_INTERVAL, SHARD_STOP_TIMEOUT
+import tg_bot_test
+from bot_setup import build_application, register_main_handlers, setup_main_jobs
+from db_async import shutdown_executor
+from db_pool import close_pool
+from lifecycle import lifecycle
+from chain import chain_writer
+from lottery import participation_queue
+from points_batcher import message_points_batcher
+from stats import stats_collector
+
+# 长轮询等待时间（秒）
+POLL_TIMEOUT = 30
+
+
+def _worker_main(index, shard_queue, maintenance):
+    """分片进程入口"""
+    # 由监督进程通过队列通知退出，忽略终端发给整个进程组的 Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, shard_queue, maintenance))
+
+
+def _get_update(shard_queue):
+    try:
+        return shard_queue.get(timeout=1)
+    except queue.Empty:
+        return queue.Empty
+
+
+async def _run_worker(index, shard_queue, maintenance):
+    """在分片进程中运行主机器人的处理器，按收到的顺序处理本分片的更新"""
+    application = build_application(MAIN_BOT_TOKEN, with_updater=False)
+    loop = asyncio.get_running_loop()
+    try:
+        if maintenance:
+            await tg_bot_test.setup_commands(application)
+        register_main_handlers(application)
+        await setup_main_jobs(application, maintenance=maintenance)
+
+        await application.initialize()
+        await application.start()
+        message_points_batcher.start()
+        participation_queue.start()
+        chain_writer.start()
+        logger.info(f"主机器人分片 {index} 已启动")
+
+        # 单独收到 SIGTERM 时自行停止
+        stopping = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stopping.set)
+        while not stopping.is_set():
+            data = await loop.run_in_executor(None, _get_update, shard_queue)
+            if data is None:
+                break
+            if data is not queue.Empty:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        # 启动中途失败时同样停止已启动的部分；stop() 会先处理完更新队列中剩余的更新
+        if application.running:
+            await application.stop()
+        await message_points_batcher.stop()
+        await participation_queue.stop()
+        await chain_writer.stop()
+        await stats_collector.flush()
+        await application.shutdown()
+        # 等待线程池和连接池关闭会阻塞，放到线程中执行
+        await asyncio.to_thread(shutdown_executor)
+        await asyncio.to_thread(close_pool)
+        logger.info(f"主机器人分片 {index} 已停止")
+
+
+class ShardSupervisor:
+    """分片监督者：接收主机器人的更新，按 chat_id 哈希分发到工作进程，并重启异常退出的进程"""
+
+    def __init__(self, token=MAIN_BOT_TOKEN, shards=MAIN_BOT_SHARDS, queue_size=SHARD_QUEUE_SIZE):
+        self.shards = shards
+        kwargs = {'base_url': BOT_API_BASE_URL} if BOT_API_BASE_URL else {}
+        self.bot = Bot(token, **kwargs)
+        # 接收到但尚未分发的更新，有上限，分片积压时轮询和 webhook 请求会随之等待
+        self.update_queue = asyncio.Queue(maxsize=queue_size)
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue(maxsize=queue_size) for _ in range(shards)]
+        self._processes = [None] * shards
+        self._tasks = []
+        # 下一次 get_updates 的 offset，只在更新放入分发队列后前移
+        self._offset = None
+        self.backpressure_events = 0
+        self.restarts = 0
+
+    def shard_for(self, update):
+        """同一个聊天的更新总是分到同一个分片，保证聊天内的处理顺序"""
+        if update.effective_chat:
+            key = update.effective_chat.id
+        elif update.effective_user:
+            key = update.effective_user.id
+        else:
+            key = 0
+        return key % self.shards
+
+    def _start_worker(self, index):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self._queues[index], index == 0),
+            name=f'main-bot-shard-{index}',
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def _poll(self):
+        await self.bot.delete_webhook()
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self._offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES
+                )
+            except Exception as e:
+                logger.error(f"获取更新失败: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self.update_queue.put(update)
+                self._offset = update.update_id + 1
+
+    async def _forward(self, update):
+        index = self.shard_for(update)
+        data = update.to_dict()
+        try:
+            self._queues[index].put_nowait(data)
+        except queue.Full:
+            # 分片积压时暂停分发，直到该分片腾出空间
+            self.backpressure_events += 1
+            logger.warning(f"分片 {index} 队列已满，暂停分发")
+            await asyncio.get_running_loop().run_in_executor(None, self._queues[index].put, data)
+
+    async def _dispatch(self):
+        while True:
+            update = await self.update_queue.get()
+            lifecycle.mark_update()
+            await self._forward(update)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(SHARD_MONITOR_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error(f"分片 {index} 进程已退出（退出码 {process.exitcode}），正在重启")
+                    self.restarts += 1
+                    self._start_worker(index)
+
+    async def start(self):
+        """启动工作进程和分发任务，轮询模式下同时启动唯一的长轮询"""
+        await self.bot.initialize()
+        for index in range(self.shards):
+            self._start_worker(index)
+        self._tasks = [asyncio.create_task(self._dispatch()), asyncio.create_task(self._monitor())]
+        if UPDATE_MODE == 'polling':
+            self._tasks.append(asyncio.create_task(self._poll()))
+        logger.info(f"主机器人分片监督者已启动，共 {self.shards} 个分片")
+
+    async def stop(self, timeout=SHARD_STOP_TIMEOUT):
+        """停止接收更新，把剩余更新交给分片处理后通知分片进程退出"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        while not self.update_queue.empty():
+            await self._forward(self.update_queue.get_nowait())
+
+        # offset 要在下一次 get_updates 时才提交给 Telegram，退出前确认最后一批，避免重启后重复处理
+        if UPDATE_MODE == 'polling' and self._offset is not None:
+            try:
+                await self.bot.get_updates(offset=self._offset, timeout=0)
+            except Exception as e:
+                logger.error(f"确认已接收的更新失败: {e}")
+
+        loop = asyncio.get_running_loop()
+        for index, shard_queue in enumerate(self._queues):
+            try:
+                await loop.run_in_executor(None, shard_queue.put, None, True, timeout)
+            except queue.Full:
+                logger.warning(f"分片 {index} 队列已满，无法发送停止通知")
+        for index, process in enumerate(self._processes):
+            if process is None:
+                # 启动中途失败时尚未创建的分片
+                continue
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning(f"分片 {index} 未能在 {timeout} 秒内退出，强制终止")
+                process.terminate()
+
+        await self.bot.shutdown()
+        logger.info(f"主机器人分片已全部停止: {self.stats()}")
+
+    def stats(self):
+        """各分片的队列深度、反压次数和重启次数"""
+        depths = []
+        for shard_queue in self._queues:
+            try:
+                depths.append(shard_queue.qsize())
+            except NotImplementedError:
+                depths.append(None)
+        return {
+            'queue_depths': depths,
+            'backpressure_events': self.backpressure_events,
+            'restarts': self.restarts,
+        }
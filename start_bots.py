@@ -1,13 +1,11 @@
 import asyncio
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, filters
+from telegram import Update
 from loguru import logger
-import importlib
 import sys
-import os
-import signal
 
 # 导入配置
 from config import MAIN_BOT_TOKEN, ADMIN_BOT_TOKEN, LOG_LEVEL, LOG_FILE
+from config import UPDATE_MODE, WEBHOOK_URL, MAIN_BOT_SHARDS, SHUTDOWN_DRAIN_TIMEOUT
 
 # 配置日志
 logger.remove()
@@ -18,32 +16,27 @@ logger.add(sys.stderr, level=LOG_LEVEL)
 sys.path.append('.')
 import tg_bot_test
 import admin_bot
+from bot_setup import build_application, register_main_handlers, register_admin_handlers, setup_main_jobs
+from db_async import shutdown_executor
+from db_pool import close_pool
+from lifecycle import lifecycle
+from chain import chain_writer
+from lottery import participation_queue
+from points_batcher import message_points_batcher
+from sharding import ShardSupervisor
+from stats import stats_collector
+from webhook_server import WebhookServer
 
-async def run_main_bot():
+async def run_main_bot(main_bot):
     """运行主机器人"""
     logger.info("准备启动主机器人...")
     
-    # 创建主机器人应用
-    main_bot = Application.builder().token(MAIN_BOT_TOKEN).build()
-    
-    logger.info("主机器人连接成功")
-    
     # 设置主机器人命令
     await tg_bot_test.setup_commands(main_bot)
     
-    # 为主机器人添加处理器
-    main_bot.add_handler(CommandHandler("start", tg_bot_test.start))
-    main_bot.add_handler(CommandHandler("help", tg_bot_test.help))
-    main_bot.add_handler(CommandHandler("about", tg_bot_test.about))
-    main_bot.add_handler(CallbackQueryHandler(tg_bot_test.button_callback))
-    main_bot.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, tg_bot_test.echo))
-    main_bot.add_handler(MessageHandler(
-        filters.ChatType.GROUPS & 
-        (filters.StatusUpdate.NEW_CHAT_MEMBERS | filters.StatusUpdate.LEFT_CHAT_MEMBER), 
-        tg_bot_test.handle_chat_member
-    ))
-    main_bot.add_handler(ChatMemberHandler(tg_bot_test.chat_member_status, ChatMemberHandler.MY_CHAT_MEMBER))
-    main_bot.add_error_handler(tg_bot_test.error)
+    # 为主机器人添加处理器和定时任务
+    register_main_handlers(main_bot)
+    await setup_main_jobs(main_bot)
     
     # 初始化和启动主机器人
     await main_bot.initialize()
@@ -51,28 +44,19 @@ async def run_main_bot():
     
     logger.info("主机器人已启动")
     
-    # 启动轮询
-    await main_bot.updater.start_polling()
-    
-    return main_bot
+    # 启动轮询，chat_member 更新需要显式订阅才能用于刷新成员状态缓存
+    if UPDATE_MODE == 'polling':
+        await main_bot.updater.start_polling(allowed_updates=Update.ALL_TYPES)
 
-async def run_admin_bot():
+async def run_admin_bot(admin_bot_app):
     """运行管理机器人"""
     logger.info("准备启动管理机器人...")
     
-    # 创建管理机器人应用
-    admin_bot_app = Application.builder().token(ADMIN_BOT_TOKEN).build()
-    
-    logger.info("管理机器人连接成功")
-    
     # 设置管理机器人命令
     await admin_bot.setup_commands(admin_bot_app)
     
     # 为管理机器人添加处理器
-    admin_bot_app.add_handler(CommandHandler("start", admin_bot.start))
-    admin_bot_app.add_handler(CommandHandler("help", admin_bot.help))
-    admin_bot_app.add_handler(CallbackQueryHandler(admin_bot.button_callback))
-    admin_bot_app.add_error_handler(admin_bot.error)
+    register_admin_handlers(admin_bot_app)
     
     # 初始化和启动管理机器人
     await admin_bot_app.initialize()
@@ -81,50 +65,89 @@ async def run_admin_bot():
     logger.info("管理机器人已启动")
     
     # 启动轮询
-    await admin_bot_app.updater.start_polling()
-    
-    return admin_bot_app
+    if UPDATE_MODE == 'polling':
+        await admin_bot_app.updater.start_polling()
+
+def add_stop_steps(main_bot, supervisor, admin_bot_app, webhook_server):
+    """注册停止步骤，只包含已经启动的部分，启动中途失败时也用它停止已启动的部分"""
+    # 先停止接收更新，再处理完已接收的更新，然后写入缓冲数据、关闭机器人和数据库连接
+    if webhook_server is not None:
+        lifecycle.add_step("停止 webhook 服务", webhook_server.stop)
+    for app in (main_bot, admin_bot_app):
+        if app is not None and app.updater is not None and app.updater.running:
+            lifecycle.add_step(f"停止轮询 @{app.bot.username}", app.updater.stop)
+    if supervisor is not None:
+        lifecycle.add_step("停止主机器人分片", supervisor.stop, timeout=None)
+    if main_bot is not None and main_bot.running:
+        lifecycle.add_step("处理主机器人剩余更新", main_bot.stop, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+    if admin_bot_app is not None and admin_bot_app.running:
+        lifecycle.add_step("处理管理机器人剩余更新", admin_bot_app.stop, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+    lifecycle.add_step("写入剩余的发言积分", message_points_batcher.stop)
+    lifecycle.add_step("写入剩余的抽奖参与者", participation_queue.stop)
+    lifecycle.add_step("写入剩余的接龙记录", chain_writer.stop)
+    lifecycle.add_step("写入剩余的群组统计", stats_collector.flush)
+    if main_bot is not None:
+        lifecycle.add_step("关闭主机器人", main_bot.shutdown)
+    if admin_bot_app is not None:
+        lifecycle.add_step("关闭管理机器人", admin_bot_app.shutdown)
+    lifecycle.add_step("关闭数据库线程池", shutdown_executor)
+    lifecycle.add_step("关闭数据库连接池", close_pool)
 
 async def main():
     """主函数"""
     logger.info("准备启动两个机器人...")
+    lifecycle.install_signal_handlers()
     
-    # 运行两个机器人
-    main_bot = await run_main_bot()
-    admin_bot_app = await run_admin_bot()
-    
+    main_bot = None
+    supervisor = None
+    admin_bot_app = None
+    webhook_server = None
+    try:
+        # 运行两个机器人，启用分片时主机器人的更新由分片进程处理
+        if MAIN_BOT_SHARDS > 0:
+            supervisor = ShardSupervisor()
+            await supervisor.start()
+        else:
+            main_bot = build_application(MAIN_BOT_TOKEN)
+            await run_main_bot(main_bot)
+        admin_bot_app = build_application(ADMIN_BOT_TOKEN)
+        await run_admin_bot(admin_bot_app)
+        
+        # webhook 模式下两个机器人共用一个本地 HTTP 服务
+        if UPDATE_MODE == 'webhook':
+            webhook_server = WebhookServer()
+            if supervisor is not None:
+                webhook_server.add_queue(supervisor.bot, supervisor.update_queue, MAIN_BOT_TOKEN,
+                                         allowed_updates=Update.ALL_TYPES)
+            else:
+                webhook_server.add_application(main_bot, MAIN_BOT_TOKEN, allowed_updates=Update.ALL_TYPES)
+            webhook_server.add_application(admin_bot_app, ADMIN_BOT_TOKEN)
+            await webhook_server.start()
+            await webhook_server.set_webhooks(WEBHOOK_URL)
+        
+        # 启动发言积分、抽奖参与者和接龙记录批量写入任务（分片模式下由各分片进程启动）
+        if main_bot is not None:
+            message_points_batcher.start()
+            participation_queue.start()
+            chain_writer.start()
+            lifecycle.watch(main_bot)
+        lifecycle.watch(admin_bot_app)
+    except BaseException:
+        # 启动中途失败时按停止顺序停止已经启动的部分
+        logger.exception("启动失败，正在停止已启动的部分")
+        add_stop_steps(main_bot, supervisor, admin_bot_app, webhook_server)
+        await lifecycle.shutdown()
+        raise
+    
+    add_stop_steps(main_bot, supervisor, admin_bot_app, webhook_server)
     logger.info("两个机器人已启动，按Ctrl+C停止")
     
-    # 等待停止信号
+    # 等待 SIGTERM/SIGINT 后按顺序停止
     try:
-        # 创建一个永不完成的任务，以保持程序运行
-        while True:
-            await asyncio.sleep(1)
-    except KeyboardInterrupt:
-        # 捕获Ctrl+C
-        logger.info("正在停止机器人...")
+        await lifecycle.wait()
     finally:
-        # 停止两个机器人
-        await main_bot.stop()
-        await admin_bot_app.stop()
-        logger.info("两个机器人已停止")
+        await lifecycle.shutdown()
 
 if __name__ == "__main__":
-    # 确保没有其他Python进程在运行
-    try:
-        # 获取当前进程ID
-        current_pid = os.getpid()
-        
-        # 在Windows上使用tasklist命令查找Python进程
-        if os.name == 'nt':
-            os.system(f'taskkill /F /FI "IMAGENAME eq python.exe" /FI "PID ne {current_pid}"')
-        # 在Linux/Mac上使用pkill命令
-        else:
-            os.system(f'pkill -f python -9')
-        
-        logger.info("已终止其他Python进程")
-    except Exception as e:
-        logger.error(f"终止其他进程时出错: {e}")
-    
     # 运行两个机器人
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,212 @@
+"""
+群组统计模块，消息和成员变动只在内存中计数，定时汇总写入每小时和每天的统计表，统计页面直接读取汇总结果
+"""
+import asyncio
+import math
+import zlib
+from datetime import datetime, timedelta
+
+from loguru import logger
+
+from config import STATS_HLL_PRECISION, STATS_HOURLY_RETENTION_DAYS, STATS_HLL_RETENTION_DAYS
+from db_async import run_db
+from db_operations import transaction, prune_group_stats
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(value):
+    """splitmix64，把用户ID打散为均匀分布的 64 位哈希"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计，用固定大小的寄存器估算不重复用户数，可合并"""
+
+    def __init__(self, precision=STATS_HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+        self._alpha = 0.7213 / (1 + 1.079 / self.size)
+
+    def add(self, value):
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """合并另一个相同精度的 HyperLogLog"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """估算的不重复数量，数量较少时使用线性计数修正"""
+        estimate = self._alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """压缩后的寄存器，活跃用户少的群组大部分寄存器为 0，压缩后很小"""
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=STATS_HLL_PRECISION):
+        return cls(precision, zlib.decompress(data) if data else None)
+
+
+class _Bucket:
+    """单个群组一小时内尚未写入的计数"""
+
+    __slots__ = ('messages', 'joins', 'leaves', 'users')
+
+    def __init__(self):
+        self.messages = 0
+        self.joins = 0
+        self.leaves = 0
+        self.users = set()
+
+
+class StatsCollector:
+    """群组统计累加器
+
+    消息、加入和离开按 (群组, 小时) 计数，发言用户记入集合；定时写入时按小时累加到
+    group_stats_hourly，按天累加到 group_stats_daily，并把发言用户并入当天的 HyperLogLog。
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._flush_lock = asyncio.Lock()
+
+    def _bucket(self, group_id, now):
+        key = (int(group_id), (now or datetime.now()).replace(minute=0, second=0, microsecond=0))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    def record_message(self, group_id, user_id, now=None):
+        bucket = self._bucket(group_id, now)
+        bucket.messages += 1
+        bucket.users.add(user_id)
+
+    def record_join(self, group_id, now=None):
+        self._bucket(group_id, now).joins += 1
+
+    def record_leave(self, group_id, now=None):
+        self._bucket(group_id, now).leaves += 1
+
+    async def flush(self, context=None):
+        """把累计的计数写入汇总表，失败时放回内存等待下次重试；可作为定时任务或停止步骤"""
+        async with self._flush_lock:
+            if not self._buckets:
+                return
+            buckets = self._buckets
+            self._buckets = {}
+            try:
+                written = await run_db(_write_rollups, buckets)
+            except BaseException:
+                self._requeue(buckets)
+                raise
+            if written is None:
+                self._requeue(buckets)
+
+    def _requeue(self, buckets):
+        for key, bucket in buckets.items():
+            current = self._buckets.get(key)
+            if current is None:
+                self._buckets[key] = bucket
+                continue
+            current.messages += bucket.messages
+            current.joins += bucket.joins
+            current.leaves += bucket.leaves
+            current.users |= bucket.users
+
+
+def _write_rollups(buckets):
+    """在一个事务中累加每小时和每天的统计，并合并当天的活跃用户 HyperLogLog"""
+    hourly = []
+    daily = {}
+    for (group_id, hour), bucket in buckets.items():
+        hourly.append((group_id, hour, bucket.messages, bucket.joins, bucket.leaves))
+        totals = daily.get((group_id, hour.date()))
+        if totals is None:
+            totals = daily[(group_id, hour.date())] = [0, 0, 0, set()]
+        totals[0] += bucket.messages
+        totals[1] += bucket.joins
+        totals[2] += bucket.leaves
+        totals[3] |= bucket.users
+
+    try:
+        with transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO group_stats_hourly (group_id, hour, messages, joins, leaves) "
+                "VALUES (%s, %s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE messages = messages + VALUES(messages), "
+                "joins = joins + VALUES(joins), leaves = leaves + VALUES(leaves)",
+                hourly
+            )
+
+            # 锁定已有的当天记录，合并 HyperLogLog 后写回
+            keys = list(daily)
+            placeholders = ', '.join(['(%s, %s)'] * len(keys))
+            cursor.execute(
+                "SELECT group_id, day, active_users_hll FROM group_stats_daily "
+                f"WHERE (group_id, day) IN ({placeholders}) FOR UPDATE",
+                [value for key in keys for value in key]
+            )
+            existing = {(row['group_id'], row['day']): row['active_users_hll'] for row in cursor.fetchall()}
+
+            rows = []
+            for key, (messages, joins, leaves, users) in daily.items():
+                hll = HyperLogLog.from_bytes(existing.get(key))
+                hll.update(users)
+                rows.append(key + (messages, joins, leaves, hll.count(), hll.to_bytes()))
+            cursor.executemany(
+                "INSERT INTO group_stats_daily "
+                "(group_id, day, messages, joins, leaves, active_users, active_users_hll) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE messages = messages + VALUES(messages), "
+                "joins = joins + VALUES(joins), leaves = leaves + VALUES(leaves), "
+                "active_users = VALUES(active_users), active_users_hll = VALUES(active_users_hll)",
+                rows
+            )
+            return True
+    except Exception as e:
+        logger.error(f"写入群组统计失败: {e}")
+        return None
+
+
+def merged_active_users(rows):
+    """合并多天的活跃用户 HyperLogLog，估算这些天内的不重复活跃用户数"""
+    merged = HyperLogLog()
+    for row in rows:
+        if row['active_users_hll']:
+            merged.merge(HyperLogLog.from_bytes(row['active_users_hll']))
+    return merged.count()
+
+
+# 全局统计累加器
+stats_collector = StatsCollector()
+
+
+async def prune_job(context):
+    """定时任务：删除过期的每小时统计和每日 HyperLogLog"""
+    now = datetime.now()
+    result = await run_db(
+        prune_group_stats,
+        now - timedelta(days=STATS_HOURLY_RETENTION_DAYS),
+        (now - timedelta(days=STATS_HLL_RETENTION_DAYS)).date()
+    )
+    if result and any(result):
+        logger.info(f"已清理 {result[0]} 条每小时统计和 {result[1]} 天的活跃用户 HyperLogLog")
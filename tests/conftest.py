@@ -0,0 +1,55 @@
+"""
+测试公共配置
+
+需要 MySQL 的测试默认跳过。设置环境变量 TG_BOT_TEST_DB 为一个专用于测试的数据库名后运行，
+测试会在该数据库中建表并写入数据，不要指向正式数据库。
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+TEST_DB = os.environ.get('TG_BOT_TEST_DB')
+if TEST_DB:
+    # 连接池和迁移模块在导入时读取数据库名，必须在导入它们之前替换
+    config.DB_NAME = TEST_DB
+
+
+@pytest.fixture(scope='session')
+def mysql_db():
+    """迁移到最新版本的测试数据库，未配置或无法连接时跳过"""
+    if not TEST_DB:
+        pytest.skip("未设置 TG_BOT_TEST_DB，跳过需要 MySQL 的测试")
+    import migrations
+    try:
+        migrations.create_database()
+        migrations.migrate()
+    except Exception as e:
+        pytest.skip(f"无法连接测试数据库 {TEST_DB}: {e}")
+    return TEST_DB
+
+
+@pytest.fixture
+def test_group(mysql_db):
+    """测试用的群组，结束后删除群组及其积分记录"""
+    import migrations
+    group_id = -1009000000000 - os.getpid()
+    conn = migrations.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT IGNORE INTO group_configs (group_id, group_name) VALUES (%s, %s)",
+                (group_id, '测试群组')
+            )
+        conn.commit()
+        yield group_id
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM points_history WHERE group_id = %s", (group_id,))
+            cursor.execute("DELETE FROM group_configs WHERE group_id = %s", (group_id,))
+        conn.commit()
+        conn.close()
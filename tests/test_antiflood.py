@@ -0,0 +1,38 @@
+"""
+反刷屏记录测试
+"""
+import time
+
+from antiflood import FloodTracker
+
+
+def test_limit_within_window_triggers_once():
+    tracker = FloodTracker()
+    results = [tracker.hit(1, 1, 3, 10, now=t) for t in (0, 1, 2, 3)]
+    assert results == [(False, False), (False, False), (True, True), (True, False)]
+    # 超出时间窗口后恢复
+    assert tracker.hit(1, 1, 3, 10, now=30) == (False, False)
+
+
+def test_idle_entries_are_evicted():
+    tracker = FloodTracker(max_tracked=100, idle_ttl=60)
+    for user_id in range(50):
+        tracker.hit(1, user_id, 5, 10, now=0)
+    for i in range(50):
+        tracker.hit(2, i, 5, 10, now=100 + i)
+    assert len(tracker) == 50
+
+    for user_id in range(1000):
+        tracker.hit(3, user_id, 5, 10, now=200)
+    assert len(tracker) == 100
+
+
+def test_throughput_over_10k_messages_per_second():
+    tracker = FloodTracker()
+    count = 200000
+    started = time.perf_counter()
+    for i in range(count):
+        tracker.hit(i % 50, i % 5000, 5, 10, now=i / 10000)
+    rate = count / (time.perf_counter() - started)
+    print(f"\n反刷屏检查：{rate:,.0f} 条/秒")
+    assert rate > 10000
@@ -0,0 +1,132 @@
+"""
+反垃圾检测测试
+"""
+import random
+import time
+
+from antispam import SpamDetector, link_domains
+
+TEXT = "限时福利，添加客服微信领取免费会员，名额有限先到先得"
+
+
+def test_www_prefix_is_one_domain():
+    assert link_domains("https://www.x.com/a www.x.com/b http://X.com") == {'x.com'}
+
+
+def test_link_limit_is_per_user():
+    detector = SpamDetector(link_limit=3)
+    # 不同用户各自分享同一网站的链接（内容很短，不参与近似比对）
+    for user_id in range(10):
+        reason, _ = detector.check(1, user_id, user_id, f"www.youtube.com/{user_id}", now=0)
+        assert reason is None
+
+    results = [detector.check(1, 99, 100 + i, f"www.spam.example/{i}", now=i)[0] for i in range(3)]
+    assert results == [None, None, 'link_flood']
+
+
+def test_allowed_domains_are_not_counted():
+    detector = SpamDetector(link_limit=2, allowed_domains=('youtube.com',))
+    for i in range(5):
+        reason, _ = detector.check(1, 1, i, f"https://m.youtube.com/watch?v={i}", now=i)
+        assert reason is None
+
+
+def test_near_duplicates_from_several_users():
+    detector = SpamDetector(min_users=3)
+    assert detector.check(1, 1, 10, TEXT, now=0) == (None, [])
+    assert detector.check(1, 2, 11, TEXT + "!", now=1) == (None, [])
+    reason, message_ids = detector.check(1, 3, 12, "【" + TEXT + "】", now=2)
+    assert reason == 'duplicate'
+    assert sorted(message_ids) == [10, 11, 12]
+
+
+# 基准语料：正常聊天由常用词随机组成，垃圾消息由模板改写后被多个用户分散发送
+VOCAB = (
+    "今天 明天 我们 大家 群里 这个 那个 问题 时间 晚上 周末 一起 吃饭 电影 项目 代码 服务器 部署 测试 版本 "
+    "更新 文档 会议 讨论 方案 需求 用户 数据 接口 报错 日志 重启 配置 网络 速度 价格 推荐 链接 图片 视频 "
+    "游戏 比赛 天气 下雨 出门 回家 上班 下班 加班 休息 学习 考试 老师 同学 朋友 手机 电脑 键盘 耳机 好像 "
+    "觉得 应该 可以 不能 已经 还是 但是 因为 所以 如果 然后 怎么 为什么 什么 哪里 多少 真的 确实 感觉"
+).split()
+SPAM_TEMPLATES = [
+    "限时福利添加客服微信领取免费会员名额有限先到先得",
+    "兼职日结工资五百起在家就能做手机操作简单联系我",
+    "最新内部消息某币即将暴涨三倍赶紧上车私聊拿群号",
+    "低价出售各类会员账号视频音乐全都有需要的私聊",
+    "免费领取价值九百九十九元课程仅限今天扫码进群",
+    "Free crypto airdrop claim your tokens now at our official site",
+]
+FULL_WIDTH = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+                           'ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ')
+
+
+def _format_variant(rng, text):
+    """只改格式的变体：插入标点、表情、空格和零宽字符，英文改为全角或大写"""
+    chars = list(text)
+    for _ in range(rng.randint(1, 4)):
+        chars.insert(rng.randrange(len(chars) + 1), rng.choice(['！', '~', '。', '🔥', '👉', '【', '】', ' ', '​']))
+    text = ''.join(chars)
+    if rng.random() < 0.3:
+        text = text.translate(FULL_WIDTH)
+    elif rng.random() < 0.3:
+        text = text.upper()
+    return text + rng.choice(['', '!!', '～', '👍'])
+
+
+def _edit_variant(rng, text):
+    """改一个字的变体"""
+    chars = list(text)
+    chars[rng.randrange(len(chars))] = rng.choice('的了吗呢啊')
+    return ''.join(chars)
+
+
+def _two_edits_variant(rng, text):
+    """改两个字的变体"""
+    return _edit_variant(rng, _edit_variant(rng, text))
+
+
+def _corpus(seed, variant):
+    """返回 [(用户ID, 文本, 是否垃圾消息)]：5000 条正常消息中穿插 18 批、每批 3～6 个用户发送的垃圾消息"""
+    rng = random.Random(seed)
+    messages = [
+        (rng.randrange(1000), ''.join(rng.choice(VOCAB) for _ in range(rng.randint(5, 20))), False)
+        for _ in range(5000)
+    ]
+    for batch, template in enumerate(SPAM_TEMPLATES * 3):
+        position = rng.randrange(len(messages) - 100)
+        for k in range(rng.randint(3, 6)):
+            position += rng.randint(1, 15)
+            messages.insert(position, (10000 + batch * 10 + k, variant(rng, template), True))
+    return messages
+
+
+def _evaluate(messages):
+    detector = SpamDetector()
+    flagged = set()
+    started = time.perf_counter()
+    for message_id, (user_id, text, _) in enumerate(messages):
+        _, message_ids = detector.check(1, user_id, message_id, text, now=message_id * 0.5)
+        flagged.update(message_ids)
+    elapsed = time.perf_counter() - started
+
+    spam = {message_id for message_id, message in enumerate(messages) if message[2]}
+    hits = len(flagged & spam)
+    precision = hits / len(flagged) if flagged else 1.0
+    return precision, hits / len(spam), len(messages) / elapsed
+
+
+def test_corpus_precision_recall_and_throughput():
+    precision, recall, rate = _evaluate(_corpus(1, _format_variant))
+    print(f"\n只改格式的垃圾消息：准确率 {precision:.1%}，召回率 {recall:.1%}，{rate:,.0f} 条/秒")
+    assert precision >= 0.95
+    assert recall >= 0.9
+    assert rate >= 2000
+
+    precision, recall, _ = _evaluate(_corpus(2, _edit_variant))
+    print(f"改一个字的垃圾消息：准确率 {precision:.1%}，召回率 {recall:.1%}")
+    assert precision >= 0.95
+    assert recall >= 0.9
+
+    precision, recall, _ = _evaluate(_corpus(3, _two_edits_variant))
+    print(f"改两个字的垃圾消息：准确率 {precision:.1%}，召回率 {recall:.1%}")
+    assert precision >= 0.95
+    assert recall >= 0.7
@@ -0,0 +1,142 @@
+"""
+自动回复测试：正则规则的安全检查、各类型的匹配和优先级、冷却、增量编译，以及规则增多时的匹配延迟
+"""
+import random
+import time
+
+import pytest
+
+from autoreply import MATCH_TYPES, AutoReplyEngine, check_regex
+
+
+def _rule(rule_id, pattern, match_type='regex'):
+    return {'id': rule_id, 'match_type': match_type, 'pattern': pattern, 'reply': f'回复{rule_id}', 'cooldown': 0}
+
+
+@pytest.mark.parametrize('pattern', [r'(a+)+$', r'(\w+\s?)*$', r'(.*a){20}', r'^(x|y+)*z', 'a' * 300])
+def test_catastrophic_patterns_are_rejected(pattern):
+    assert check_regex(pattern) is not None
+
+
+@pytest.mark.parametrize('pattern', [r'^hello\d+', r'(ab)+', r'(\d{3})+', r'[a-z]+@[a-z]+\.com', r'(a|b)*c'])
+def test_ordinary_patterns_are_accepted(pattern):
+    assert check_regex(pattern) is None
+
+
+def test_engine_skips_unsafe_rules_saved_before_the_check():
+    engine = AutoReplyEngine()
+    engine.set(1, [_rule(1, r'(a+)+$'), _rule(2, r'^hello\d+')])
+
+    started = time.perf_counter()
+    assert engine.match(1, 'a' * 5000 + '!') is None
+    assert time.perf_counter() - started < 0.5
+    assert engine.match(1, 'hello42')['id'] == 2
+
+
+def _engine(rules):
+    engine = AutoReplyEngine()
+    engine.set(1, rules)
+    return engine
+
+
+def test_priority_exact_prefix_contains_regex():
+    engine = _engine([
+        _rule(1, r'价格\d+'),
+        _rule(2, '价格', 'contains'),
+        _rule(3, '查', 'prefix'),
+        _rule(4, '查价格', 'prefix'),
+        _rule(5, '查价格', 'exact'),
+    ])
+    assert engine.match(1, '查价格')['id'] == 5
+    # 最长的前缀优先
+    assert engine.match(1, '查价格123')['id'] == 4
+    assert engine.match(1, '查一下')['id'] == 3
+    assert engine.match(1, '这个价格123')['id'] == 2
+    assert engine.match(1, '这个价钱') is None
+
+
+def test_contains_first_occurrence_wins():
+    engine = _engine([_rule(1, '苹果', 'contains'), _rule(2, '香蕉', 'contains')])
+    assert engine.match(1, '香蕉和苹果')['id'] == 2
+    assert engine.match(1, '苹果和香蕉')['id'] == 1
+
+
+def test_matching_is_normalized():
+    engine = _engine([_rule(1, 'Hello', 'exact'), _rule(2, 'ＶＩＰ', 'contains')])
+    assert engine.match(1, ' hello ')['id'] == 1
+    assert engine.match(1, '开通vip会员')['id'] == 2
+
+
+def test_cooldown_falls_through_to_next_rule():
+    rules = [_rule(1, '你好', 'exact'), _rule(2, '你', 'prefix')]
+    rules[0]['cooldown'] = 60
+    engine = _engine(rules)
+    assert engine.match(1, '你好', now=0)['id'] == 1
+    assert engine.match(1, '你好', now=30)['id'] == 2
+    assert engine.match(1, '你好', now=61)['id'] == 1
+
+
+def test_rules_with_the_same_normalized_pattern_are_all_kept():
+    rules = [_rule(1, 'Hi', 'exact'), _rule(2, 'hi ', 'exact'), _rule(3, 'ＡＢ', 'contains'), _rule(4, 'ab', 'contains')]
+    for rule in rules:
+        rule['cooldown'] = 60
+    engine = _engine(rules)
+    assert [engine.match(1, 'hi', now=0)['id'], engine.match(1, 'hi', now=1)['id']] == [1, 2]
+    assert engine.match(1, 'hi', now=2) is None
+    assert [engine.match(1, 'xaby', now=0)['id'], engine.match(1, 'xaby', now=1)['id']] == [3, 4]
+
+
+def test_recompile_reuses_unchanged_types():
+    engine = AutoReplyEngine()
+    rules = [_rule(1, '你好', 'exact'), _rule(2, '查', 'prefix'), _rule(3, '价格', 'contains'), _rule(4, r'订单\d+')]
+    first = engine.set(1, rules)
+
+    # 只改回复内容不重新编译
+    rules[0] = dict(rules[0], reply='新的回复')
+    second = engine.set(1, rules)
+    assert all(second._compiled[match_type] is first._compiled[match_type] for match_type in first._compiled)
+    assert engine.match(1, '你好')['reply'] == '新的回复'
+
+    # 只重新编译规则有变化的类型
+    third = engine.set(1, rules + [_rule(5, '优惠', 'contains')])
+    assert third._compiled['contains'] is not second._compiled['contains']
+    for match_type in ('exact', 'prefix', 'regex'):
+        assert third._compiled[match_type] is second._compiled[match_type]
+    assert engine.match(1, '有优惠吗')['id'] == 5
+
+
+def _many_rules(count):
+    """count 条规则，四种类型各占四分之一"""
+    rules = []
+    for i in range(count):
+        match_type = MATCH_TYPES[i % 4]
+        pattern = f'订单{i}号\\d+' if match_type == 'regex' else f'关键词{i}号'
+        rules.append(_rule(i + 1, pattern, match_type))
+    return rules
+
+
+def _latency(count, messages):
+    engine = _engine(_many_rules(count))
+    samples = []
+    for text in messages:
+        started = time.perf_counter()
+        engine.match(1, text)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def test_match_latency_stays_flat_as_rules_grow():
+    rng = random.Random(1)
+    words = '今天 晚上 大家 一起 吃饭 明天 开会 订单 关键词 价格 多少 号'.split()
+    messages = [''.join(rng.choice(words) for _ in range(rng.randint(3, 30))) for _ in range(2000)]
+    # 一部分消息命中规则
+    messages += [f'请问关键词{i}号有吗' for i in range(0, 200, 3)] + [f'订单{i}号123' for i in range(3, 200, 4)]
+
+    small = _latency(10, messages)
+    large = _latency(5000, messages)
+    print(f"\n自动回复匹配延迟 p50/p99：10 条规则 {small[0] * 1e6:.0f}/{small[1] * 1e6:.0f} µs，"
+          f"5000 条规则 {large[0] * 1e6:.0f}/{large[1] * 1e6:.0f} µs")
+    # 允许少量常数差异（自动机状态更多、命中的候选更多），不随规则数线性增长
+    assert large[0] < small[0] * 3 + 20e-6
+    assert large[1] < 1e-3
@@ -0,0 +1,49 @@
+"""
+进程内缓存测试：读取期间条目被失效时不写入旧数据
+"""
+import db_operations
+from cache import TTLCache
+from db_operations import get_group_config_db, group_config_cache
+
+
+def test_set_skipped_after_invalidate():
+    cache = TTLCache(maxsize=10, ttl=60)
+    generation = cache.generation('a')
+    cache.invalidate('a')
+    assert cache.set('a', 'old', generation=generation) is False
+    assert cache.get('a') is None
+
+    # 其他键的失效不影响
+    generation = cache.generation('a')
+    cache.invalidate('b')
+    assert cache.set('a', 'new', generation=generation) is True
+    assert cache.get('a') == 'new'
+
+
+def test_generation_table_is_bounded():
+    cache = TTLCache(maxsize=10, ttl=60)
+    generation = cache.generation('a')
+    for i in range(20):
+        cache.invalidate(i)
+    assert len(cache._generations) <= 10
+    # 换代后之前取得的版本号作废
+    assert cache.set('a', 'old', generation=generation) is False
+
+
+def test_group_config_write_during_load_is_not_overwritten(monkeypatch):
+    group_id = -1009999999999
+
+    def load_racing_update(gid):
+        # 读到旧配置之后、写入缓存之前，管理员修改配置并使缓存失效
+        old = {'group_id': gid, 'antiflood_enabled': False}
+        group_config_cache.invalidate(str(gid))
+        return old
+
+    monkeypatch.setattr(db_operations, '_load_group_config_db', load_racing_update)
+    assert get_group_config_db(group_id)['antiflood_enabled'] is False
+    assert group_config_cache.get(str(group_id)) is None
+
+    monkeypatch.setattr(db_operations, '_load_group_config_db', lambda gid: {'group_id': gid, 'antiflood_enabled': True})
+    assert get_group_config_db(group_id)['antiflood_enabled'] is True
+    assert group_config_cache.get(str(group_id))['antiflood_enabled'] is True
+    group_config_cache.invalidate(str(group_id))
@@ -0,0 +1,111 @@
+"""
+异步数据库访问基准：并发更新下处理器的 p99 延迟
+
+数据库函数替换为固定耗时的同步桩函数，分别按旧写法（在处理器中直接调用）和 run_db（在数据库线程池中执行）
+驱动同一批并发更新，比较每个处理器从收到更新到处理完成的延迟。
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+import admin_bot
+import tg_bot_test
+from db_async import run_db
+
+DB_LATENCY = 0.005  # 每次数据库调用的耗时
+UPDATES = 100  # 每个机器人的并发更新数
+
+CONFIG = {
+    'group_name': '测试群组',
+    'points_enabled': True,
+    'points_alias': '积分',
+    'ranking_alias': '积分排行',
+}
+RANKING = [{'user_id': i, 'points': 100 - i} for i in range(10)]
+
+
+def _slow_config(group_id):
+    time.sleep(DB_LATENCY)
+    return dict(CONFIG)
+
+
+def _slow_ranking(group_id, limit=10):
+    time.sleep(DB_LATENCY)
+    return RANKING
+
+
+async def _blocking_run_db(func, *args, **kwargs):
+    """旧写法：在处理器中直接调用同步数据库函数"""
+    return func(*args, **kwargs)
+
+
+def _group_update(group_id, user_id):
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=group_id, type='supergroup'),
+        effective_user=SimpleNamespace(id=user_id, mention_html=lambda: f'用户 {user_id}'),
+        message=SimpleNamespace(text='积分排行', message_id=user_id, reply_text=AsyncMock()),
+    )
+
+
+def _callback_update():
+    return SimpleNamespace(callback_query=SimpleNamespace(answer=AsyncMock(), edit_message_text=AsyncMock()))
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def _drive():
+    """同时投递主机器人的群组消息和管理机器人的回调，返回每个处理器的延迟"""
+    context = SimpleNamespace(bot=SimpleNamespace(id=0), user_data={})
+    latencies = []
+
+    # 所有更新同时到达，延迟从到达时刻算起，包括在事件循环中等待的时间
+    started = time.perf_counter()
+
+    async def timed(handler):
+        await handler
+        latencies.append(time.perf_counter() - started)
+
+    handlers = []
+    for i in range(UPDATES):
+        group_id = -1000 - i
+        handlers.append(timed(tg_bot_test.echo(_group_update(group_id, i), context)))
+        handlers.append(timed(admin_bot.show_points_ranking(_callback_update(), context, group_id)))
+    await asyncio.gather(*handlers)
+    return latencies
+
+
+@pytest.fixture
+def slow_db(monkeypatch):
+    """数据库函数替换为固定耗时的桩函数，群组配置每次都从数据库读取"""
+    monkeypatch.setattr(admin_bot, 'get_group_config_db', _slow_config)
+    monkeypatch.setattr(admin_bot, 'db_get_points_ranking', _slow_ranking)
+    monkeypatch.setattr(tg_bot_test, 'get_points_ranking', _slow_ranking)
+    monkeypatch.setattr(admin_bot.group_config_cache, 'get', lambda key, default=None: default)
+
+
+def _measure(monkeypatch, runner):
+    monkeypatch.setattr(admin_bot, 'run_db', runner)
+    monkeypatch.setattr(tg_bot_test, 'run_db', runner)
+    return asyncio.run(_drive())
+
+
+def test_p99_handler_latency_under_concurrent_updates(slow_db, monkeypatch):
+    blocking = _measure(monkeypatch, _blocking_run_db)
+    pooled = _measure(monkeypatch, run_db)
+
+    blocking_p99 = _percentile(blocking, 0.99)
+    pooled_p99 = _percentile(pooled, 0.99)
+    print(
+        f"\n{UPDATES * 2} 个并发处理器，每次数据库调用 {DB_LATENCY * 1000:.0f} ms："
+        f"直接调用 p50 {_percentile(blocking, 0.5) * 1000:.0f} ms / p99 {blocking_p99 * 1000:.0f} ms，"
+        f"run_db p50 {_percentile(pooled, 0.5) * 1000:.0f} ms / p99 {pooled_p99 * 1000:.0f} ms"
+    )
+    assert len(pooled) == UPDATES * 2
+    # 直接调用时所有数据库调用在事件循环中串行执行，线程池按工作线程数并行
+    assert pooled_p99 < blocking_p99 / 3
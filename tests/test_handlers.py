@@ -0,0 +1,144 @@
+"""
+主机器人处理器注册测试：非文字消息和命令也要经过群组级别的处理器
+"""
+import asyncio
+from unittest.mock import AsyncMock
+from datetime import datetime, timezone
+
+import pytest
+from telegram import Bot, Chat, Message, MessageEntity, PhotoSize, Update, User
+
+import bot_setup
+import tg_bot_test
+from antiflood import flood_tracker
+from stats import stats_collector
+from word_filter import banned_word_registry
+
+GROUP_ID = -1001234567890
+
+
+def _message(message_id, user_id=1, **kwargs):
+    message = Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=GROUP_ID, type=Chat.SUPERGROUP),
+        from_user=User(id=user_id, first_name='测试', is_bot=False),
+        **kwargs
+    )
+    return Update(update_id=message_id, message=message)
+
+
+def _photo(message_id, caption=None, user_id=1):
+    photo = [PhotoSize(file_id='f', file_unique_id='u', width=1, height=1)]
+    return _message(message_id, user_id, photo=photo, caption=caption)
+
+
+def _command(message_id, command, user_id=1):
+    entity = MessageEntity(type=MessageEntity.BOT_COMMAND, offset=0, length=len(command))
+    return _message(message_id, user_id, text=command, entities=[entity])
+
+
+@pytest.fixture
+def application(monkeypatch):
+    """注册了主机器人处理器的 Application，echo 和统计替换为记录调用的桩函数，Telegram 请求替换为桩函数"""
+    echoed = []
+    recorded = []
+    config = {'antiflood_enabled': False}
+
+    async def fake_config(group_id):
+        return dict(config)
+
+    async def fake_echo(update, context):
+        echoed.append(update.message.message_id)
+
+    monkeypatch.setattr(tg_bot_test, 'echo', fake_echo)
+    monkeypatch.setattr(stats_collector, 'record_message', lambda group_id, user_id: recorded.append(group_id))
+    monkeypatch.setattr(tg_bot_test, 'get_group_config', fake_config)
+    monkeypatch.setattr(tg_bot_test, 'is_user_admin', AsyncMock(return_value=False))
+    # 不请求 Telegram
+    bot_user = {'id': 123, 'first_name': 'bot', 'is_bot': True, 'username': 'test_bot'}
+    monkeypatch.setattr(Bot, '_post', AsyncMock(return_value=bot_user))
+    monkeypatch.setattr(Bot, 'send_message', AsyncMock())
+    monkeypatch.setattr(Bot, 'restrict_chat_member', AsyncMock())
+    monkeypatch.setattr(Message, 'delete', AsyncMock())
+    monkeypatch.setattr(Message, 'reply_text', AsyncMock())
+    app = bot_setup.build_application('123:TEST', with_updater=False)
+    bot_setup.register_main_handlers(app)
+    app.echoed = echoed
+    app.recorded = recorded
+    app.config = config
+    return app
+
+
+def _process(application, *updates):
+    async def main():
+        await application.initialize()
+        for update in updates:
+            # 命令处理器通过消息取得机器人的用户名
+            update.message.set_bot(application.bot)
+            await application.process_update(update)
+        await application.shutdown()
+    asyncio.run(main())
+
+
+def test_stats_count_every_group_message(application):
+    _process(
+        application,
+        _message(1, text='你好'),
+        _photo(2),
+        _photo(3, caption='图片说明'),
+    )
+    assert application.recorded == [GROUP_ID] * 3
+    # 文字消息仍然交给 echo 处理，且只计数一次
+    assert application.echoed == [1]
+
+
+def _flood_config(application):
+    application.config.update({
+        'antiflood_enabled': True,
+        'antiflood_limit': 3,
+        'antiflood_window': 10,
+        'antiflood_action': 'warn',
+    })
+
+
+def test_media_flood_is_deleted(application):
+    _flood_config(application)
+    flood_tracker.reset(GROUP_ID, 2)
+    _process(application, *(_photo(10 + i, user_id=2) for i in range(5)))
+    # 第 3 条起超出上限，被删除
+    assert Message.delete.await_count == 3
+    assert Bot.send_message.await_count == 1
+    # 统计在刷屏检查之前，被删除的消息也计数
+    assert len(application.recorded) == 5
+
+
+def test_command_flood_is_deleted_before_command_handler(application):
+    _flood_config(application)
+    flood_tracker.reset(GROUP_ID, 3)
+    _process(application, *(_command(20 + i, '/help', user_id=3) for i in range(5)))
+    assert Message.delete.await_count == 3
+    # 只有前 2 条命令交给命令处理器
+    assert Message.reply_text.await_count == 2
+    assert Bot.send_message.await_count == 1
+
+
+@pytest.fixture
+def banned_words():
+    banned_word_registry.set(GROUP_ID, ['违禁词'])
+    yield
+    banned_word_registry.remove(GROUP_ID)
+
+
+def test_banned_words_in_captions_are_deleted(application, banned_words):
+    _process(
+        application,
+        _photo(30, caption='图片说明带违禁词', user_id=4),
+        _photo(31, caption='正常的图片说明', user_id=4),
+        _photo(32, user_id=4),
+        _message(33, text='文字里的违禁词', user_id=4),
+    )
+    assert Message.delete.await_count == 2
+    assert Bot.send_message.await_count == 2
+    # 被删除的文字消息不再交给 echo
+    assert application.echoed == []
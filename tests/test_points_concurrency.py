@@ -0,0 +1,40 @@
+"""
+积分增减的并发测试，需要 MySQL（见 conftest.py）
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from db_operations import add_user_points, deduct_user_points, get_user_points
+
+USER_ID = 42
+WORKERS = 20
+
+
+def _history_total(group_id):
+    import migrations
+    conn = migrations.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(points_change), 0) AS total FROM points_history "
+                "WHERE group_id = %s AND user_id = %s",
+                (group_id, USER_ID)
+            )
+            row = cursor.fetchone()
+            return row['entries'], int(row['total'])
+    finally:
+        conn.close()
+
+
+def test_concurrent_credits_and_debits_keep_balance_exact(test_group):
+    # 多个线程同时给一个还没有积分记录的用户加分，首次插入不能冲突丢失
+    with ThreadPoolExecutor(WORKERS) as pool:
+        results = list(pool.map(lambda _: add_user_points(test_group, USER_ID, 1, '并发测试'), range(1000)))
+    assert all(results)
+    assert get_user_points(test_group, USER_ID) == 1000
+
+    # 同时扣分，余额只够 33 次，不能扣成负数
+    with ThreadPoolExecutor(WORKERS) as pool:
+        results = list(pool.map(lambda _: deduct_user_points(test_group, USER_ID, 30, '并发测试'), range(40)))
+    assert results.count(True) == 33
+    assert get_user_points(test_group, USER_ID) == 10
+    assert _history_total(test_group) == (1033, 10)
@@ -0,0 +1,127 @@
+"""
+积分抽奖测试：加权抽样的分布，以及并发购买抽奖券时不超扣积分、与开奖同时提交的购买参与抽奖（后两者需要 MySQL，见 conftest.py）
+"""
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from points_lottery import WeightedSampler, weighted_winners
+
+
+def test_single_draw_follows_weights():
+    rng = random.Random(1)
+    weights = [1, 2, 3, 4, 0, 10]
+    draws = 200000
+    counts = Counter(WeightedSampler(weights).take(rng) for _ in range(draws))
+    total = sum(weights)
+    assert counts[4] == 0
+    for index, weight in enumerate(weights):
+        if weight:
+            assert abs(counts[index] / draws - weight / total) < 0.01
+
+
+def test_draw_without_replacement():
+    rng = random.Random(2)
+    sampler = WeightedSampler([5, 0, 1, 3])
+    taken = [sampler.take(rng) for _ in range(3)]
+    assert sorted(taken) == [0, 2, 3]
+    assert sampler.take(rng) is None
+
+    entries = [(user_id, 1 + user_id % 7) for user_id in range(1000)]
+    winners = weighted_winners(entries, 50, rng)
+    assert len(winners) == len(set(winners)) == 50
+    assert len(weighted_winners(entries[:3], 10, rng)) == 3
+
+
+def test_second_draw_matches_conditional_probability():
+    # 第一个抽出 0 号后，第二个在剩余权重中按比例抽取
+    rng = random.Random(3)
+    weights = [6, 1, 3]
+    second = Counter()
+    runs = 100000
+    for _ in range(runs):
+        sampler = WeightedSampler(weights)
+        if sampler.take(rng) == 0:
+            second[sampler.take(rng)] += 1
+    firsts = sum(second.values())
+    assert abs(second[1] / firsts - 0.25) < 0.01
+    assert abs(second[2] / firsts - 0.75) < 0.01
+
+
+def test_large_pool_draws_quickly():
+    rng = random.Random(4)
+    entries = [(user_id, rng.randint(1, 100)) for user_id in range(1000000)]
+    started = time.perf_counter()
+    winners = weighted_winners(entries, 1000, rng)
+    elapsed = time.perf_counter() - started
+    print(f"\n100 万参与者抽 1000 人：{elapsed * 1000:.0f} ms")
+    assert len(set(winners)) == 1000
+    assert elapsed < 10
+
+
+def test_concurrent_purchases_never_overspend(test_group):
+    from db_operations import add_user_points, get_user_points, create_points_lottery, buy_lottery_tickets
+
+    lottery_id = create_points_lottery(test_group, '并发测试', 10, 8, 1, datetime.now() + timedelta(hours=1))
+    assert lottery_id
+
+    # 用户 1 的积分够买 10 张但每人最多 8 张；用户 2 的积分只够买 2 张
+    balances = {1: 100, 2: 25}
+    for user_id, points in balances.items():
+        assert add_user_points(test_group, user_id, points, '并发测试')
+
+    jobs = [1] * 30 + [2] * 30
+    with ThreadPoolExecutor(20) as pool:
+        results = list(pool.map(lambda user_id: (user_id, buy_lottery_tickets(lottery_id, user_id, '测试', 1)), jobs))
+
+    for user_id, start in balances.items():
+        outcomes = Counter(result for uid, (result, _) in results if uid == user_id)
+        bought = outcomes['ok']
+        # 每一次成功的购买都恰好扣了一张的积分，积分不会为负，也不会超过每人上限
+        assert get_user_points(test_group, user_id) == start - 10 * bought >= 0
+        assert bought <= 8
+        held = max((tickets for uid, (result, tickets) in results if uid == user_id and result == 'ok'), default=0)
+        assert held == bought
+        if not outcomes['error']:
+            assert bought == min(8, start // 10)
+
+
+def test_purchase_racing_the_draw_takes_part(test_group, monkeypatch):
+    import db_operations
+    from db_operations import add_user_points, create_points_lottery, buy_lottery_tickets
+    from points_lottery import draw
+
+    lottery_id = create_points_lottery(test_group, '开奖竞争', 10, 5, 1, datetime.now() + timedelta(hours=1))
+    assert lottery_id
+    assert add_user_points(test_group, 1, 20, '开奖竞争')
+
+    # 让购买停在扣积分之前：此时已持有抽奖的共享锁并写入了抽奖券，尚未提交
+    locked = threading.Event()
+    release = threading.Event()
+    debit_points = db_operations.debit_points
+
+    def slow_debit(cursor, *args, **kwargs):
+        locked.set()
+        release.wait(10)
+        return debit_points(cursor, *args, **kwargs)
+
+    monkeypatch.setattr(db_operations, 'debit_points', slow_debit)
+    with ThreadPoolExecutor(2) as pool:
+        purchase = pool.submit(buy_lottery_tickets, lottery_id, 1, '测试', 1)
+        assert locked.wait(10)
+        drawing = pool.submit(draw, lottery_id, 1)
+        time.sleep(0.5)
+        # 开奖等待进行中的购买提交
+        assert not drawing.done()
+        release.set()
+        assert purchase.result()[0] == 'ok'
+        assert drawing.result() == [1]
+
+    # 开奖之后的购买不再扣积分，重复开奖无效
+    monkeypatch.setattr(db_operations, 'debit_points', debit_points)
+    assert buy_lottery_tickets(lottery_id, 1, '测试', 1) == ('closed', None)
+    assert db_operations.get_user_points(test_group, 1) == 10
+    assert draw(lottery_id, 1) is None
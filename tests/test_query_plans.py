@@ -0,0 +1,9 @@
+"""
+热点查询的执行计划检查
+"""
+import migrations
+
+
+def test_hot_queries_use_expected_indexes(mysql_db):
+    failures = migrations.check_query_plans()
+    assert not failures, "\n".join(f"未使用索引 {index}: {sql}\n  执行计划: {plan}" for sql, index, plan in failures)
@@ -0,0 +1,76 @@
+"""
+更新处理器测试
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def _update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def test_same_chat_keeps_order():
+    async def main():
+        processor = ChatOrderedUpdateProcessor(max_concurrent_updates=4)
+        done = []
+
+        async def handle(i, delay):
+            await asyncio.sleep(delay)
+            done.append(i)
+
+        await asyncio.gather(*(
+            processor.process_update(_update(1), handle(i, 0.01 * (5 - i))) for i in range(5)
+        ))
+        return done
+
+    assert asyncio.run(main()) == [0, 1, 2, 3, 4]
+
+
+def test_idle_chat_not_delayed_by_backlogged_chat():
+    async def main():
+        processor = ChatOrderedUpdateProcessor(max_concurrent_updates=4)
+
+        async def slow():
+            await asyncio.sleep(0.1)
+
+        async def fast():
+            return time.perf_counter()
+
+        # 聊天 1 积压 10 条慢更新，超过并发上限
+        backlog = [asyncio.create_task(processor.process_update(_update(1), slow())) for _ in range(10)]
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        finished = []
+
+        async def record():
+            finished.append(await fast())
+
+        await processor.process_update(_update(2), record())
+        waited = finished[0] - started
+        await asyncio.gather(*backlog)
+        return waited, processor.stats()
+
+    waited, stats = asyncio.run(main())
+    print(f"\n空闲聊天的更新等待 {waited * 1000:.1f} ms")
+    assert waited < 0.05
+    assert stats['processed'] == 11
+    assert stats['queued'] == 0
+
+
+def test_concurrency_limit_applies_after_chat_lock():
+    async def main():
+        processor = ChatOrderedUpdateProcessor(max_concurrent_updates=2)
+        peak = 0
+
+        async def handle():
+            nonlocal peak
+            peak = max(peak, processor.stats()['in_flight'])
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(processor.process_update(_update(chat_id), handle()) for chat_id in range(10)))
+        return peak
+
+    assert asyncio.run(main()) == 2
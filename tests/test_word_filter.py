@@ -0,0 +1,70 @@
+"""
+违禁词匹配测试：与逐个子串查找的结果一致，并在大词表上比它快
+"""
+import random
+import time
+
+from word_filter import BannedWordMatcher, normalize
+
+
+def _naive_contains(text, words):
+    """改用自动机之前的实现：小写后逐个判断子串"""
+    text = text.lower()
+    return any(word.lower() in text for word in words)
+
+
+def _naive_normalized(text, words):
+    """同样的逐个查找，但先做与自动机相同的规范化"""
+    text = normalize(text)[0]
+    return {word for word in words if normalize(word)[0] in text}
+
+
+def _corpus(rng, alphabet, count, min_length, max_length):
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(min_length, max_length))) for _ in range(count)]
+
+
+def test_matches_naive_substring_search_on_ascii():
+    rng = random.Random(1)
+    words = _corpus(rng, 'abcdeAB', 200, 2, 5)
+    matcher = BannedWordMatcher(words)
+    for text in _corpus(rng, 'abcdeAB xyz', 2000, 0, 60):
+        assert matcher.contains(text) == _naive_contains(text, words)
+
+
+def test_search_reports_every_word_at_original_positions():
+    rng = random.Random(2)
+    alphabet = 'abAB中文ＡＢ​好坏'
+    words = list(dict.fromkeys(_corpus(rng, '中文好坏ab', 100, 1, 3)))
+    matcher = BannedWordMatcher(words)
+    for text in _corpus(rng, alphabet, 1000, 0, 40):
+        found = matcher.search(text)
+        assert {word for _, _, word in found} == _naive_normalized(text, words)
+        for start, end, word in found:
+            assert normalize(text[start:end])[0] == normalize(word)[0]
+
+
+def test_case_width_and_zero_width_evasion():
+    matcher = BannedWordMatcher(['bad', '违禁'])
+    assert matcher.search('this is ＢＡＤ') == [(8, 11, 'bad')]
+    assert matcher.contains('违​禁')
+    assert matcher.contains('BaD')
+    assert not matcher.contains('ba d')
+
+
+def test_faster_than_naive_loop_on_large_word_list():
+    rng = random.Random(3)
+    words = _corpus(rng, 'abcdefghijklmnopqrstuvwxyz', 5000, 4, 8)
+    texts = _corpus(rng, 'abcdefghijklmnopqrstuvwxyz ', 200, 50, 200)
+    matcher = BannedWordMatcher(words)
+
+    started = time.perf_counter()
+    expected = [_naive_contains(text, words) for text in texts]
+    naive = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = [matcher.contains(text) for text in texts]
+    compiled = time.perf_counter() - started
+
+    assert actual == expected
+    print(f"\n5000 个违禁词、200 条消息：逐个查找 {naive * 1000:.1f} ms，自动机 {compiled * 1000:.1f} ms")
+    assert compiled < naive
@@ -1,27 +1,53 @@
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, ContextTypes, filters
-from telegram import Bot, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, ContextTypes, filters
+from telegram import Bot, BotCommand, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from loguru import logger
 import db_utils
+from cache import TTLCache
+from config import MEMBER_STATUS_CACHE_SIZE, MEMBER_STATUS_CACHE_TTL
+from db_async import run_db
+from admin_bot import get_group_config
+from db_operations import get_points_ranking, get_user_rank
+from points_batcher import message_points_batcher
+from word_filter import banned_word_registry
+from antiflood import flood_tracker
+from antispam import spam_detector
+from autoreply import auto_reply_engine
+from chain import handle_chain_message
+from stats import stats_collector
 import asyncio
+from datetime import datetime, timedelta, timezone
 
 # 管理机器人的用户名，请替换为您的第二个机器人的用户名
 ADMIN_BOT_USERNAME = "TEST1_SASABOT"  # 替换为您的管理机器人用户名
 
+# 群成员状态缓存，键为 (chat_id, user_id)，收到成员状态变化时刷新
+member_status_cache = TTLCache(maxsize=MEMBER_STATUS_CACHE_SIZE, ttl=MEMBER_STATUS_CACHE_TTL)
+
+# 获取成员在群组中的状态
+async def get_member_status(context, chat_id, user_id):
+    """获取成员在群组中的状态，优先读取缓存"""
+    key = (int(chat_id), int(user_id))
+    status = member_status_cache.get(key)
+    if status is None:
+        chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        status = chat_member.status
+        member_status_cache.set(key, status)
+    return status
+
 # 添加一个辅助函数来检查机器人是否为管理员
 async def is_bot_admin(context, chat_id):
     """检查机器人是否为群组管理员"""
     try:
-        # 获取机器人信息
-        bot_info = await context.bot.get_me()
-        bot_id = bot_info.id
+        # 机器人ID在启动时由 Application.initialize() 获取并缓存，无需每次调用 get_me()
+        bot_id = context.bot.id
         
         # 获取机器人在群组中的状态
-        chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=bot_id)
+        status = await get_member_status(context, chat_id, bot_id)
         
         # 判断是否为管理员
-        is_admin = chat_member.status in ['administrator', 'creator']
+        is_admin = status in ['administrator', 'creator']
         
-        logger.info(f"机器人ID: {bot_id}, 群组ID: {chat_id}, 状态: {chat_member.status}, 是否管理员: {is_admin}")
+        logger.info(f"机器人ID: {bot_id}, 群组ID: {chat_id}, 状态: {status}, 是否管理员: {is_admin}")
         
         return is_admin
     except Exception as e:
@@ -32,9 +58,9 @@ async def is_bot_admin(context, chat_id):
 async def is_user_admin(context, chat_id, user_id):
     """检查用户是否为群组管理员"""
     try:
-        chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-        is_admin = chat_member.status in ['creator', 'administrator']
-        logger.info(f"用户ID: {user_id}, 群组ID: {chat_id}, 状态: {chat_member.status}, 是否管理员: {is_admin}")
+        status = await get_member_status(context, chat_id, user_id)
+        is_admin = status in ['creator', 'administrator']
+        logger.info(f"用户ID: {user_id}, 群组ID: {chat_id}, 状态: {status}, 是否管理员: {is_admin}")
         return is_admin
     except Exception as e:
         logger.error(f"检查用户管理员状态时出错: {e}")
@@ -51,13 +77,13 @@ async def start(update, context):
         user_id = update.effective_user.id
         
         # 保存群组信息到数据库
-        db_utils.save_group(group_id, group_name)
+        await run_db(db_utils.save_group, group_id, group_name)
         
         # 同时保存到管理机器人的配置中
         try:
             from admin_bot import get_group_config, update_group_config
-            config = get_group_config(group_id)
-            update_group_config(group_id, 'group_name', group_name)
+            config = await get_group_config(group_id)
+            await update_group_config(group_id, 'group_name', group_name)
         except Exception as e:
             logger.error(f"保存群组名称到配置时出错: {e}")
         
@@ -112,7 +138,7 @@ async def start(update, context):
     else:
         # 在私聊中的响应
         # 获取机器人所在的群组列表
-        groups = db_utils.get_all_groups()
+        groups = await run_db(db_utils.get_all_groups)
         
         # 创建添加到群组的按钮
         keyboard = [
@@ -255,7 +281,7 @@ async def button_callback(update, context):
         await query.message.reply_text('请将机器人添加为频道管理员，然后转发一条频道消息给机器人。')
     elif query.data == 'add_group':
         # 获取机器人所在的群组列表
-        groups = db_utils.get_all_groups()
+        groups = await run_db(db_utils.get_all_groups)
         
         if groups:
             # 构建群组列表文本
@@ -335,12 +361,187 @@ async def help(update, context):
 async def about(update, context):
     await update.message.reply_text('这是一个群组管理机器人')
 
+# 检查群组中的刷屏
+async def check_flood(update, context, config):
+    """用户在时间窗口内发言超过上限时删除消息，并按群组设置禁言或警告；返回消息是否已被删除"""
+    group_id = update.effective_chat.id
+    user = update.effective_user
+    if not config.get('antiflood_enabled'):
+        return False
+    
+    flooded, started = flood_tracker.hit(
+        group_id,
+        user.id,
+        config.get('antiflood_limit') or 5,
+        config.get('antiflood_window') or 10
+    )
+    if not flooded or await is_user_admin(context, group_id, user.id):
+        return False
+    
+    try:
+        await update.message.delete()
+        # 每次超限只处理一次，之后的消息直接删除
+        if started:
+            if config.get('antiflood_action', 'mute') == 'mute':
+                mute_seconds = config.get('antiflood_mute_seconds') or 300
+                await context.bot.restrict_chat_member(
+                    chat_id=group_id,
+                    user_id=user.id,
+                    permissions=ChatPermissions(can_send_messages=False),
+                    until_date=datetime.now(timezone.utc) + timedelta(seconds=mute_seconds)
+                )
+                flood_tracker.reset(group_id, user.id)
+                text = f"🔇 {user.mention_html()} 发言过于频繁，已被禁言 {mute_seconds // 60} 分钟。"
+            else:
+                text = f"⚠️ {user.mention_html()} 发言过于频繁，请稍后再发言。"
+            await context.bot.send_message(chat_id=group_id, text=text, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"处理刷屏消息失败: {e}")
+    return True
+
+# 检查群组中的垃圾消息
+async def check_spam(update, context, config):
+    """多个用户发送相同或近似内容、或同一用户短时间内大量发送同一域名的链接时删除相关消息；返回当前消息是否已被删除"""
+    group_id = update.effective_chat.id
+    if not config.get('anti_spam'):
+        return False
+    
+    # 管理员的消息不记录，避免普通用户转述管理员公告时连带删除管理员的原消息
+    if await is_user_admin(context, group_id, update.effective_user.id):
+        return False
+    
+    reason, message_ids = spam_detector.check(
+        group_id,
+        update.effective_user.id,
+        update.message.message_id,
+        update.message.text
+    )
+    if reason is None:
+        return False
+    
+    logger.info(f"群组 {group_id} 检测到垃圾消息（{reason}），删除 {len(message_ids)} 条消息")
+    try:
+        await context.bot.delete_messages(chat_id=group_id, message_ids=message_ids)
+    except Exception as e:
+        logger.error(f"删除垃圾消息失败: {e}")
+        return False
+    return update.message.message_id in message_ids
+
+# 检查群组消息中的违禁词
+async def check_banned_words(update, context):
+    """消息文字或图片、视频等的说明包含违禁词时删除并提醒发送者，管理员不受限制；返回消息是否已被删除"""
+    group_id = update.effective_chat.id
+    text = update.message.text or update.message.caption
+    matcher = banned_word_registry.get(group_id)
+    if not text or matcher is None or not matcher.contains(text):
+        return False
+    if await is_user_admin(context, group_id, update.effective_user.id):
+        return False
+    
+    try:
+        await update.message.delete()
+        await context.bot.send_message(
+            chat_id=group_id,
+            text=f"⚠️ {update.effective_user.mention_html()} 的消息包含违禁词，已被删除。",
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        logger.error(f"删除违禁词消息失败: {e}")
+        return False
+    return True
+
+# 处理群组中的积分相关消息
+async def handle_points_message(update, config):
+    """响应积分别名和排行别名查询，其他发言累计积分；返回消息是否已作为查询处理"""
+    group_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    if not config.get('points_enabled'):
+        return False
+    
+    text = update.message.text.strip()
+    points_alias = config.get('points_alias', '积分')
+    
+    # 查询积分排行
+    if text == config.get('ranking_alias', '积分排行'):
+        ranking = await run_db(get_points_ranking, group_id, 10)
+        ranking_text = f"🏆 {points_alias}排行榜\n\n"
+        if not ranking:
+            ranking_text += "暂无数据。"
+        for i, row in enumerate(ranking, 1):
+            ranking_text += f"{i}. 用户 {row['user_id']}: {row['points']} {points_alias}\n"
+        await update.message.reply_text(ranking_text)
+        return True
+    
+    # 查询自己的积分和名次
+    if text == points_alias:
+        user_rank = await run_db(get_user_rank, group_id, user_id)
+        if user_rank:
+            await update.message.reply_text(
+                f"您当前有 {user_rank['points']} {points_alias}，排名第 {user_rank['rank']}。"
+            )
+        else:
+            await update.message.reply_text(f"您当前还没有{points_alias}。")
+        return True
+    
+    # 普通发言在内存中累计积分，由批量写入任务定时写入数据库
+    message_points_batcher.add(
+        group_id,
+        user_id,
+        len(update.message.text),
+        config.get('message_points', 1),
+        config.get('daily_message_limit', 0),
+        config.get('min_message_length', 0)
+    )
+    return False
+
+# 群组消息的刷屏和违禁词检查
+async def moderate(update, context):
+    """所有类型的群组消息（贴纸、GIF、图片、转发、命令等）先做刷屏和违禁词检查，消息被删除后不再交给后续处理器"""
+    if update.effective_user is None:
+        return
+    config = await get_group_config(update.effective_chat.id)
+    if await check_flood(update, context, config):
+        raise ApplicationHandlerStop
+    if await check_banned_words(update, context):
+        raise ApplicationHandlerStop
+
+# 群组统计
+async def record_stats(update, context):
+    """统计所有类型的群组消息（文字、图片、贴纸、命令等），只在内存中计数，定时写入汇总表"""
+    if update.effective_user:
+        stats_collector.record_message(update.effective_chat.id, update.effective_user.id)
+
 async def echo(update, context):
     # 只在私聊中回复消息
     if update.effective_chat.type == 'private':
         await update.message.reply_text('请使用 /start 命令开始使用机器人')
     # 在群组中，如果消息是"start"，则执行start命令
     elif update.effective_chat.type in ['group', 'supergroup']:
+        # 群组配置读取一次传给各项检查，moderate 已读取过，这里命中缓存
+        config = await get_group_config(update.effective_chat.id)
+        
+        # 垃圾消息检查，消息被删除后不再计积分；刷屏和违禁词检查在 moderate 中先于 echo 执行
+        if update.message.text and update.effective_user:
+            if await check_spam(update, context, config):
+                return
+        
+        # 积分查询和发言积分
+        if update.message.text and not update.message.text.startswith('/') and update.effective_user:
+            if await handle_points_message(update, config):
+                return
+        
+        # 接龙
+        if update.message.text and update.effective_user:
+            if await handle_chain_message(update):
+                return
+        
+        # 自动回复
+        if update.message.text and not update.message.text.startswith('/'):
+            rule = auto_reply_engine.match(update.effective_chat.id, update.message.text)
+            if rule:
+                await update.message.reply_text(rule['reply'])
+                return
+        
         if update.message.text and update.message.text.lower() == 'start':
             await start(update, context)
         # 检查是否是从链接跳转过来的用户的第一条消息
@@ -408,9 +609,12 @@ async def handle_chat_member(update, context):
             chat_title = update.effective_chat.title
             
             for member in update.message.new_chat_members:
+                # 成员状态已变化，清除缓存
+                member_status_cache.invalidate((chat_id, member.id))
+                
                 if member.id == context.bot.id:
                     # 保存群组信息
-                    db_utils.save_group(chat_id, chat_title)
+                    await run_db(db_utils.save_group, chat_id, chat_title)
                     logger.info(f"机器人被添加到群组: {chat_id}")
                     
                     # 自动发送start命令
@@ -419,10 +623,11 @@ async def handle_chat_member(update, context):
         # 检查是否有成员离开
         if update.message and update.message.left_chat_member:
             chat_id = update.effective_chat.id
+            member_status_cache.invalidate((chat_id, update.message.left_chat_member.id))
             
             if update.message.left_chat_member.id == context.bot.id:
                 # 标记群组为非活跃
-                db_utils.mark_group_inactive(chat_id)
+                await run_db(db_utils.mark_group_inactive, chat_id)
                 logger.info(f"机器人被踢出群组: {chat_id}")
                 
                 # 记录详细信息
@@ -434,8 +639,33 @@ async def handle_chat_member(update, context):
         import traceback
         logger.error(f"错误详情: {traceback.format_exc()}")
 
-# 处理机器人成员状态变化
+def is_in_chat(member):
+    """成员当前是否在群组中，受限成员需看 is_member"""
+    if member is None:
+        return False
+    if member.status == 'restricted':
+        return bool(getattr(member, 'is_member', False))
+    return member.status in ('creator', 'administrator', 'member')
+
+# 处理机器人和群成员状态变化
 async def chat_member_status(update, context):
+    # 用最新状态刷新成员状态缓存
+    member_update = update.my_chat_member or update.chat_member
+    if member_update and member_update.new_chat_member:
+        member_status_cache.set(
+            (member_update.chat.id, member_update.new_chat_member.user.id),
+            member_update.new_chat_member.status
+        )
+    
+    # 统计成员加入和离开，只使用 chat_member 更新，避免和入群/退群服务消息重复计数
+    if update.chat_member:
+        was_in_chat = is_in_chat(update.chat_member.old_chat_member)
+        now_in_chat = is_in_chat(update.chat_member.new_chat_member)
+        if now_in_chat and not was_in_chat:
+            stats_collector.record_join(update.chat_member.chat.id)
+        elif was_in_chat and not now_in_chat:
+            stats_collector.record_leave(update.chat_member.chat.id)
+    
     result = update.my_chat_member
     
     if result:
@@ -450,13 +680,13 @@ async def chat_member_status(update, context):
         # 如果机器人被添加到群组或权限被提升为管理员
         if (old_status in ['left', 'kicked', 'restricted'] or old_status == "unknown") and new_status in ['member', 'administrator']:
             # 保存群组信息
-            db_utils.save_group(chat_id, chat_title)
+            await run_db(db_utils.save_group, chat_id, chat_title)
             logger.info(f"机器人被添加到群组或提升为管理员: {chat_id}")
         
         # 如果机器人被踢出群组或权限被降低
         elif old_status in ['member', 'administrator'] and new_status in ['left', 'kicked', 'restricted']:
             # 标记群组为非活跃
-            db_utils.mark_group_inactive(chat_id)
+            await run_db(db_utils.mark_group_inactive, chat_id)
             logger.info(f"机器人被踢出群组或权限被降低: {chat_id}")
 
 async def setup_commands(application):
@@ -505,8 +735,8 @@ async def main():
     # 处理群组成员变化（机器人被踢出或添加到群组）
     application.add_handler(MessageHandler(filters.ChatType.GROUPS & (filters.StatusUpdate.NEW_CHAT_MEMBERS | filters.StatusUpdate.LEFT_CHAT_MEMBER), handle_chat_member))
     
-    # 处理机器人成员状态变化
-    application.add_handler(ChatMemberHandler(chat_member_status, ChatMemberHandler.MY_CHAT_MEMBER))
+    # 处理机器人和群成员状态变化
+    application.add_handler(ChatMemberHandler(chat_member_status, ChatMemberHandler.ANY_CHAT_MEMBER))
     
     # 添加一个特殊处理器，监听用户进入群组的事件
     application.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.StatusUpdate.NEW_CHAT_MEMBERS, handle_user_join))
@@ -516,7 +746,7 @@ async def main():
     # 启动机器人
     await application.initialize()
     await application.start()
-    await application.run_polling()
+    await application.run_polling(allowed_updates=Update.ALL_TYPES)
     print("执行完成")
 
 # 处理用户进入群组的事件
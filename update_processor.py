@@ -0,0 +1,95 @@
+"""
+更新处理器模块，不同聊天的更新并发处理，同一聊天内的更新按收到的顺序依次处理
+"""
+import asyncio
+
+from loguru import logger
+from telegram.ext import BaseUpdateProcessor
+
+from config import UPDATE_CONCURRENCY, CHAT_QUEUE_WARN_DEPTH
+
+
+# 基类的并发上限，实际上限由处理器自己的信号量控制
+_UNBOUNDED = 2 ** 31 - 1
+
+
+class _ChatQueue:
+    """单个聊天的串行队列：lock 保证顺序，depth 为等待中和处理中的更新数"""
+
+    __slots__ = ('lock', 'depth')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """按聊天串行、聊天之间并发的更新处理器
+
+    基类的 process_update 在 do_process_update 之前就占用全局名额，在聊天锁上排队的更新也会占着名额，
+    所以基类的上限设为 _UNBOUNDED，由这里在拿到聊天锁之后再按 max_concurrent_updates 占用名额，
+    积压的聊天不会挡住其他聊天。积压较深的聊天会记录警告。
+    """
+
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY, warn_depth=CHAT_QUEUE_WARN_DEPTH):
+        super().__init__(_UNBOUNDED)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self.warn_depth = warn_depth
+        self._chats = {}
+        self._in_flight = 0
+        self.processed = 0
+
+    @staticmethod
+    def _chat_key(update):
+        if getattr(update, 'effective_chat', None):
+            return update.effective_chat.id
+        if getattr(update, 'effective_user', None):
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = _ChatQueue()
+        chat.depth += 1
+        if chat.depth == self.warn_depth:
+            logger.warning(f"聊天 {key} 待处理更新已达 {chat.depth} 条")
+        try:
+            async with chat.lock:
+                await self._run(coroutine)
+        finally:
+            chat.depth -= 1
+            # 队列清空后立即回收，之后的更新会重新创建
+            if chat.depth == 0 and self._chats.get(key) is chat:
+                del self._chats[key]
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                await coroutine
+            finally:
+                self._in_flight -= 1
+                self.processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        logger.info(f"更新处理器已关闭: {self.stats()}")
+
+    def stats(self):
+        """当前排队的聊天数、积压更新数、最深的聊天队列、处理中的更新数和累计处理数"""
+        depths = [chat.depth for chat in self._chats.values()]
+        return {
+            'chats': len(depths),
+            'queued': sum(depths),
+            'max_depth': max(depths, default=0),
+            'in_flight': self._in_flight,
+            'processed': self.processed,
+        }
@@ -7,6 +7,7 @@ import random
 import string
 from datetime import datetime, timedelta
 from loguru import logger
+from word_filter import BannedWordMatcher, compile_words
 
 # 生成随机字符串
 def generate_random_string(length=8):
@@ -73,12 +74,11 @@ async def get_member_count(bot, chat_id):
 
 # 检查文本是否包含违禁词
 def contains_banned_words(text, banned_words):
-    """检查文本是否包含违禁词"""
+    """检查文本是否包含违禁词，banned_words 可以是违禁词列表或已编译的 BannedWordMatcher"""
     if not text or not banned_words:
         return False
     
-    text = text.lower()
-    for word in banned_words:
-        if word.lower() in text:
-            return True
-    return False 
\ No newline at end of file
+    # 列表按内容缓存编译结果，同一份列表只构建一次自动机
+    if not isinstance(banned_words, BannedWordMatcher):
+        banned_words = compile_words(tuple(banned_words))
+    return banned_words.contains(text) 
\ No newline at end of file
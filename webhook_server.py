@@ -0,0 +1,134 @@
+"""
+Webhook 服务模块，在同一个本地 HTTP 服务上按密钥路径接收多个机器人的更新
+"""
+import asyncio
+import hashlib
+import secrets
+import time
+from collections import deque
+
+from aiohttp import web
+from loguru import logger
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from config import (
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_MAX_BODY_SIZE
+)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def webhook_path(token):
+    """根据机器人 Token 生成 webhook 路径，路径中不直接暴露 Token"""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+class LatencyStats:
+    """统计从收到 webhook 请求到处理器开始处理更新的耗时"""
+
+    MAX_PENDING = 10000
+
+    def __init__(self, sample_size=1000):
+        self._pending = {}
+        self._samples = deque(maxlen=sample_size)
+
+    def received(self, key):
+        if len(self._pending) >= self.MAX_PENDING:
+            self._pending.clear()
+        self._pending[key] = time.perf_counter()
+
+    def handled(self, key):
+        started = self._pending.pop(key, None)
+        if started is not None:
+            self._samples.append(time.perf_counter() - started)
+
+    def stats(self):
+        """最近样本的平均值和分位数（毫秒）"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {'count': 0}
+        return {
+            'count': len(samples),
+            'avg_ms': sum(samples) / len(samples) * 1000,
+            'p50_ms': samples[len(samples) // 2] * 1000,
+            'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        }
+
+
+class WebhookServer:
+    """多个机器人共用的 webhook 服务，按路径把更新放入对应机器人的更新队列"""
+
+    def __init__(self, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, secret_token=WEBHOOK_SECRET_TOKEN,
+                 max_connections=WEBHOOK_MAX_CONNECTIONS, max_body_size=WEBHOOK_MAX_BODY_SIZE):
+        self.listen = listen
+        self.port = port
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.max_connections = max_connections
+        self.max_body_size = max_body_size
+        self.latency = LatencyStats()
+        self._targets = {}
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self._runner = None
+
+    def add_application(self, application, token, allowed_updates=None):
+        """注册一个 Application，返回它的 webhook 路径"""
+        path = self.add_queue(application.bot, application.update_queue, token, allowed_updates)
+        # 在最先执行的处理器组中记录处理耗时，不与 lifecycle 共用一组，之后的组停止传播时也能记录
+        application.add_handler(TypeHandler(Update, self._on_update), group=-21)
+        return path
+
+    def add_queue(self, bot, update_queue, token, allowed_updates=None):
+        """注册一个机器人，收到的更新放入 update_queue（队列有上限时请求会等待，形成反压），返回 webhook 路径"""
+        path = webhook_path(token)
+        self._targets[path] = (bot, update_queue, allowed_updates)
+        return path
+
+    async def _on_update(self, update, context):
+        self.latency.handled((context.bot.id, update.update_id))
+
+    async def _handle(self, request):
+        target = self._targets.get(request.match_info['path'])
+        if target is None:
+            raise web.HTTPNotFound()
+        if not secrets.compare_digest(request.headers.get(SECRET_TOKEN_HEADER, ''), self.secret_token):
+            raise web.HTTPForbidden()
+
+        bot, update_queue, _ = target
+        async with self._semaphore:
+            try:
+                data = await request.json()
+            except ValueError:
+                raise web.HTTPBadRequest()
+            update = Update.de_json(data, bot)
+            self.latency.received((bot.id, update.update_id))
+            await update_queue.put(update)
+        return web.Response()
+
+    async def start(self):
+        """启动 HTTP 服务"""
+        app = web.Application(client_max_size=self.max_body_size)
+        app.router.add_post('/{path}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Webhook 服务已启动: {self.listen}:{self.port}")
+
+    async def set_webhooks(self, base_url):
+        """向 Telegram 注册所有机器人的 webhook 地址"""
+        for path, (bot, _, allowed_updates) in self._targets.items():
+            await bot.set_webhook(
+                url=f"{base_url.rstrip('/')}/{path}",
+                secret_token=self.secret_token,
+                max_connections=max(1, min(self.max_connections, 100)),
+                allowed_updates=allowed_updates
+            )
+            logger.info(f"已设置 webhook: @{bot.username}")
+
+    async def stop(self):
+        """停止 HTTP 服务，已接收的更新仍在各 Application 的队列中等待处理"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info(f"Webhook 服务已停止，处理延迟统计: {self.latency.stats()}")
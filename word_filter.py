@@ -0,0 +1,148 @@
+"""
+违禁词匹配模块，使用 Aho–Corasick 自动机一次扫描找出文本中的全部违禁词
+"""
+import threading
+import unicodedata
+from collections import deque
+from functools import lru_cache
+
+# 匹配前直接去掉的零宽字符，常被用来拆开违禁词
+_ZERO_WIDTH = frozenset('\u200b\u200c\u200d\u2060\ufeff')
+
+
+@lru_cache(maxsize=65536)
+def _fold_char(char):
+    """单个字符的规范化结果：NFKC（全角转半角等）后再做 Unicode 大小写折叠"""
+    if char in _ZERO_WIDTH:
+        return ''
+    return unicodedata.normalize('NFKC', char).casefold()
+
+
+def normalize(text):
+    """规范化文本，返回 (规范化后的文本, 每个字符对应的原文下标)"""
+    if text.isascii():
+        return text.lower(), None
+    chars = []
+    positions = []
+    for index, char in enumerate(text):
+        folded = _fold_char(char)
+        chars.append(folded)
+        positions.extend([index] * len(folded))
+    return ''.join(chars), positions
+
+
+class BannedWordMatcher:
+    """编译后的违禁词自动机，构建后只读，可在多个协程和线程间共享"""
+
+    def __init__(self, words):
+        self.words = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        seen = set()
+        for word in words:
+            pattern = normalize(word.strip())[0] if word else ''
+            if not pattern or pattern in seen:
+                continue
+            seen.add(pattern)
+            self._add(pattern, len(self.words))
+            self.words.append(word.strip())
+        self._build()
+
+    def __len__(self):
+        return len(self.words)
+
+    def _add(self, pattern, word_index):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = self._output[state] + ((word_index, len(pattern)),)
+
+    def _build(self):
+        # 按广度优先计算失败指针，并把失败状态的输出合并到当前状态
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                # 根节点的子节点失败指针指向根节点
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _scan(self, text):
+        normalized, positions = normalize(text)
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for end, char in enumerate(normalized):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for word_index, length in output[state]:
+                    start = end - length + 1
+                    if positions is None:
+                        yield start, end + 1, self.words[word_index]
+                    else:
+                        yield positions[start], positions[end] + 1, self.words[word_index]
+
+    def search(self, text):
+        """返回文本中全部违禁词的位置 [(开始, 结束, 违禁词)]，位置为原文下标"""
+        if not text or not self.words:
+            return []
+        return list(self._scan(text))
+
+    def contains(self, text):
+        """文本是否包含违禁词，找到第一个即返回"""
+        if not text or not self.words:
+            return False
+        for _ in self._scan(text):
+            return True
+        return False
+
+
+class MatcherRegistry:
+    """每个群组一个已编译的匹配器，违禁词变化时重新编译并整体替换"""
+
+    def __init__(self):
+        self._matchers = {}
+        self._lock = threading.Lock()
+
+    def get(self, group_id):
+        """获取群组的匹配器，没有违禁词时返回 None"""
+        return self._matchers.get(int(group_id))
+
+    def set(self, group_id, words):
+        """用新的违禁词列表替换群组的匹配器（编译在锁外进行，替换是原子的）"""
+        matcher = BannedWordMatcher(words)
+        with self._lock:
+            if matcher.words:
+                self._matchers[int(group_id)] = matcher
+            else:
+                self._matchers.pop(int(group_id), None)
+        return matcher
+
+    def remove(self, group_id):
+        with self._lock:
+            self._matchers.pop(int(group_id), None)
+
+
+# 全局违禁词匹配器，同一进程内的两个机器人共用
+banned_word_registry = MatcherRegistry()
+
+
+@lru_cache(maxsize=128)
+def compile_words(words):
+    """编译违禁词元组，相同的列表只编译一次"""
+    return BannedWordMatcher(words)